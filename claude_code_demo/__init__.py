@@ -6,6 +6,11 @@ from .config import (  # noqa: F401
     TokenConfig,
     TodoConfig,
     HumanLoopConfig,
+    FileToolConfig,
+    ToolOutputConfig,
+    ToolExecutionConfig,
+    SandboxConfig,
+    RepoMapConfig,
     SubAgentConfig,
     CheckpointConfig,
     get_default_config,
@@ -18,6 +23,11 @@ __all__ = [
     "TokenConfig",
     "TodoConfig",
     "HumanLoopConfig",
+    "FileToolConfig",
+    "ToolOutputConfig",
+    "ToolExecutionConfig",
+    "SandboxConfig",
+    "RepoMapConfig",
     "SubAgentConfig",
     "CheckpointConfig",
     "get_default_config",
@@ -7,6 +7,14 @@ from dataclasses import dataclass
 from typing import Literal
 
 
+def _default_cache_dir() -> str:
+    """默认缓存目录，可通过 CLAUDE_CODE_DEMO_CACHE_DIR 覆盖"""
+    return os.getenv(
+        "CLAUDE_CODE_DEMO_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "claude_code_demo")
+    )
+
+
 @dataclass
 class LLMConfig:
     """LLM 配置"""
@@ -28,7 +36,17 @@ class TokenConfig:
     """Token 管理配置"""
     max_context_tokens: int = 100000  # 最大上下文 token
     compression_threshold: float = 0.92  # 压缩阈值 92%
+    speculative_compression_threshold: float = 0.75  # 超过该水位时在后台预先生成摘要，None 表示关闭
     reserved_output_tokens: int = 4096  # 预留输出 token
+    tokenizer: Literal["estimate", "bpe"] = "estimate"  # 估算 token 的分词器
+    bpe_file: str = None  # tokenizer 为 bpe 时使用的本地词表（tiktoken 格式），运行时不下载
+    script_ratios: dict = None  # 估算器中各类字符每 token 的字符数，None 表示默认值
+    record_usage_samples: bool = False  # 记录每次调用的估算值和真实 usage，供校准命令使用（需要校准时开启）
+    usage_samples_file: str = None  # 记录文件，None 表示缓存目录下的 token_usage_samples.jsonl
+
+    def __post_init__(self):
+        if self.usage_samples_file is None:
+            self.usage_samples_file = os.path.join(_default_cache_dir(), "token_usage_samples.jsonl")
 
     @property
     def trigger_compression_tokens(self) -> int:
@@ -62,6 +80,90 @@ class HumanLoopConfig:
             self.review_tool_names = ["Read", "Write", "Edit"]
 
 
+@dataclass
+class FileToolConfig:
+    """文件工具配置"""
+    enable_search_index: bool = True  # search_in_files 使用持久化三元组索引
+    cache_dir: str = None  # 索引等缓存的存储目录
+    search_max_workers: int = None  # 并行扫描线程数，None 表示按 CPU 核数决定
+    search_max_matches: int = 2000  # 单次搜索最多返回的匹配行数
+    search_max_bytes: int = 256 * 1024  # 单次搜索结果的最大字节数
+    ignore_patterns: list = None  # 按名称忽略的文件/目录，None 表示使用默认列表
+    respect_gitignore: bool = True  # 遍历目录时遵守 .gitignore
+    read_default_limit: int = 2000  # read_file 未指定 limit 时最多返回的行数（截断时提示剩余行数和下一个 offset）
+    list_page_size: int = 500  # list_directory 每页最多返回的条目数
+    list_default_depth: int = 3  # list_directory 递归模式的默认深度
+    symbol_index_max_workers: int = None  # 符号索引的解析进程数，None 表示按 CPU 核数决定
+    content_cache_max_bytes: int = 64 * 1024 * 1024  # 进程内共享文件内容缓存的大小上限
+    enable_workspace_snapshot: bool = False  # 维护内存中的工作区快照（inotify 更新，不可用时轮询）
+    workspace_root: str = None  # 快照覆盖的工作区根目录，None 表示当前目录
+    snapshot_poll_interval: float = 2.0  # 轮询模式下的扫描间隔（秒）
+    io_max_workers: int = 8  # 异步调用文件工具时使用的 I/O 线程数
+
+    def __post_init__(self):
+        if self.cache_dir is None:
+            self.cache_dir = _default_cache_dir()
+
+
+@dataclass
+class ToolOutputConfig:
+    """工具输出配置"""
+    enabled: bool = True  # 过大的工具输出是否转存到磁盘
+    spill_threshold_chars: int = 20000  # 超过该字符数的输出会被转存
+    preview_chars: int = 2000  # 转存后消息中保留的预览字符数
+    blob_dir: str = None  # 转存目录，None 表示缓存目录下的 tool_outputs
+    max_store_mb: int = 512  # 转存内容的总大小上限（MB），超过时淘汰最久未使用的输出，None 表示不限制
+
+    def __post_init__(self):
+        if self.blob_dir is None:
+            self.blob_dir = os.path.join(_default_cache_dir(), "tool_outputs")
+
+
+@dataclass
+class ToolExecutionConfig:
+    """工具执行配置"""
+    max_concurrency: int = 8  # 同一轮中同时执行的工具调用数上限（只读调用并发，修改同一路径的调用串行）
+    # 超时只对只读工具和可取消的异步工具（task_tool、沙箱中的工具）生效：
+    # I/O 线程无法被强制结束，write_file、edit_file、apply_patch 超时后仍会继续写入，为它们配置超时会在构建图时报错
+    default_timeout: float = 300.0  # 工具调用的默认超时（秒），None 表示不限制
+    tool_timeouts: dict = None  # 按工具名称覆盖超时，值为 None 表示该工具不限制
+
+    def __post_init__(self):
+        if self.tool_timeouts is None:
+            self.tool_timeouts = {
+                "task_tool": 1800.0,  # SubAgent 会执行多轮工具调用
+                "ask_human": None,  # 等待用户输入
+            }
+
+    def get_timeout(self, tool_name: str):
+        """获取工具的超时（秒），None 表示不限制"""
+        return self.tool_timeouts.get(tool_name, self.default_timeout)
+
+
+@dataclass
+class SandboxConfig:
+    """沙箱执行配置"""
+    enabled: bool = False  # 是否将选定的工具放到预热的进程池中执行
+    tools: list = None  # 在沙箱中执行的工具名称，None 表示使用默认列表
+    max_workers: int = None  # 工作进程数，None 表示按 CPU 核数决定
+    cpu_seconds: float = 30.0  # 每个任务的 CPU 时间上限（秒），None 表示不限制
+    memory_mb: int = 1024  # 每个任务允许新增的内存（MB），None 表示不限制
+
+    def __post_init__(self):
+        if self.tools is None:
+            # CPU 密集的搜索和解析工具
+            self.tools = ["search_in_files", "rank_search", "find_symbol", "get_symbol_source"]
+
+
+@dataclass
+class RepoMapConfig:
+    """仓库地图配置"""
+    enabled: bool = False  # 是否在系统提示词中附加仓库地图
+    root: str = None  # 工作区根目录，None 表示当前目录
+    token_budget: int = 1024  # 仓库地图的 token 预算
+    refresh_interval: float = 5.0  # 未启用工作区快照时检查文件变化的最小间隔（秒）
+
+
 @dataclass
 class CheckpointConfig:
     """检查点配置"""
@@ -78,6 +180,11 @@ class ClaudeCodeConfig:
     subagent: list = None  # List[SubAgentConfig]
     todo: TodoConfig = None
     human_loop: HumanLoopConfig = None
+    file_tools: FileToolConfig = None
+    tool_output: ToolOutputConfig = None
+    tool_execution: ToolExecutionConfig = None
+    sandbox: SandboxConfig = None
+    repo_map: RepoMapConfig = None
     checkpoint: CheckpointConfig = None
 
     # 调试选项
@@ -94,6 +201,16 @@ class ClaudeCodeConfig:
             self.todo = TodoConfig()
         if self.human_loop is None:
             self.human_loop = HumanLoopConfig()
+        if self.file_tools is None:
+            self.file_tools = FileToolConfig()
+        if self.tool_output is None:
+            self.tool_output = ToolOutputConfig()
+        if self.tool_execution is None:
+            self.tool_execution = ToolExecutionConfig()
+        if self.sandbox is None:
+            self.sandbox = SandboxConfig()
+        if self.repo_map is None:
+            self.repo_map = RepoMapConfig()
         if self.checkpoint is None:
             self.checkpoint = CheckpointConfig()
         if self.subagent is None:
@@ -123,7 +240,10 @@ class ClaudeCodeConfig:
 - Performance bottleneck identification and solutions
 - Security vulnerability detection and fix suggestions
 Please provide specific, actionable technical recommendations""",
-                allowed_tools=["read_file", "search_in_files", "list_directory"]
+                allowed_tools=[
+                    "read_file", "search_in_files", "list_directory", "find_files",
+                    "find_symbol", "get_symbol_source"
+                ]
             ),
             SubAgentConfig(
                 type="document-writer",
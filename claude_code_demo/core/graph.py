@@ -2,28 +2,42 @@
 图构建模块
 整合所有组件构建完整的 Agent 图
 """
+import os
+from dataclasses import replace
 from typing import Literal
 from langgraph.graph import StateGraph, END, START
 from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import ToolNode
 from langgraph.types import interrupt
 from langchain_core.messages import ToolMessage
 
-from core.state import AgentState
+from core.state import AgentState, token_ledger_delta
 from config import ClaudeCodeConfig
-from tools.base_tools import get_base_tools
+from tools.base_tools import get_base_tools, configure_base_tools
+from tools.patch_tool import get_patch_tools
+from tools.rank_search_tool import get_rank_search_tools
+from tools.symbol_tools import get_symbol_tools
 from tools.todo_tools import get_todo_tools
+from tools.tool_output_tool import get_tool_output_tools, configure_tool_output
 from tools.human_loop_tool import get_human_loop_tools
 from tools.task_tool import create_task_tool
 from nodes.agent_node import create_agent_node
 from nodes.compression_node import create_compression_node
+from nodes.tool_node import check_tool_timeouts, create_tool_node
+from prompts.system_prompts import get_main_system_prompt
 from utils.compression import CompressionManager
+from utils.patch import summarize_patch
+from utils.repo_map import get_repo_map
+from utils.sandbox import apply_sandbox, configure_sandbox
+from utils.token_calibration import configure_usage_recording
+from utils.token_counter import RequestSizer
+from utils.tokenizer import configure_tokenizer
 
 
 # 需要人工确认的工具列表
 TOOLS_REQUIRING_APPROVAL = [
     "write_file",
     "edit_file",
+    "apply_patch",
     # 可以根据需要添加其他敏感工具
 ]
 
@@ -82,7 +96,11 @@ def approval_node(state: AgentState) -> dict:
     # 构建确认信息
     tool_descriptions = []
     for tc in tool_calls:
-        if tc["name"] in TOOLS_REQUIRING_APPROVAL:
+        if tc["name"] == "apply_patch":
+            # 整个补丁只需一次确认，列出涉及的所有文件
+            summary = summarize_patch(tc["args"].get("patch", ""))
+            tool_descriptions.append(f"  - apply_patch({summary})")
+        elif tc["name"] in TOOLS_REQUIRING_APPROVAL:
             args_str = ", ".join(
                 f"{k}={repr(v)[:50]}" for k, v in tc["args"].items()
             )
@@ -123,7 +141,10 @@ def approval_node(state: AgentState) -> dict:
                 for tc in tool_calls
                 if tc["name"] in TOOLS_REQUIRING_APPROVAL
             ]
-            return {"messages": rejection_messages}
+            return {
+                "messages": rejection_messages,
+                "token_ledger": token_ledger_delta(rejection_messages)
+            }
 
     # 用户同意或默认同意，不修改状态，继续执行
     return {}
@@ -140,8 +161,15 @@ def build_graph(config: ClaudeCodeConfig, llm) -> StateGraph:
     Returns:
         编译后的图
     """
-    # 1. 准备工具
-    base_tools = get_base_tools()
+    # 1. 准备分词器和工具
+    configure_tokenizer(config.token)
+    configure_usage_recording(config.token)
+    configure_base_tools(config.file_tools)
+    configure_tool_output(config.tool_output)
+    base_tools = (
+        get_base_tools() + get_patch_tools() + get_symbol_tools()
+        + get_rank_search_tools() + get_tool_output_tools()
+    )
     todo_tools = get_todo_tools()
     human_loop_tools = get_human_loop_tools()
 
@@ -155,22 +183,60 @@ def build_graph(config: ClaudeCodeConfig, llm) -> StateGraph:
     # 所有工具
     all_tools = base_tools + todo_tools + human_loop_tools + [task_tool]
 
+    # 选定的工具在沙箱进程池中执行（工作进程使用相同的文件工具配置，但不启动工作区快照）
+    configure_sandbox(
+        config.sandbox,
+        initializers=[(
+            "tools.base_tools", "configure_base_tools",
+            (replace(config.file_tools, enable_workspace_snapshot=False),)
+        )]
+    )
+    apply_sandbox(all_tools, config.sandbox.tools if config.sandbox.enabled else [])
+
     # 2. 创建节点
-    agent_node = create_agent_node(llm, all_tools)
+    repo_map = None
+    if config.repo_map.enabled:
+        repo_map = get_repo_map(
+            config.repo_map.root or os.getcwd(),
+            config.file_tools.cache_dir,
+            config.repo_map.token_budget,
+            refresh_interval=config.repo_map.refresh_interval,
+            ignore_patterns=config.file_tools.ignore_patterns,
+            respect_gitignore=config.file_tools.respect_gitignore,
+            max_workers=config.file_tools.symbol_index_max_workers
+        )
 
-    # 直接使用 ToolNode，不使用包装器
-    # 注意：人工确认功能暂时禁用，可以通过其他方式实现
-    tool_node = ToolNode(all_tools)
-    # tool_node = create_tool_node(all_tools)
+    # 请求大小估算器：工具定义只计数一次，系统提示词由 Agent 节点每次调用前更新
+    request_sizer = RequestSizer(all_tools, get_main_system_prompt())
 
-    # 创建压缩管理器和节点
+    # 创建压缩管理器和节点（超过预生成水位后在后台准备摘要，达到阈值时直接换入）
     compression_manager = CompressionManager(
         llm,
         max_tokens=config.token.max_context_tokens,
-        threshold=config.token.compression_threshold
+        threshold=config.token.compression_threshold,
+        sizer=request_sizer,
+        speculative_threshold=config.token.speculative_compression_threshold
     )
     compression_node = create_compression_node(compression_manager)
 
+    # Agent 节点发送前检查请求大小，超出上下文时截断新的工具输出或立即压缩
+    agent_node = create_agent_node(
+        llm,
+        all_tools,
+        repo_map,
+        request_sizer,
+        compression_manager,
+        max_request_tokens=config.token.max_context_tokens - config.token.reserved_output_tokens
+    )
+
+    # 工具节点：按读写冲突并发执行工具调用并限制超时，过大的输出转存到磁盘，消息中只保留预览和句柄
+    check_tool_timeouts(all_tools, config.tool_execution.tool_timeouts)
+    tool_node = create_tool_node(
+        all_tools,
+        config.tool_execution.max_concurrency,
+        config.tool_execution.get_timeout
+    )
+
     # 3. 构建图
     workflow = StateGraph(AgentState)
 
@@ -2,11 +2,13 @@
 状态定义模块
 定义 Agent 的状态结构
 """
-from typing import Annotated, List, Literal, Optional
+from typing import Annotated, Dict, List, Literal, Optional, Sequence, Union
 import uuid
 from pydantic import BaseModel, Field
-from langchain_core.messages import BaseMessage
-from langgraph.graph.message import add_messages
+from langchain_core.messages import BaseMessage, RemoveMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES, add_messages
+
+from utils.token_counter import estimate_message_tokens
 
 
 class TodoItem(BaseModel):
@@ -42,6 +44,47 @@ class CompressionRecord(BaseModel):
     removed_messages_count: int
 
 
+class TokenLedger(BaseModel):
+    """Token 账本 - 按消息 ID 缓存每条消息的估算 Token 数
+
+    关键优势：
+    - 总数随消息的增删增量更新，阈值检查不再扫描全部消息
+    - 作为状态字段保存，检查点恢复后无需重新计算
+    """
+    counts: Dict[str, int] = Field(default_factory=dict)
+    total: int = 0
+
+
+def merge_token_ledger(
+    left: Union[TokenLedger, dict, None],
+    right: Union[TokenLedger, dict, None]
+) -> TokenLedger:
+    """Token 账本的 Reducer
+
+    right 为 TokenLedger 时整体替换；为 token_ledger_delta() 生成的增量时，
+    按 add_messages 的语义应用：reset 对应删除全部消息，changes 中的值为 None 表示删除该消息。
+    """
+    if isinstance(left, dict):
+        left = TokenLedger(**left)
+    if left is None:
+        left = TokenLedger()
+    if right is None:
+        return left
+    if isinstance(right, TokenLedger):
+        return right
+    if "counts" in right:
+        return TokenLedger(**right)
+
+    counts = {} if right.get("reset") else dict(left.counts)
+    total = 0 if right.get("reset") else left.total
+    for msg_id, tokens in right.get("changes", {}).items():
+        total -= counts.pop(msg_id, 0)
+        if tokens is not None:
+            counts[msg_id] = tokens
+            total += tokens
+    return TokenLedger(counts=counts, total=total)
+
+
 class AgentState(BaseModel):
     """Agent 状态 - 使用 Pydantic 模型
 
@@ -51,6 +94,7 @@ class AgentState(BaseModel):
     - compression_history: 压缩历史记录
     - current_tokens: 当前 token 使用量
     - needs_compression: 是否需要压缩
+    - token_ledger: 每条消息的估算 Token 数及总数
     - human_review_pending: 是否等待人工审查
 
     关键优势：
@@ -67,6 +111,7 @@ class AgentState(BaseModel):
     compression_history: List[CompressionRecord] = Field(default_factory=list)
     current_tokens: int = 0
     needs_compression: bool = False
+    token_ledger: Annotated[TokenLedger, merge_token_ledger] = Field(default_factory=TokenLedger)
 
     # 人机协同状态
     human_review_pending: bool = False
@@ -95,7 +140,51 @@ def create_initial_state() -> dict:
 
 def add_message_to_state(state: AgentState, message: BaseMessage) -> dict:
     """添加消息到状态 - 返回更新字典供 LangGraph 使用"""
-    return {"messages": [message]}
+    return {"messages": [message], "token_ledger": token_ledger_delta([message])}
+
+
+def token_ledger_delta(messages: Sequence[BaseMessage]) -> dict:
+    """根据节点返回的消息生成 Token 账本增量 - 与 messages 一起返回供 LangGraph 使用
+
+    没有 ID 的消息会在这里分配 ID（与 add_messages 的做法相同），保证账本与消息一一对应。
+    """
+    delta = {"reset": False, "changes": {}}
+    for msg in messages:
+        if not isinstance(msg, BaseMessage):
+            # 字典形式的消息在 add_messages 中才转换，留给 reconcile_token_ledger 补记
+            continue
+        if isinstance(msg, RemoveMessage):
+            if msg.id == REMOVE_ALL_MESSAGES:
+                delta = {"reset": True, "changes": {}}
+            else:
+                delta["changes"][msg.id] = None
+            continue
+        if msg.id is None:
+            msg.id = str(uuid.uuid4())
+        delta["changes"][msg.id] = estimate_message_tokens(msg)
+    return delta
+
+
+def reconcile_token_ledger(state: AgentState) -> Optional[dict]:
+    """校对 Token 账本与消息列表 - 不一致时返回增量，一致时返回 None
+
+    节点返回的消息都带有账本增量，只有图的输入（如用户消息）或 update_state
+    修改的消息不在账本中：先做 O(1) 的数量和末尾消息检查，不一致时才逐条比对 ID，
+    且只为账本中没有的消息估算 Token。
+    """
+    ledger = state.token_ledger
+    messages = state.messages
+    if len(ledger.counts) == len(messages) and (not messages or messages[-1].id in ledger.counts):
+        return None
+
+    current_ids = {msg.id for msg in messages}
+    changes = {
+        msg.id: estimate_message_tokens(msg)
+        for msg in messages
+        if msg.id not in ledger.counts
+    }
+    changes.update({msg_id: None for msg_id in ledger.counts if msg_id not in current_ids})
+    return {"reset": False, "changes": changes}
 
 
 def update_todo_list(state: AgentState, todo_list: List[TodoItem]) -> dict:
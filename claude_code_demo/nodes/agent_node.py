@@ -2,12 +2,71 @@
 Agent 节点
 实现主 Agent 的调用逻辑
 """
-from langchain_core.messages import SystemMessage
-from core.state import AgentState
+from typing import Optional, Sequence
+
+from langchain_core.messages import BaseMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from core.state import AgentState, reconcile_token_ledger, token_ledger_delta
+from nodes.compression_node import compression_update
 from prompts.system_prompts import get_main_system_prompt
+from tools.tool_output_tool import truncate_tool_message
+from utils.async_io import run_io
+from utils.compression import CompressionManager
+from utils.repo_map import RepoMap
+from utils.token_calibration import record_usage_sample
+from utils.token_counter import RequestSizer, estimate_message_tokens, get_usage_anchor
+
+
+async def truncate_tool_outputs(
+    messages: Sequence[BaseMessage],
+    projected: int,
+    budget: int
+) -> tuple[list[BaseMessage], list[BaseMessage], int]:
+    """
+    把模型尚未看到的工具输出从大到小截断为预览，直到请求不超过预算
 
+    Args:
+        messages: 消息列表
+        projected: 当前估算的请求大小
+        budget: 请求大小上限
+
+    Returns:
+        (新的消息列表, 被截断的消息, 截断后的估算请求大小)
+    """
+    anchor_index, _ = get_usage_anchor(messages)
+    candidates = sorted(
+        (
+            i for i in range(anchor_index + 1, len(messages))
+            if isinstance(messages[i], ToolMessage) and isinstance(messages[i].content, str)
+        ),
+        key=lambda i: len(messages[i].content),
+        reverse=True
+    )
 
-async def agent_node(state: AgentState, llm, tools: list) -> dict:
+    messages = list(messages)
+    truncated = []
+    for i in candidates:
+        if projected <= budget:
+            break
+        new_msg = await run_io(truncate_tool_message, messages[i])
+        if new_msg is messages[i]:
+            continue
+        projected -= estimate_message_tokens(messages[i]) - estimate_message_tokens(new_msg)
+        messages[i] = new_msg
+        truncated.append(new_msg)
+    return messages, truncated, projected
+
+
+async def agent_node(
+    state: AgentState,
+    llm,
+    tools: list,
+    repo_map: RepoMap = None,
+    sizer: RequestSizer = None,
+    compression_manager: Optional[CompressionManager] = None,
+    max_request_tokens: Optional[int] = None,
+    config: RunnableConfig = None
+) -> dict:
     """
     Agent 节点：调用 LLM 生成响应
 
@@ -15,6 +74,11 @@ async def agent_node(state: AgentState, llm, tools: list) -> dict:
         state: 当前状态（Pydantic 实例）
         llm: 语言模型
         tools: 工具列表
+        repo_map: 仓库地图，提供时附加到系统提示词
+        sizer: 请求大小估算器，提供时同步当前的系统提示词并在发送前检查请求大小
+        compression_manager: 压缩管理器，截断工具输出后请求仍超出预算时用于立即压缩
+        max_request_tokens: 请求大小上限（上下文长度减去预留输出），None 表示不检查
+        config: 运行配置（压缩时按其中的 thread_id 使用后台预先生成的摘要）
 
     Returns:
         更新的状态
@@ -23,8 +87,41 @@ async def agent_node(state: AgentState, llm, tools: list) -> dict:
     messages = state.messages
     todo_count = len(state.todo_list)
 
+    # 仓库地图未变化时直接返回缓存；需要重建时在 I/O 线程池中执行
+    repo_map_text = None
+    if repo_map is not None:
+        try:
+            repo_map_text = await run_io(repo_map.render)
+        except Exception:
+            repo_map_text = None
+
     # 构建系统提示词
-    system_prompt = get_main_system_prompt(todo_count)
+    system_prompt = get_main_system_prompt(todo_count, repo_map_text)
+    if sizer is not None:
+        sizer.set_system_prompt(system_prompt)
+
+    # 发送前检查请求大小：上一次响应之后新增的工具输出可能让这次请求超出上下文，
+    # 先截断这些输出，仍超出时立即压缩，避免一次注定失败的调用
+    update_messages = []
+    compression = None
+    if sizer is not None and max_request_tokens:
+        ledger_total = state.token_ledger.total if reconcile_token_ledger(state) is None else None
+        projected = sizer.estimate(messages, ledger_total)
+        if projected > max_request_tokens:
+            print(f"⚠️ Request would be ~{projected} tokens (limit {max_request_tokens}); shrinking before sending")
+            messages, update_messages, projected = await truncate_tool_outputs(
+                messages, projected, max_request_tokens
+            )
+        if projected > max_request_tokens and compression_manager is not None:
+            compressed, new_messages, stats = await compression_manager.compress(
+                messages, (config or {}).get("configurable", {}).get("thread_id")
+            )
+            if compressed:
+                messages = new_messages
+                compression = compression_update(state, new_messages, stats)
+                projected = sizer.estimate(messages)
+        if projected > max_request_tokens:
+            print(f"⚠️ Request is still ~{projected} tokens after shrinking; sending anyway")
 
     # 准备消息列表
     input_messages = list(messages)  # 转换为列表以便修改
@@ -43,21 +140,48 @@ async def agent_node(state: AgentState, llm, tools: list) -> dict:
     # 调用 LLM（简化版本：直接使用 ainvoke）
     response = await llm_with_tools.ainvoke(input_messages)
 
-    return {"messages": [response]}
-
-
-def create_agent_node(llm, tools: list):
+    # 记录估算值与真实 usage，供 python -m utils.token_calibration 校准
+    await run_io(record_usage_sample, input_messages, response)
+
+    if compression is not None:
+        # 压缩后的消息替换全部消息，再追加本次响应
+        return {
+            **compression,
+            "messages": compression["messages"] + [response],
+            "token_ledger": token_ledger_delta(compression["messages"] + [response]),
+            "needs_compression": False
+        }
+
+    # 被截断的工具输出按 ID 替换状态中的原消息
+    new_messages = update_messages + [response]
+    return {"messages": new_messages, "token_ledger": token_ledger_delta(new_messages)}
+
+
+def create_agent_node(
+    llm,
+    tools: list,
+    repo_map: RepoMap = None,
+    sizer: RequestSizer = None,
+    compression_manager: Optional[CompressionManager] = None,
+    max_request_tokens: Optional[int] = None
+):
     """
     创建 Agent 节点函数
 
     Args:
         llm: 语言模型
         tools: 工具列表
+        repo_map: 仓库地图，可选
+        sizer: 请求大小估算器，可选（与压缩管理器共享）
+        compression_manager: 压缩管理器，可选
+        max_request_tokens: 请求大小上限，可选
 
     Returns:
         Agent 节点函数
     """
-    async def node(state: AgentState) -> dict:
-        return await agent_node(state, llm, tools)
+    async def node(state: AgentState, config: RunnableConfig) -> dict:
+        return await agent_node(
+            state, llm, tools, repo_map, sizer, compression_manager, max_request_tokens, config
+        )
 
     return node
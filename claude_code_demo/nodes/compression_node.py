@@ -3,13 +3,24 @@
 实现上下文压缩逻辑
 """
 from datetime import datetime
-from core.state import AgentState, CompressionRecord
+from langchain_core.messages import RemoveMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from core.state import (
+    AgentState,
+    CompressionRecord,
+    merge_token_ledger,
+    reconcile_token_ledger,
+    token_ledger_delta
+)
 from utils.compression import CompressionManager
 
 
 async def compression_node(
     state: AgentState,
-    compression_manager: CompressionManager
+    compression_manager: CompressionManager,
+    config: RunnableConfig = None
 ) -> dict:
     """
     压缩节点：检查并执行上下文压缩
@@ -17,6 +28,7 @@ async def compression_node(
     Args:
         state: 当前状态（Pydantic 实例）
         compression_manager: 压缩管理器
+        config: 运行配置（按其中的 thread_id 区分不同会话的后台摘要）
 
     Returns:
         更新的状态
@@ -24,15 +36,41 @@ async def compression_node(
     # 使用属性访问而不是字典访问
     messages = state.messages
 
+    # 补记不在 Token 账本中的消息（如用户输入），账本一致时为 O(1)
+    ledger_delta = reconcile_token_ledger(state)
+    ledger = state.token_ledger
+    if ledger_delta is not None:
+        ledger = merge_token_ledger(ledger, ledger_delta)
+
     # 检查是否需要压缩
     compressed, new_messages, stats = await compression_manager.compress_if_needed(
-        messages
+        messages,
+        estimated_tokens=ledger.total,
+        thread_id=(config or {}).get("configurable", {}).get("thread_id")
     )
 
     if not compressed:
-        # 不需要压缩，返回空更新
-        return {}
+        # 不需要压缩，只更新账本
+        return {"token_ledger": ledger_delta} if ledger_delta is not None else {}
+
+    return {
+        **compression_update(state, new_messages, stats),
+        "needs_compression": False
+    }
 
+
+def compression_update(state: AgentState, new_messages: list, stats: dict) -> dict:
+    """
+    构建压缩后的状态更新
+
+    Args:
+        state: 当前状态
+        new_messages: 压缩后的消息列表
+        stats: 压缩统计信息
+
+    Returns:
+        替换全部消息、更新 Token 账本和压缩历史的状态更新
+    """
     # 创建压缩记录（使用 Pydantic 模型）
     compression_record = CompressionRecord(
         timestamp=datetime.now().isoformat(),
@@ -42,10 +80,13 @@ async def compression_node(
         removed_messages_count=stats.get("removed_messages_count", 0)
     )
 
+    # 用压缩后的消息替换全部消息（add_messages 只会按 ID 合并，不会删除被压缩的消息）
+    replacement = [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + list(new_messages)
+
     return {
-        "messages": new_messages,
-        "compression_history": list(state.compression_history) + [compression_record],
-        "needs_compression": False
+        "messages": replacement,
+        "token_ledger": token_ledger_delta(replacement),
+        "compression_history": list(state.compression_history) + [compression_record]
     }
 
 
@@ -59,7 +100,7 @@ def create_compression_node(compression_manager: CompressionManager):
     Returns:
         压缩节点函数
     """
-    async def node(state: AgentState) -> dict:
-        return await compression_node(state, compression_manager)
+    async def node(state: AgentState, config: RunnableConfig) -> dict:
+        return await compression_node(state, compression_manager, config)
 
     return node
@@ -0,0 +1,327 @@
+"""
+工具节点
+按读写冲突调度同一轮中的多个工具调用，并把过大的工具输出转存到 Blob 存储
+
+- 只读工具并发执行（受并发上限约束）
+- 修改类工具与之前涉及相同路径的调用串行执行；无法确定影响范围的工具独占执行
+- 无论完成先后，ToolMessage 都按模型发出工具调用的顺序返回
+- 只读工具和可以被取消的异步工具（如 task_tool、沙箱中执行的工具）超时后返回结构化的超时 ToolMessage，
+  其他调用不受影响；仍在 I/O 线程中运行的被放弃的调用结束前，依赖它的调用不会开始
+- 在 I/O 线程中执行的修改类工具不设超时：工作线程无法被强制结束，超时后继续写入会覆盖后续调用的结果
+"""
+import asyncio
+import os
+from typing import Callable, Optional
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.prebuilt import ToolNode
+from langgraph.store.base import BaseStore
+from langgraph.types import Command
+
+from core.state import AgentState, token_ledger_delta
+from tools.tool_output_tool import spill_tool_message
+from utils.async_io import track_io_calls
+from utils.patch import PatchError, parse_patch
+
+# 只读工具：相互之间没有副作用，可以并发执行
+READ_ONLY_TOOLS = {
+    "read_file",
+    "list_directory",
+    "search_in_files",
+    "find_files",
+    "find_symbol",
+    "get_symbol_source",
+    "rank_search",
+    "read_tool_output",
+    "todo_read",
+}
+
+# 工具涉及的路径参数（文件或目录），未指定时为当前目录
+PATH_ARGS = {
+    "read_file": "file_path",
+    "write_file": "file_path",
+    "edit_file": "file_path",
+    "list_directory": "directory_path",
+    "search_in_files": "directory",
+    "find_files": "directory",
+    "find_symbol": "directory",
+    "rank_search": "directory",
+}
+
+# 不涉及文件、只读写 Agent 状态的工具，以虚拟资源名参与冲突检测
+STATE_RESOURCES = {
+    "todo_read": "<todo_list>",
+    "todo_write": "<todo_list>",
+    "read_tool_output": "<tool_outputs>",
+}
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+def supports_timeout(tool: BaseTool) -> bool:
+    """
+    工具的超时能否生效
+
+    只读工具被放弃后没有副作用；异步工具被取消后在取消点中止。
+    在线程中执行的修改类工具无法被中止，超时后仍会继续写入，因此不设超时。
+
+    Args:
+        tool: 工具
+
+    Returns:
+        是否对该工具应用超时
+    """
+    if tool.name in READ_ONLY_TOOLS:
+        return True
+    coroutine = getattr(tool, "coroutine", None)
+    return coroutine is not None and not getattr(coroutine, "runs_in_io_thread", False)
+
+
+def check_tool_timeouts(tools: list, tool_timeouts: dict):
+    """
+    检查按工具名称配置的超时都能生效
+
+    Args:
+        tools: 工具列表
+        tool_timeouts: 工具名称 -> 超时（秒），值为 None 的条目表示不限制，不做检查
+
+    Raises:
+        ValueError: 配置了未知工具，或工具的超时无法生效
+    """
+    tools_by_name = {tool.name: tool for tool in tools}
+    invalid = [
+        name for name, timeout in tool_timeouts.items()
+        if timeout is not None and (name not in tools_by_name or not supports_timeout(tools_by_name[name]))
+    ]
+    if invalid:
+        raise ValueError(
+            f"tool_timeouts cannot be enforced for {', '.join(sorted(invalid))}: "
+            "only read-only tools and cancellable async tools support timeouts"
+        )
+
+
+def timeout_message(call: dict, timeout: float) -> ToolMessage:
+    """
+    构建超时的 ToolMessage
+
+    Args:
+        call: 超时的工具调用
+        timeout: 超时时间（秒）
+
+    Returns:
+        status 为 error 的 ToolMessage，artifact 中记录超时信息
+    """
+    content = (
+        f"Error: {call['name']} timed out after {timeout:g}s and was cancelled. "
+        "Retry with narrower arguments (e.g. a smaller directory or a more specific pattern) "
+        "or use a different approach."
+    )
+    return ToolMessage(
+        content=content,
+        name=call["name"],
+        tool_call_id=call["id"],
+        status="error",
+        artifact={"error": "timeout", "timeout_seconds": timeout}
+    )
+
+
+def _normalize_path(path: str) -> str:
+    """规范化路径，使不同写法的同一路径可以比较"""
+    return os.path.realpath(os.path.abspath(path or "."))
+
+
+def _call_resources(call: dict) -> Optional[set]:
+    """
+    工具调用涉及的资源
+
+    Returns:
+        资源集合（规范化路径或虚拟资源名）；无法确定时返回 None，表示独占执行
+    """
+    name = call["name"]
+    args = call.get("args") or {}
+
+    if name in STATE_RESOURCES:
+        return {STATE_RESOURCES[name]}
+    if name in PATH_ARGS:
+        return {_normalize_path(args.get(PATH_ARGS[name]) or ".")}
+    if name == "get_symbol_source":
+        return {_normalize_path(args.get("file_path") or args.get("directory") or ".")}
+    if name == "apply_patch":
+        directory = args.get("directory") or "."
+        try:
+            file_patches = parse_patch(args.get("patch", ""))
+        except PatchError:
+            # 补丁无法解析时工具会直接报错，只需与同一目录下的调用互斥
+            return {_normalize_path(directory)}
+        return {
+            _normalize_path(os.path.join(directory, path))
+            for file_patch in file_patches
+            for path in (file_patch.old_path, file_patch.new_path)
+            if path
+        }
+    return None
+
+
+def _overlaps(a: str, b: str) -> bool:
+    """两个资源是否重叠（相同，或一个是另一个的上级目录）"""
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+def _conflicts(earlier: tuple, later: tuple) -> bool:
+    """
+    判断后一个调用是否必须等待前一个调用完成
+
+    Args:
+        earlier: 前一个调用的 (是否只读, 资源集合)
+        later: 后一个调用的 (是否只读, 资源集合)
+    """
+    earlier_read_only, earlier_resources = earlier
+    later_read_only, later_resources = later
+    if earlier_read_only and later_read_only:
+        return False
+    if earlier_resources is None or later_resources is None:
+        return True
+    return any(_overlaps(a, b) for a in earlier_resources for b in later_resources)
+
+
+def plan_tool_calls(tool_calls: list) -> list[list[int]]:
+    """
+    计算每个工具调用需要等待的前序调用
+
+    读读不冲突；读写、写写在资源重叠时冲突；资源未知的调用与所有调用冲突。
+    冲突的调用按模型发出的顺序执行，保证先读后写、先写后读的语义不变。
+
+    Args:
+        tool_calls: 工具调用列表
+
+    Returns:
+        每个调用依赖的前序调用下标列表
+    """
+    profiles = [(call["name"] in READ_ONLY_TOOLS, _call_resources(call)) for call in tool_calls]
+    return [
+        [j for j in range(i) if _conflicts(profiles[j], profiles[i])]
+        for i in range(len(tool_calls))
+    ]
+
+
+def _tool_outputs(result) -> list:
+    """将 ToolNode 的返回值展开为 ToolMessage / Command 列表"""
+    if isinstance(result, dict):
+        return list(result.get("messages", []))
+    outputs = []
+    for item in result:
+        if isinstance(item, dict):
+            outputs.extend(item.get("messages", []))
+        else:
+            outputs.append(item)
+    return outputs
+
+
+def create_tool_node(
+    tools: list,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    get_timeout: Optional[Callable[[str], Optional[float]]] = None
+):
+    """
+    创建工具节点函数
+
+    Args:
+        tools: 工具列表
+        max_concurrency: 同时执行的工具调用数上限
+        get_timeout: 工具名称 -> 超时（秒，None 表示不限制），只用于超时能生效的工具（见 supports_timeout）；
+            未提供时不限制
+
+    Returns:
+        工具节点函数
+    """
+    # ToolNode 负责参数注入、校验和错误处理，调度由本节点完成
+    tool_node = ToolNode(tools)
+    timeout_tools = {tool.name for tool in tools if isinstance(tool, BaseTool) and supports_timeout(tool)}
+
+    async def node(
+        state: AgentState,
+        config: RunnableConfig,
+        *,
+        store: Optional[BaseStore] = None
+    ):
+        last_ai = next((m for m in reversed(state.messages) if isinstance(m, AIMessage)), None)
+        if last_ai is None or not last_ai.tool_calls:
+            return {"messages": []}
+
+        tool_calls = last_ai.tool_calls
+        dependencies = plan_tool_calls(tool_calls)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        loop = asyncio.get_running_loop()
+        # 每个调用真正结束时完成（超时的调用要等其工作线程结束），依赖它的调用等待的是这个信号
+        settled = [loop.create_future() for _ in tool_calls]
+        tasks: list[asyncio.Task] = []
+
+        def settle(index: int):
+            if not settled[index].done():
+                settled[index].set_result(None)
+
+        async def run(index: int) -> list:
+            abandoned = []
+            try:
+                if dependencies[index]:
+                    await asyncio.gather(*(settled[j] for j in dependencies[index]))
+                call = tool_node.inject_tool_args(tool_calls[index], state, store)
+                timeout = None
+                if get_timeout is not None and call["name"] in timeout_tools:
+                    timeout = get_timeout(call["name"])
+                with track_io_calls() as io_futures:
+                    async with semaphore:
+                        try:
+                            result = await asyncio.wait_for(
+                                tool_node.ainvoke([{**call, "type": "tool_call"}], config),
+                                timeout
+                            )
+                        except asyncio.TimeoutError:
+                            # 异步工具已在取消点中止；I/O 线程中的工作（包括 SubAgent 发起的）仍在运行，结束后才放行依赖它的调用
+                            abandoned = [asyncio.wrap_future(f) for f in io_futures if not f.done()]
+                            return [timeout_message(call, timeout)]
+                return _tool_outputs(result)
+            finally:
+                if abandoned:
+                    asyncio.gather(*abandoned, return_exceptions=True).add_done_callback(
+                        lambda _: settle(index)
+                    )
+                else:
+                    settle(index)
+
+        for index in range(len(tool_calls)):
+            tasks.append(asyncio.create_task(run(index)))
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        # 按调用顺序合并：消息保持原顺序，Command 中的其他状态更新合并到同一次更新中
+        messages = []
+        updates = {}
+        commands = []
+        for outputs in results:
+            for output in outputs:
+                if isinstance(output, ToolMessage):
+                    messages.append(spill_tool_message(output))
+                elif isinstance(output, Command) and output.graph is None and not output.goto \
+                        and isinstance(output.update, dict):
+                    for key, value in output.update.items():
+                        if key == "messages":
+                            messages.extend(
+                                spill_tool_message(m) if isinstance(m, ToolMessage) else m
+                                for m in value
+                            )
+                        else:
+                            updates[key] = value
+                else:
+                    commands.append(output)
+
+        update = {"messages": messages, **updates, "token_ledger": token_ledger_delta(messages)}
+        return [update, *commands] if commands else update
+
+    return node
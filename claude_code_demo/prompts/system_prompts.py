@@ -118,10 +118,31 @@ Ensure readability and practicality of documentation"""
 }
 
 
-def get_main_system_prompt(todo_count: int = 0) -> str:
-    """获取主 Agent 系统提示词"""
+# 仓库地图提示词（启用时附加到主提示词末尾）
+REPO_MAP_PROMPT = """
+## Repository Map
+
+Overview of the current workspace: files ranked by how often they are imported, with their public
+top-level classes and functions. Use it to decide which files to read instead of exploring with
+list_directory/search_in_files first. It may omit low-ranked files and lag recent changes by a few seconds.
+
+{repo_map}
+"""
+
+
+def get_main_system_prompt(todo_count: int = 0, repo_map: str = None) -> str:
+    """
+    获取主 Agent 系统提示词
+
+    Args:
+        todo_count: 当前任务数
+        repo_map: 仓库地图文本，可选
+    """
     todo_prompt = TODO_MANAGEMENT_PROMPT.format(todo_count=todo_count)
-    return f"{MAIN_AGENT_SYSTEM_PROMPT}\n\n{todo_prompt}"
+    prompt = f"{MAIN_AGENT_SYSTEM_PROMPT}\n\n{todo_prompt}"
+    if repo_map:
+        prompt += "\n" + REPO_MAP_PROMPT.format(repo_map=repo_map)
+    return prompt
 
 
 def get_subagent_system_prompt(agent_type: str) -> str:
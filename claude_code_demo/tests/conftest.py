@@ -0,0 +1,12 @@
+"""
+测试公共配置
+"""
+import os
+import sys
+import tempfile
+
+# 与直接运行 main.py 一样，以 claude_code_demo 目录作为导入根
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 索引等缓存写到临时目录，不污染用户的缓存目录
+os.environ.setdefault("CLAUDE_CODE_DEMO_CACHE_DIR", tempfile.mkdtemp(prefix="claude_code_demo_test_"))
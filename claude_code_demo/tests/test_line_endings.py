@@ -0,0 +1,28 @@
+"""
+混合换行符下 read_file 的行号与 search_in_files 的行号一致
+"""
+import re
+
+from tools.base_tools import read_file, search_in_files
+
+
+MIXED = b"foo\r\nbar hello\nbaz\rqux hello\r\rlast hello\n"
+
+
+def test_read_file_offsets_match_search_line_numbers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "mixed.txt").write_bytes(MIXED)
+
+    # 与文本模式读取一致：\r\n、\r、\n 都是换行
+    expected = MIXED.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n").splitlines()
+    result = read_file.invoke({"file_path": "mixed.txt"})
+    assert f"({len(expected)} lines)" in result
+
+    found = search_in_files.invoke({"pattern": "hello", "directory": "."})
+    matches = re.findall(r"Line (\d+): (.*)", found)
+    assert [text for _, text in matches] == [line for line in expected if "hello" in line]
+
+    for line_number, text in matches:
+        page = read_file.invoke({"file_path": "mixed.txt", "offset": int(line_number), "limit": 1})
+        assert f"(lines {line_number}-{line_number} of {len(expected)})" in page
+        assert page.split("\n\n")[1].rstrip("\n") == text
@@ -2,18 +2,91 @@
 基础工具模块
 包含文件操作等基础工具
 """
+import fnmatch
 import os
+import re
+from itertools import islice
 from pathlib import Path
+from typing import List, Optional
+from typing_extensions import Annotated
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-
-
+from langgraph.prebuilt import InjectedState
+
+from config import FileToolConfig
+from core.state import AgentState
+from utils.async_io import configure_io_executor, with_async_io
+from utils.file_cache import get_file_cache
+from utils.file_ops import atomic_write_text, unified_diff
+from utils.file_search import compile_matcher, scan_file, iter_file_matches
+from utils.file_walker import FileWalker, DEFAULT_IGNORE_PATTERNS, compile_path_glob, glob_base_dir
+from utils.line_index import get_line_index
+from utils.read_tracker import get_read_tracker, content_digest
+from utils.search_index import get_trigram_index, index_scope
+from utils.workspace_snapshot import start_workspace_snapshot, stop_workspace_snapshot, workspace_stat
+
+
+# 文件工具配置（由 configure_base_tools 在构建图时设置）
+_file_tool_config = FileToolConfig()
+
+
+def configure_base_tools(config: FileToolConfig):
+    """设置基础工具使用的配置"""
+    global _file_tool_config
+    _file_tool_config = config
+    get_file_cache().resize(config.content_cache_max_bytes)
+    configure_io_executor(config.io_max_workers)
+    if config.enable_workspace_snapshot:
+        start_workspace_snapshot(
+            config.workspace_root or os.getcwd(),
+            ignore_patterns=(
+                DEFAULT_IGNORE_PATTERNS if config.ignore_patterns is None else config.ignore_patterns
+            ),
+            poll_interval=config.snapshot_poll_interval
+        )
+    else:
+        stop_workspace_snapshot()
+
+
+def get_file_tool_config() -> FileToolConfig:
+    """获取文件工具当前使用的配置"""
+    return _file_tool_config
+
+
+def _make_walker(path: Path) -> FileWalker:
+    """按当前配置创建目录遍历器"""
+    return FileWalker(
+        path,
+        ignore_patterns=_file_tool_config.ignore_patterns,
+        respect_gitignore=_file_tool_config.respect_gitignore
+    )
+
+
+@with_async_io
 @tool
-def read_file(file_path: str) -> str:
+def read_file(
+    file_path: str,
+    offset: int = None,
+    limit: int = None,
+    force: bool = False,
+    config: RunnableConfig = None,
+    state: Annotated[Optional[AgentState], InjectedState] = None
+) -> str:
     """
     读取文件内容
 
+    大文件请使用 offset/limit 分段读取，返回头部会给出文件总行数。
+    未指定 limit 时最多返回 read_default_limit 行；没有读到文件末尾时，结果末尾会注明剩余行数和下一个 offset。
+    同一会话中重复读取未变化的文件时只返回简短提示，需要完整内容时设置 force=True。
+
     Args:
         file_path: 文件路径
+        offset: 起始行号（从 1 开始），可选
+        limit: 读取的行数，可选；未指定时最多返回 read_default_limit 行（默认 2000）
+        force: 即使内容未变化也返回完整内容，默认 False
+        config: 运行配置（自动注入，用于获取 thread_id）
+        state: Agent 状态（自动注入）
 
     Returns:
         文件内容
@@ -26,14 +99,76 @@ def read_file(file_path: str) -> str:
         if not path.is_file():
             return f"Error: {file_path} is not a file"
 
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        return f"Content of {file_path}:\n\n{content}"
+        if offset is not None and offset < 1:
+            return f"Error: offset must be >= 1, got {offset}"
+        if limit is not None and limit < 1:
+            return f"Error: limit must be >= 1, got {limit}"
+
+        # 可缓存的文件从共享内容缓存读取，大文件通过行偏移索引 seek 读取
+        file_cache = get_file_cache()
+        data = None
+        if workspace_stat(path).st_size <= file_cache.max_file_bytes:
+            data = file_cache.get_bytes(path)
+
+        line_index = get_line_index(path, data)
+        total_lines = line_index.total_lines
+        start = (offset or 1) - 1
+        if start >= max(total_lines, 1):
+            return f"Error: offset {offset} exceeds total line count {total_lines} of {file_path}"
+
+        count = limit if limit is not None else _file_tool_config.read_default_limit
+        content = line_index.read_lines(start, count, data)
+        end = min(start + count, total_lines)
+
+        if start == 0 and end == total_lines:
+            header = f"Content of {file_path} ({total_lines} lines):"
+        else:
+            header = f"Content of {file_path} (lines {start + 1}-{end} of {total_lines}):"
+        if end < total_lines:
+            # 没有读到文件末尾：明确提示剩余行数和继续读取的 offset
+            reason = (
+                f"read_file returns at most {count} lines when no limit is given"
+                if limit is None else f"limit={limit}"
+            )
+            content = content.rstrip("\n") + (
+                f"\n\n[Output truncated at line {end} of {total_lines} ({reason}); "
+                f"{total_lines - end} more lines. Use offset={end + 1} to continue reading.]"
+            )
+
+        result = f"{header}\n\n{content}"
+
+        # 同一线程重复读取未变化的内容时，引用之前的工具消息而不是再次返回全文
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        if thread_id is not None:
+            read_tracker = get_read_tracker()
+            read_key = (os.path.realpath(path), offset, limit)
+            digest = content_digest(result)
+            if not force and read_tracker.seen(thread_id, read_key, digest):
+                previous_call_id = _find_previous_read(state, result)
+                if previous_call_id is not None:
+                    return (
+                        f"File {file_path} is unchanged since it was read in tool call "
+                        f"{previous_call_id}; content omitted. "
+                        "Call read_file with force=True to get the full content again."
+                    )
+            read_tracker.record(thread_id, read_key, digest)
+
+        return result
     except Exception as e:
         return f"Error reading file {file_path}: {str(e)}"
 
 
+def _find_previous_read(state: Optional[AgentState], result: str) -> Optional[str]:
+    """在当前消息中查找返回了相同内容的 read_file 工具消息（可能已被压缩移除）"""
+    if state is None:
+        return None
+    for msg in reversed(state.messages):
+        if isinstance(msg, ToolMessage) and msg.name == "read_file" and msg.content == result:
+            return msg.tool_call_id
+    return None
+
+
+@with_async_io
 @tool
 def write_file(file_path: str, content: str) -> str:
     """
@@ -51,55 +186,108 @@ def write_file(file_path: str, content: str) -> str:
         # 创建目录（如果不存在）
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        atomic_write_text(path, content)
+        get_file_cache().invalidate(path)
 
         return f"Successfully wrote to {file_path}"
     except Exception as e:
         return f"Error writing file {file_path}: {str(e)}"
 
 
+@with_async_io
 @tool
-def edit_file(file_path: str, old_content: str, new_content: str) -> str:
+def edit_file(
+    file_path: str,
+    old_content: str = None,
+    new_content: str = None,
+    edits: List[dict] = None
+) -> str:
     """
     编辑文件内容（替换）
 
+    可以用 old_content/new_content 做单个替换，也可以用 edits 一次提交多个替换。
+    所有替换在内存中按顺序应用（后面的替换作用于前面替换后的结果），
+    任何一个替换失败时文件保持不变；成功后原子地写回文件并返回变更片段。
+
     Args:
         file_path: 文件路径
-        old_content: 要替换的内容
-        new_content: 新内容
+        old_content: 要替换的内容（单个替换）
+        new_content: 新内容（单个替换）
+        edits: 多个替换，每项为 {"old_content": ..., "new_content": ..., "expected_count": 可选}，
+            指定 expected_count 时出现次数必须与之相等，否则替换所有出现
 
     Returns:
-        操作结果
+        操作结果和变更差异
     """
     try:
         path = Path(file_path)
         if not path.exists():
             return f"Error: File {file_path} does not exist"
 
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        if old_content not in content:
-            return f"Error: Content to replace not found in {file_path}"
-
-        new_file_content = content.replace(old_content, new_content)
-
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(new_file_content)
-
-        return f"Successfully edited {file_path}"
+        if edits is None:
+            if old_content is None or new_content is None:
+                return "Error: Provide old_content and new_content, or a list of edits"
+            edits = [{"old_content": old_content, "new_content": new_content}]
+        if not edits:
+            return "Error: edits must not be empty"
+
+        file_cache = get_file_cache()
+        # 编辑结果会写回文件：用真实 stat 校验缓存，不使用可能滞后的快照
+        content = file_cache.get_text(path, verify=True)
+
+        new_file_content = content
+        for i, edit in enumerate(edits, 1):
+            old = edit.get("old_content")
+            new = edit.get("new_content")
+            if old is None or new is None:
+                return f"Error: Edit {i} must have old_content and new_content"
+
+            count = new_file_content.count(old) if old else 0
+            if count == 0:
+                if len(edits) == 1:
+                    return f"Error: Content to replace not found in {file_path}"
+                return f"Error: Edit {i}: content to replace not found in {file_path}; no changes were made"
+
+            expected_count = edit.get("expected_count")
+            if expected_count is not None and count != expected_count:
+                return (
+                    f"Error: Edit {i}: expected {expected_count} occurrence(s) but found {count} "
+                    f"in {file_path}; no changes were made"
+                )
+
+            new_file_content = new_file_content.replace(old, new)
+
+        atomic_write_text(path, new_file_content)
+        file_cache.invalidate(path)
+
+        diff = unified_diff(file_path, content, new_file_content)
+        summary = f"Successfully edited {file_path} ({len(edits)} edit(s) applied)"
+        return f"{summary}:\n\n{diff}" if diff else f"{summary}; content unchanged"
     except Exception as e:
         return f"Error editing file {file_path}: {str(e)}"
 
 
+@with_async_io
 @tool
-def list_directory(directory_path: str = ".") -> str:
+def list_directory(
+    directory_path: str = ".",
+    recursive: bool = False,
+    max_depth: int = None,
+    pattern: str = None,
+    cursor: int = 0
+) -> str:
     """
     列出目录内容
 
+    递归模式以缩进的树形结构返回整个子树（目录以 / 结尾），一次调用即可了解项目结构。
+    条目过多时分页返回，按结果末尾提示的 cursor 再次调用即可获取下一页。
+
     Args:
         directory_path: 目录路径，默认为当前目录
+        recursive: 是否递归列出子目录，默认 False
+        max_depth: 递归的最大深度（1 表示只列出当前目录），默认为 list_default_depth
+        pattern: 文件名通配符过滤（如 *.py），只列出匹配的文件及其所在目录，可选
+        cursor: 分页游标，从上一页结果末尾获取，默认 0
 
     Returns:
         目录内容列表
@@ -112,18 +300,64 @@ def list_directory(directory_path: str = ".") -> str:
         if not path.is_dir():
             return f"Error: {directory_path} is not a directory"
 
-        items = []
-        for item in sorted(path.iterdir()):
-            item_type = "DIR" if item.is_dir() else "FILE"
-            items.append(f"[{item_type}] {item.name}")
-
-        return f"Contents of {directory_path}:\n" + "\n".join(items)
+        if cursor < 0:
+            return f"Error: cursor must be >= 0, got {cursor}"
+        if max_depth is not None and max_depth < 1:
+            return f"Error: max_depth must be >= 1, got {max_depth}"
+
+        page_size = _file_tool_config.list_page_size
+        walker = _make_walker(path)
+        ignored_count = 0
+
+        if recursive:
+            depth = max_depth or _file_tool_config.list_default_depth
+            header = f"Tree of {directory_path} (depth {depth}):"
+            nodes = walker.iter_tree(depth, pattern)
+            page = list(islice(nodes, cursor, cursor + page_size + 1))
+            items = [
+                "  " * level + name + ("/" if is_dir else "")
+                for level, name, is_dir in page[:page_size]
+            ]
+        else:
+            header = f"Contents of {directory_path}:"
+            entries, ignored_count = walker.list_dir()
+            if pattern is not None:
+                entries = [
+                    (entry, is_dir) for entry, is_dir in entries
+                    if is_dir or fnmatch.fnmatchcase(entry.name, pattern)
+                ]
+            page = entries[cursor:cursor + page_size + 1]
+            items = [
+                f"[{'DIR' if is_dir else 'FILE'}] {entry.name}"
+                for entry, is_dir in page[:page_size]
+            ]
+
+        if not items and cursor > 0:
+            return f"No more entries in {directory_path} (cursor {cursor})"
+
+        output = header + "\n" + "\n".join(items)
+        if ignored_count:
+            output += f"\n({ignored_count} ignored entries hidden)"
+        if len(page) > page_size:
+            next_cursor = cursor + page_size
+            output += (
+                f"\n\n[Showing entries {cursor + 1}-{next_cursor}. More entries available; "
+                f"call list_directory again with cursor={next_cursor}.]"
+            )
+        return output
     except Exception as e:
         return f"Error listing directory {directory_path}: {str(e)}"
 
 
+@with_async_io
 @tool
-def search_in_files(pattern: str, directory: str = ".", file_extension: str = None) -> str:
+def search_in_files(
+    pattern: str,
+    directory: str = ".",
+    file_extension: str = None,
+    regex: bool = False,
+    ignore_case: bool = False
+) -> str:
     """
     在文件中搜索内容
 
@@ -131,6 +365,8 @@ def search_in_files(pattern: str, directory: str = ".", file_extension: str = No
         pattern: 搜索模式
         directory: 搜索目录，默认为当前目录
         file_extension: 文件扩展名过滤（如 .py），可选
+        regex: 是否将 pattern 作为正则表达式（^/$ 匹配行首/行尾），默认 False
+        ignore_case: 是否忽略大小写，默认 False
 
     Returns:
         搜索结果
@@ -140,33 +376,169 @@ def search_in_files(pattern: str, directory: str = ".", file_extension: str = No
         if not path.exists():
             return f"Error: Directory {directory} does not exist"
 
+        try:
+            matcher = compile_matcher(pattern, regex, ignore_case)
+        except re.error as e:
+            return f"Error: Invalid regex pattern '{pattern}': {str(e)}"
+
+        # 使用三元组索引过滤候选文件，只打开可能包含 pattern 的文件
+        # 正则和忽略大小写模式无法用三元组过滤
+        # 同一工作区内的目录共用一个索引，索引键为相对于工作区根目录的路径
+        index = None
+        prefix = "."
+        if _file_tool_config.enable_search_index and not regex and not ignore_case:
+            index_root, prefix = index_scope(
+                directory, _file_tool_config.workspace_root or os.getcwd()
+            )
+            index = get_trigram_index(index_root, _file_tool_config.cache_dir)
+        seen_paths = set()
+        walk_completed = False
+
+        def index_key(file_path: Path) -> str:
+            rel_path = str(file_path.relative_to(path))
+            return rel_path if prefix == "." else os.path.join(prefix, rel_path)
+
+        def iter_candidates():
+            nonlocal walk_completed
+            for file_path in _make_walker(path).iter_files(f"*{file_extension or ''}"):
+                if index is not None:
+                    seen_paths.add(index_key(file_path))
+                yield file_path
+            walk_completed = True
+
+        def match_file(file_path: Path):
+            if index is None:
+                return scan_file(file_path, matcher)
+            rel_path = index_key(file_path)
+            verdict = index.lookup(file_path, rel_path, pattern)
+            if verdict is False:
+                return None
+            if verdict is None:
+                # 条目过期：扫描时用同一份内容更新索引，不再单独读取文件
+                return scan_file(
+                    file_path, matcher,
+                    on_read=lambda stat, text: index.update(rel_path, stat, text)
+                )
+            return scan_file(file_path, matcher)
+
+        # 并行扫描，达到匹配数或字节数上限时提前停止
+        max_matches = _file_tool_config.search_max_matches
+        max_bytes = _file_tool_config.search_max_bytes
+        match_count = 0
+        result_bytes = 0
+        truncated = False
+
         results = []
-        for file_path in path.rglob(f"*{file_extension or ''}"):
-            if file_path.is_file():
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if pattern in content:
-                            # 找到匹配的行
-                            lines = content.split('\n')
-                            matches = [
-                                f"  Line {i+1}: {line.strip()}"
-                                for i, line in enumerate(lines)
-                                if pattern in line
-                            ]
-                            if matches:
-                                results.append(f"{file_path}:\n" + "\n".join(matches))
-                except:
-                    continue
+        file_matches = iter_file_matches(
+            iter_candidates(),
+            match_file,
+            _file_tool_config.search_max_workers
+        )
+        try:
+            for file_path, matches in file_matches:
+                kept = []
+                for line in matches:
+                    line_bytes = len(line.encode('utf-8')) + 1
+                    if match_count >= max_matches or result_bytes + line_bytes > max_bytes:
+                        truncated = True
+                        break
+                    kept.append(line)
+                    match_count += 1
+                    result_bytes += line_bytes
+                if kept:
+                    results.append(f"{file_path}:\n" + "\n".join(kept))
+                if truncated:
+                    break
+        finally:
+            file_matches.close()
+
+        if index is not None:
+            # 只有完整遍历时才能确定哪些文件已被删除
+            if walk_completed and not file_extension:
+                index.prune(seen_paths, prefix)
+            index.save()
 
         if not results:
             return f"No matches found for '{pattern}' in {directory}"
 
-        return f"Search results for '{pattern}':\n\n" + "\n\n".join(results)
+        output = f"Search results for '{pattern}':\n\n" + "\n\n".join(results)
+        if truncated:
+            output += (
+                f"\n\n[Results truncated: showing {match_count} matching lines. "
+                "Narrow the pattern, directory or file_extension to see more.]"
+            )
+        return output
     except Exception as e:
         return f"Error searching files: {str(e)}"
 
 
+@with_async_io
+@tool
+def find_files(pattern: str, directory: str = ".", limit: int = 100) -> str:
+    """
+    按路径通配符查找文件（只匹配文件名和路径，不读取文件内容）
+
+    通配符相对于 directory 匹配：* 和 ? 不跨越目录，**/ 匹配任意层目录。
+    例如 **/*.py 查找所有 Python 文件，src/**/test_*.py 只在 src 下查找。
+    结果按修改时间排序，最近修改的文件在前。
+
+    Args:
+        pattern: 路径通配符
+        directory: 查找的根目录，默认为当前目录
+        limit: 最多返回的文件数，默认 100
+
+    Returns:
+        匹配的文件列表
+    """
+    try:
+        path = Path(directory)
+        if not path.exists():
+            return f"Error: Directory {directory} does not exist"
+
+        if not path.is_dir():
+            return f"Error: {directory} is not a directory"
+
+        if limit < 1:
+            return f"Error: limit must be >= 1, got {limit}"
+
+        # 从通配符中不含通配字符的前导目录开始遍历
+        base_dir = glob_base_dir(pattern)
+        start = path / base_dir if base_dir else path
+        matcher = compile_path_glob(pattern)
+
+        matches = []
+        if start.is_dir():
+            prefix = base_dir + "/" if base_dir else ""
+            # 遍历器产生的路径都以 start 开头（start 为 "." 时没有前缀），直接切片得到相对路径
+            skip = 0 if str(start) == "." else len(str(start)) + 1
+            for file_path in _make_walker(start).iter_files(skip_binary=False):
+                rel_path = prefix + str(file_path)[skip:].replace(os.sep, "/")
+                if not matcher.match(rel_path):
+                    continue
+                try:
+                    mtime_ns = workspace_stat(file_path).st_mtime_ns
+                except OSError:
+                    continue
+                matches.append((mtime_ns, str(file_path)))
+
+        if not matches:
+            return f"No files found matching '{pattern}' in {directory}"
+
+        matches.sort(key=lambda m: (-m[0], m[1]))
+        output = (
+            f"Found {len(matches)} file(s) matching '{pattern}' "
+            "(newest first):\n" + "\n".join(p for _, p in matches[:limit])
+        )
+        if len(matches) > limit:
+            output += (
+                f"\n\n[Showing the {limit} most recently modified of {len(matches)} files. "
+                "Narrow the pattern or directory to see more.]"
+            )
+        return output
+    except Exception as e:
+        return f"Error finding files: {str(e)}"
+
+
 # 导出所有基础工具
 def get_base_tools() -> list:
     """获取所有基础工具"""
@@ -175,5 +547,6 @@ def get_base_tools() -> list:
         write_file,
         edit_file,
         list_directory,
-        search_in_files
+        search_in_files,
+        find_files
     ]
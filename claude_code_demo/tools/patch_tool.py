@@ -0,0 +1,70 @@
+"""
+补丁工具
+用一次工具调用（一次人工确认）完成多文件修改
+"""
+from langchain_core.tools import tool
+
+from utils.async_io import with_async_io
+from utils.patch import PatchError, plan_patch, commit_patch
+
+
+APPLY_PATCH_DESCRIPTION = """Apply a multi-file unified diff in a single step.
+
+Use this instead of several write_file/edit_file calls when a change touches multiple files
+(refactors, renames across files, coordinated edits).
+
+Format: standard unified diff, one section per file:
+--- a/path/to/file.py
++++ b/path/to/file.py
+@@ -10,3 +10,4 @@
+ context line
+-removed line
++added line
+ context line
+
+- Use --- /dev/null to create a file and +++ /dev/null to delete one
+- Include a few unchanged context lines around each change
+- Every hunk of every file is validated first; if any hunk does not apply, no file is changed
+- If writing fails midway, all files are restored to their original content
+"""
+
+
+@with_async_io
+@tool(description=APPLY_PATCH_DESCRIPTION)
+def apply_patch(patch: str, directory: str = ".") -> str:
+    """
+    应用多文件统一差异
+
+    Args:
+        patch: 统一差异格式的补丁
+        directory: 补丁中路径的基准目录，默认为当前目录
+
+    Returns:
+        操作结果
+    """
+    try:
+        planned = plan_patch(patch, directory)
+        commit_patch(planned)
+    except PatchError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error applying patch: {str(e)}"
+
+    lines = []
+    for change in planned:
+        fp = change.file_patch
+        if fp.old_path is None:
+            lines.append(f"  A {change.path} (+{fp.added})")
+        elif fp.new_path is None:
+            lines.append(f"  D {change.path}")
+        elif change.rename_from is not None:
+            lines.append(f"  R {change.rename_from} -> {change.path} (+{fp.added} -{fp.removed})")
+        else:
+            lines.append(f"  M {change.path} (+{fp.added} -{fp.removed})")
+
+    return f"Successfully applied patch to {len(planned)} file(s):\n" + "\n".join(lines)
+
+
+def get_patch_tools() -> list:
+    """获取补丁工具列表"""
+    return [apply_patch]
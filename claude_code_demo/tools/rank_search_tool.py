@@ -0,0 +1,103 @@
+"""
+排序搜索工具
+基于本地 BM25 索引的自然语言代码搜索，返回最相关的文件和行范围
+"""
+import os
+from pathlib import Path
+
+from langchain_core.tools import tool
+
+from tools.base_tools import get_file_tool_config
+from utils.async_io import with_async_io
+from utils.bm25_index import best_window, get_bm25_index, tokenize_query
+from utils.file_cache import get_file_cache
+from utils.file_walker import FileWalker
+from utils.search_index import index_scope
+
+
+RANK_SEARCH_DESCRIPTION = """Search code by relevance with BM25 ranking (local index, no exact match needed).
+
+Use this for natural-language or fuzzy queries such as "retry logic", "token usage estimate"
+or "gitignore parsing". Identifiers are split into sub-words, so "retry" also matches
+RetryPolicy and max_retries. Returns the top-k files with the most relevant line range
+and a short preview of the matching lines.
+
+Use search_in_files instead when you know the exact text or regex to look for.
+"""
+
+
+@with_async_io
+@tool(description=RANK_SEARCH_DESCRIPTION)
+def rank_search(query: str, directory: str = ".", top_k: int = 10, file_extension: str = None) -> str:
+    """
+    按 BM25 相关度搜索代码
+
+    Args:
+        query: 查询（自然语言或标识符）
+        directory: 搜索目录，默认为当前目录
+        top_k: 返回的文件数，默认 10
+        file_extension: 文件扩展名过滤（如 .py），可选
+
+    Returns:
+        排序后的搜索结果
+    """
+    try:
+        path = Path(directory)
+        if not path.is_dir():
+            return f"Error: Directory {directory} does not exist"
+        if top_k < 1:
+            return f"Error: top_k must be >= 1, got {top_k}"
+
+        terms = tokenize_query(query)
+        if not terms:
+            return f"Error: Query '{query}' has no searchable terms"
+
+        config = get_file_tool_config()
+        # 同一工作区内的目录共用一个索引，索引键为相对于工作区根目录的路径
+        index_root, prefix = index_scope(directory, config.workspace_root or os.getcwd())
+        index = get_bm25_index(index_root, config.cache_dir)
+        if index is None:
+            return f"Error: Cannot create search index for {directory}"
+
+        # 增量更新索引（只重新分词变化的文件）
+        walker = FileWalker(
+            path,
+            ignore_patterns=config.ignore_patterns,
+            respect_gitignore=config.respect_gitignore
+        )
+        files = [
+            (file_path, os.path.normpath(os.path.join(prefix, file_path.relative_to(path))))
+            for file_path in walker.iter_files()
+        ]
+        index.refresh(files, prune=True, prefix=prefix)
+        index.save()
+
+        path_filter = (lambda p: p.endswith(file_extension)) if file_extension else None
+        ranked = index.rank(terms, top_k, path_filter, path_prefix=prefix)
+        if not ranked:
+            return f"No results found for '{query}' in {directory}"
+
+        # 只读取排名靠前的文件，定位最相关的行范围
+        weights = {term: index.idf(term) for term in terms}
+        file_cache = get_file_cache()
+        results = []
+        for n, (rel_path, score) in enumerate(ranked, 1):
+            file_path = path / os.path.relpath(rel_path, prefix)
+            try:
+                lines = file_cache.get_text(file_path).split("\n")
+            except (OSError, UnicodeDecodeError):
+                lines = []
+            start, end, preview = best_window(lines, weights) if lines else (1, 1, [])
+            entry = f"{n}. {file_path}:{start}-{end} (score {score:.2f})"
+            if preview:
+                entry += "\n" + "\n".join(f"   {line_no}: {text}" for line_no, text in preview)
+            results.append(entry)
+
+        return f"Top {len(results)} results for '{query}' (terms: {', '.join(terms)}):\n\n" + "\n\n".join(results)
+    except Exception as e:
+        return f"Error searching for '{query}': {str(e)}"
+
+
+def get_rank_search_tools() -> list:
+    """获取排序搜索工具列表"""
+    return [rank_search]
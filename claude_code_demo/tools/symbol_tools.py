@@ -0,0 +1,168 @@
+"""
+符号工具
+基于 AST 符号索引查找 Python 定义，只返回相关的源码片段
+"""
+import os
+from pathlib import Path
+from typing import Optional
+
+from langchain_core.tools import tool
+
+from tools.base_tools import get_file_tool_config
+from utils.async_io import with_async_io
+from utils.file_cache import get_file_cache
+from utils.file_walker import FileWalker
+from utils.line_index import get_line_index
+from utils.search_index import index_scope
+from utils.symbol_index import Symbol, extract_symbols, get_symbol_index
+
+
+SYMBOL_KINDS = ("class", "function", "method", "import")
+
+
+def _indexed_symbols(directory: str, name: str, kind: Optional[str]) -> list[tuple[Path, Symbol]]:
+    """刷新目录的符号索引并查找符号，返回 [(文件路径, 符号), ...]"""
+    config = get_file_tool_config()
+    path = Path(directory)
+    # 同一工作区内的目录共用一个索引，索引键为相对于工作区根目录的路径
+    index_root, prefix = index_scope(directory, config.workspace_root or os.getcwd())
+    index = get_symbol_index(index_root, config.cache_dir)
+    if index is None:
+        raise OSError(f"Cannot create symbol index for {directory}")
+
+    walker = FileWalker(
+        path,
+        ignore_patterns=config.ignore_patterns,
+        respect_gitignore=config.respect_gitignore
+    )
+    files = [
+        (file_path, os.path.normpath(os.path.join(prefix, file_path.relative_to(path))))
+        for file_path in walker.iter_files("*.py")
+    ]
+    index.refresh(files, config.symbol_index_max_workers, prune=True, prefix=prefix)
+    index.save()
+
+    return [
+        (path / os.path.relpath(rel_path, prefix), symbol)
+        for rel_path, symbol in index.find(name, kind, path_prefix=prefix)
+    ]
+
+
+def _format_symbol(file_path: Path, symbol: Symbol) -> str:
+    """格式化符号位置"""
+    return f"{file_path}:{symbol.start_line}-{symbol.end_line}  {symbol.kind} {symbol.qualname}"
+
+
+@with_async_io
+@tool
+def find_symbol(name: str, directory: str = ".", kind: str = None, limit: int = 20) -> str:
+    """
+    查找 Python 类、函数、方法和导入的定义位置（基于 AST 索引，不读取整个文件）
+
+    name 可以是名称（如 build_graph）或限定名（如 ClaudeCodeGraph.build_graph）；
+    没有精确匹配时按子串模糊匹配。结果给出文件、行范围、类型和限定名，
+    可以再用 get_symbol_source 获取源码。
+
+    Args:
+        name: 符号名称或限定名
+        directory: 查找的根目录，默认为当前目录
+        kind: 只查找某类符号：class、function、method 或 import，可选
+        limit: 最多返回的结果数，默认 20
+
+    Returns:
+        符号位置列表
+    """
+    try:
+        if not Path(directory).is_dir():
+            return f"Error: Directory {directory} does not exist"
+        if kind is not None and kind not in SYMBOL_KINDS:
+            return f"Error: kind must be one of {', '.join(SYMBOL_KINDS)}, got {kind}"
+        if limit < 1:
+            return f"Error: limit must be >= 1, got {limit}"
+
+        matches = _indexed_symbols(directory, name, kind)
+        if not matches:
+            return f"No symbols found for '{name}' in {directory}"
+
+        output = f"Found {len(matches)} symbol(s) for '{name}':\n" + "\n".join(
+            _format_symbol(file_path, symbol) for file_path, symbol in matches[:limit]
+        )
+        if len(matches) > limit:
+            output += f"\n\n[Showing first {limit} of {len(matches)} symbols. Use kind or a qualified name to narrow.]"
+        return output
+    except Exception as e:
+        return f"Error finding symbol '{name}': {str(e)}"
+
+
+@with_async_io
+@tool
+def get_symbol_source(name: str, file_path: str = None, directory: str = ".") -> str:
+    """
+    获取 Python 类、函数或方法的源码（只返回该定义的行范围，包括装饰器）
+
+    指定 file_path 时只在该文件中查找，否则在 directory 下的所有 Python 文件中查找。
+    有多个同名定义时返回候选列表，可用限定名（如 MyClass.run）或 file_path 区分。
+
+    Args:
+        name: 符号名称或限定名
+        file_path: 符号所在的文件，可选
+        directory: 未指定 file_path 时查找的根目录，默认为当前目录
+
+    Returns:
+        符号的源码
+    """
+    try:
+        if file_path is not None:
+            path = Path(file_path)
+            if not path.is_file():
+                return f"Error: File {file_path} does not exist"
+            symbols = extract_symbols(get_file_cache().get_text(path))
+            if "." in name:
+                matches = [s for s in symbols if s.qualname == name or s.qualname.endswith("." + name)]
+            else:
+                matches = [s for s in symbols if s.name == name]
+            matches = [(path, s) for s in matches]
+        else:
+            if not Path(directory).is_dir():
+                return f"Error: Directory {directory} does not exist"
+            matches = _indexed_symbols(directory, name, None)
+            # 模糊匹配的结果只作为候选，不直接返回源码
+            matches = [
+                (p, s) for p, s in matches
+                if s.name == name or s.qualname == name or s.qualname.endswith("." + name)
+            ]
+
+        # 优先返回定义而不是导入
+        definitions = [(p, s) for p, s in matches if s.kind != "import"]
+        matches = definitions or matches
+
+        if not matches:
+            location = file_path or directory
+            return f"No definition found for '{name}' in {location}. Use find_symbol to search."
+        if len(matches) > 1:
+            return (
+                f"Multiple definitions found for '{name}'; pass a qualified name or file_path:\n"
+                + "\n".join(_format_symbol(p, s) for p, s in matches[:20])
+            )
+
+        path, symbol = matches[0]
+        file_cache = get_file_cache()
+        data = None
+        if path.stat().st_size <= file_cache.max_file_bytes:
+            data = file_cache.get_bytes(path)
+        source = get_line_index(path, data).read_lines(
+            symbol.start_line - 1, symbol.end_line - symbol.start_line + 1, data
+        )
+        return (
+            f"Source of {symbol.kind} {symbol.qualname} in {path} "
+            f"(lines {symbol.start_line}-{symbol.end_line}):\n\n{source}"
+        )
+    except SyntaxError as e:
+        return f"Error: Cannot parse {file_path}: {str(e)}"
+    except Exception as e:
+        return f"Error getting source of '{name}': {str(e)}"
+
+
+def get_symbol_tools() -> list:
+    """获取符号工具列表"""
+    return [find_symbol, get_symbol_source]
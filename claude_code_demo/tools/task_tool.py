@@ -103,15 +103,53 @@ class TaskToolManager:
             result = agent.invoke({
                 "messages": [HumanMessage(content=description)]
             })
+            return self._format_result(description, subagent_type, result)
 
-            # 提取最终响应
-            final_message = result["messages"][-1]
-            response_content = final_message.content
+        except Exception as e:
+            print(f"❌ SubAgent [{subagent_type}] failed: {e}")
+            return f"SubAgent [{subagent_type}] execution failed: {str(e)}"
+
+    async def aexecute_task(
+        self,
+        description: str,
+        subagent_type: Literal["general-purpose", "code-analyzer", "document-writer"]
+    ) -> str:
+        """
+        异步执行 SubAgent 任务（工具节点超时取消时，SubAgent 在下一个取消点中止）
+
+        Args:
+            description: 任务描述
+            subagent_type: SubAgent 类型
+
+        Returns:
+            SubAgent 执行结果
+        """
+        agent = self.subagents.get(subagent_type)
+        if not agent:
+            return f"Error: Unknown SubAgent type: {subagent_type}"
+
+        try:
+            print(f"🤖 Launching SubAgent [{subagent_type}]: {description}")
+            result = await agent.ainvoke({
+                "messages": [HumanMessage(content=description)]
+            })
+            return self._format_result(description, subagent_type, result)
+
+        except Exception as e:
+            print(f"❌ SubAgent [{subagent_type}] failed: {e}")
+            return f"SubAgent [{subagent_type}] execution failed: {str(e)}"
 
-            print(f"✅ SubAgent [{subagent_type}] completed")
+    @staticmethod
+    def _format_result(description: str, subagent_type: str, result: dict) -> str:
+        """提取 SubAgent 的最终响应并格式化"""
+        # 提取最终响应
+        final_message = result["messages"][-1]
+        response_content = final_message.content
 
-            # 返回格式化结果
-            return f"""SubAgent [{subagent_type}] execution completed:
+        print(f"✅ SubAgent [{subagent_type}] completed")
+
+        # 返回格式化结果
+        return f"""SubAgent [{subagent_type}] execution completed:
 
 Task: {description}
 
@@ -120,10 +158,6 @@ Result:
 
 Note: This result was generated by a specialized SubAgent. Please summarize key information for the user as needed."""
 
-        except Exception as e:
-            print(f"❌ SubAgent [{subagent_type}] failed: {e}")
-            return f"SubAgent [{subagent_type}] execution failed: {str(e)}"
-
 
 def create_task_tool(llm, base_tools: list, subagent_configs: list[SubAgentConfig]):
     """
@@ -156,4 +190,12 @@ def create_task_tool(llm, base_tools: list, subagent_configs: list[SubAgentConfi
         """
         return manager.execute_task(description, subagent_type)
 
+    async def atask_tool(
+        description: str,
+        subagent_type: Literal["general-purpose", "code-analyzer", "document-writer"]
+    ) -> str:
+        return await manager.aexecute_task(description, subagent_type)
+
+    # 异步调用直接在事件循环中运行 SubAgent，可以被超时取消
+    task_tool.coroutine = atask_tool
     return task_tool
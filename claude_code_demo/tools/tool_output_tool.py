@@ -0,0 +1,143 @@
+"""
+工具输出分页模块
+过大的工具输出保存到本地 Blob 存储，ToolMessage 中只保留预览和句柄，
+需要时通过 read_tool_output 分页读取
+"""
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import tool
+
+from config import ToolOutputConfig
+from utils.async_io import with_async_io
+from utils.blob_store import get_blob_store, is_handle
+
+
+# 工具输出配置（由 configure_tool_output 在构建图时设置）
+_tool_output_config = ToolOutputConfig()
+
+
+def configure_tool_output(config: ToolOutputConfig):
+    """设置工具输出的转存配置"""
+    global _tool_output_config
+    _tool_output_config = config
+
+
+def _blob_store():
+    """按当前配置获取转存用的 Blob 存储"""
+    config = _tool_output_config
+    max_bytes = config.max_store_mb * 1024 * 1024 if config.max_store_mb else None
+    return get_blob_store(config.blob_dir, max_bytes)
+
+
+def spill_tool_message(message: ToolMessage) -> ToolMessage:
+    """
+    输出超过阈值时转存到 Blob 存储，返回只包含预览和句柄的消息
+
+    Args:
+        message: 工具消息
+
+    Returns:
+        原消息（未超过阈值）或替换了内容的新消息
+    """
+    config = _tool_output_config
+    content = message.content
+    if (not config.enabled
+            or not isinstance(content, str)
+            or len(content) <= config.spill_threshold_chars
+            or message.name == "read_tool_output"):
+        return message
+    return _spill(message, config.preview_chars)
+
+
+def truncate_tool_message(message: ToolMessage, preview_chars: int = None) -> ToolMessage:
+    """
+    不论阈值，把工具输出转存到 Blob 存储并只保留预览（请求即将超出上下文时使用）
+
+    Args:
+        message: 工具消息
+        preview_chars: 保留的预览字符数，None 表示使用配置值
+
+    Returns:
+        原消息（内容不是字符串或不长于预览）或替换了内容的新消息
+    """
+    preview_chars = preview_chars or _tool_output_config.preview_chars
+    if not isinstance(message.content, str) or len(message.content) <= preview_chars:
+        return message
+    return _spill(message, preview_chars)
+
+
+def _spill(message: ToolMessage, preview_chars: int) -> ToolMessage:
+    """保存完整输出，返回只包含预览和句柄的消息"""
+    content = message.content
+    handle = _blob_store().put(content)
+    total_lines = content.count("\n") + 1
+
+    # 预览在行边界截断
+    preview = content[:preview_chars]
+    if "\n" in preview and len(content) > len(preview):
+        preview = preview[:preview.rfind("\n")]
+    preview_lines = preview.count("\n") + 1
+
+    notice = (
+        f"[Output of {message.name or 'tool'} was {len(content)} characters ({total_lines} lines); "
+        f"showing the first {preview_lines} lines. The full output is stored with handle \"{handle}\". "
+        f"Use read_tool_output(handle=\"{handle}\", offset={preview_lines + 1}) to read the rest.]"
+    )
+    return message.model_copy(update={"content": f"{preview}\n\n{notice}"})
+
+
+@with_async_io
+@tool
+def read_tool_output(handle: str, offset: int = 1, limit: int = 200) -> str:
+    """
+    分页读取被转存的工具输出
+
+    工具输出过大时，消息中只包含开头部分和一个句柄，用本工具按行读取其余内容。
+
+    Args:
+        handle: 工具输出中给出的句柄
+        offset: 起始行号（从 1 开始），默认 1
+        limit: 读取的行数，默认 200
+
+    Returns:
+        输出内容
+    """
+    if offset < 1:
+        return f"Error: offset must be >= 1, got {offset}"
+    if limit < 1:
+        return f"Error: limit must be >= 1, got {limit}"
+
+    content = _blob_store().get(handle)
+    if content is None:
+        if is_handle(handle):
+            return (
+                f"Error: Tool output {handle} has expired (evicted to keep the output store "
+                "within its size limit). Re-run the original tool call to get the output again."
+            )
+        return f"Error: No stored tool output for handle {handle}"
+
+    lines = content.split("\n")
+    total_lines = len(lines)
+    start = offset - 1
+    if start >= total_lines:
+        return f"Error: offset {offset} exceeds total line count {total_lines}"
+
+    # 单页不超过转存阈值，避免分页结果本身过大
+    max_chars = _tool_output_config.spill_threshold_chars
+    page = []
+    size = 0
+    for line in lines[start:start + limit]:
+        if page and size + len(line) + 1 > max_chars:
+            break
+        page.append(line[:max_chars])
+        size += len(line) + 1
+    end = start + len(page)
+
+    result = f"Tool output {handle} (lines {start + 1}-{end} of {total_lines}):\n\n" + "\n".join(page)
+    if end < total_lines:
+        result += f"\n\n[Use offset={end + 1} to continue reading.]"
+    return result
+
+
+def get_tool_output_tools() -> list:
+    """获取工具输出分页工具列表"""
+    return [read_tool_output]
@@ -0,0 +1,121 @@
+"""
+异步 I/O 模块
+为文件工具提供有界的专用 I/O 线程池，让阻塞的文件操作不占用事件循环和默认执行器
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.tools import BaseTool
+
+
+# 默认 I/O 线程数
+DEFAULT_IO_MAX_WORKERS = 8
+
+# 当前调用提交到 I/O 线程池的任务（由 track_io_calls 设置），
+# 超时的调用被放弃后，调用方可以据此确认工作线程何时真正结束
+_io_tracker: contextvars.ContextVar = contextvars.ContextVar("io_tracker", default=None)
+
+_io_executor: ThreadPoolExecutor = None
+_io_max_workers = DEFAULT_IO_MAX_WORKERS
+_io_executor_lock = threading.Lock()
+
+
+def configure_io_executor(max_workers: int = None):
+    """
+    设置 I/O 线程池大小
+
+    已创建的线程池在线程数变化时会被替换，旧线程池中的任务继续执行完毕。
+
+    Args:
+        max_workers: 最大线程数，None 表示使用默认值
+    """
+    global _io_executor, _io_max_workers
+    max_workers = max_workers or DEFAULT_IO_MAX_WORKERS
+    with _io_executor_lock:
+        if max_workers == _io_max_workers:
+            return
+        _io_max_workers = max_workers
+        old_executor, _io_executor = _io_executor, None
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """获取进程内共享的 I/O 线程池"""
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=_io_max_workers,
+                thread_name_prefix="file-io"
+            )
+        return _io_executor
+
+
+async def run_io(func, *args, **kwargs):
+    """
+    在 I/O 线程池中运行阻塞函数
+
+    Args:
+        func: 阻塞函数
+        *args: 位置参数
+        **kwargs: 关键字参数
+
+    Returns:
+        函数返回值
+    """
+    # 复制上下文，保证回调和追踪信息在工作线程中可用
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    future = get_io_executor().submit(call)
+    tracker = _io_tracker.get()
+    if tracker is not None:
+        tracker.append(future)
+    return await asyncio.wrap_future(future)
+
+
+@contextlib.contextmanager
+def track_io_calls():
+    """
+    记录当前上下文中（包括其中创建的任务）提交到 I/O 线程池的任务
+
+    工作线程无法被取消：协程超时后线程仍会执行完毕，调用方用记录的任务判断线程何时真正结束。
+
+    Yields:
+        concurrent.futures.Future 列表，随提交的任务增长
+    """
+    futures = []
+    token = _io_tracker.set(futures)
+    try:
+        yield futures
+    finally:
+        _io_tracker.reset(token)
+
+
+def with_async_io(sync_tool: BaseTool) -> BaseTool:
+    """
+    为同步工具添加异步实现
+
+    异步调用（ainvoke）在 I/O 线程池中执行同一个同步函数，
+    同步调用（invoke）保持不变，可继续在脚本和 notebook 中使用。
+
+    Args:
+        sync_tool: 由 @tool 创建的同步工具
+
+    Returns:
+        同一个工具对象
+    """
+    func = sync_tool.func
+
+    @functools.wraps(func)
+    async def coroutine(*args, **kwargs):
+        return await run_io(func, *args, **kwargs)
+
+    # 工作线程无法被取消，工具节点据此判断超时能否真正中止调用
+    coroutine.runs_in_io_thread = True
+    sync_tool.coroutine = coroutine
+    return sync_tool
@@ -0,0 +1,179 @@
+"""
+Blob 存储模块
+按内容寻址（sha256）把大块文本保存到本地磁盘，用于存放过大的工具输出
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+from utils.file_ops import atomic_write_text
+
+# 句柄：内容 sha256 的前 32 个十六进制字符
+HANDLE_LENGTH = 32
+_HANDLE_PATTERN = re.compile(rf"[0-9a-f]{{{HANDLE_LENGTH}}}\Z")
+
+
+def is_handle(handle: str) -> bool:
+    """字符串是否为格式正确的句柄（不检查内容是否存在）"""
+    return bool(_HANDLE_PATTERN.match(handle.strip().lower()))
+
+
+class BlobStore:
+    """
+    内容寻址的 Blob 存储
+
+    相同内容只保存一次；文件按句柄前两位分目录存放（root/ab/abcdef....txt），
+    写入是原子的，并发写入同一内容也是安全的。
+    总大小超过上限时按最近使用时间（文件 mtime，读取时更新）淘汰最旧的内容，
+    被淘汰的句柄之后读取会返回 None。
+    """
+
+    def __init__(self, root: str, max_bytes: Optional[int] = None):
+        """
+        初始化存储
+
+        Args:
+            root: 存储目录
+            max_bytes: 存储的最大总字节数，None 表示不限制
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        # 句柄 -> (最近使用时间, 字节数)，首次需要时扫描目录建立
+        self._index: Optional[dict] = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.root, handle[:2], f"{handle}.txt")
+
+    def _load_index_locked(self):
+        """扫描存储目录，建立句柄索引（调用方需持有锁）"""
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total_bytes = 0
+        try:
+            prefixes = os.listdir(self.root)
+        except OSError:
+            return
+        for prefix in prefixes:
+            directory = os.path.join(self.root, prefix)
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                handle = name[:-len(".txt")]
+                if not name.endswith(".txt") or not _HANDLE_PATTERN.match(handle):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                self._index[handle] = (stat.st_mtime, stat.st_size)
+                self._total_bytes += stat.st_size
+
+    def _evict_locked(self, keep: str):
+        """按最近使用时间淘汰内容直到符合总大小上限，不淘汰刚写入的 keep（调用方需持有锁）"""
+        if self.max_bytes is None or self._total_bytes <= self.max_bytes:
+            return
+        for handle, (_, size) in sorted(self._index.items(), key=lambda item: item[1][0]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if handle == keep:
+                continue
+            try:
+                os.remove(self._path(handle))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            del self._index[handle]
+            self._total_bytes -= size
+
+    def put(self, content: str) -> str:
+        """
+        保存文本
+
+        Args:
+            content: 文本内容
+
+        Returns:
+            句柄
+        """
+        handle = hashlib.sha256(content.encode("utf-8")).hexdigest()[:HANDLE_LENGTH]
+        path = self._path(handle)
+        with self._lock:
+            self._load_index_locked()
+            if os.path.exists(path):
+                self._touch_locked(handle)
+                return handle
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write_text(path, content)
+            size = os.path.getsize(path)
+            old = self._index.get(handle)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._index[handle] = (time.time(), size)
+            self._total_bytes += size
+            self._evict_locked(handle)
+        return handle
+
+    def _touch_locked(self, handle: str):
+        """更新内容的最近使用时间（调用方需持有锁）"""
+        now = time.time()
+        try:
+            os.utime(self._path(handle), (now, now))
+        except OSError:
+            return
+        if self._index is not None and handle in self._index:
+            self._index[handle] = (now, self._index[handle][1])
+
+    def get(self, handle: str) -> Optional[str]:
+        """
+        读取文本
+
+        Args:
+            handle: put 返回的句柄
+
+        Returns:
+            文本内容，句柄无效或内容不存在（包括已被淘汰）时返回 None
+        """
+        handle = handle.strip().lower()
+        if not _HANDLE_PATTERN.match(handle):
+            return None
+        try:
+            with open(self._path(handle), "r", encoding="utf-8", newline="") as f:
+                content = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self._touch_locked(handle)
+        return content
+
+
+# 进程内的存储实例缓存：目录 -> 存储
+_stores: dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(root: str, max_bytes: Optional[int] = None) -> BlobStore:
+    """
+    获取目录对应的 Blob 存储（同一进程内复用）
+
+    Args:
+        root: 存储目录
+        max_bytes: 存储的最大总字节数，None 表示不限制（已有实例时更新其上限）
+    """
+    key = os.path.abspath(root)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = BlobStore(key, max_bytes)
+            _stores[key] = store
+        else:
+            store.max_bytes = max_bytes
+        return store
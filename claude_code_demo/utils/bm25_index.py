@@ -0,0 +1,332 @@
+"""
+BM25 索引模块
+为 rank_search 提供本地、离线的倒排索引：标识符拆分为子词，按 BM25 对文件排序，
+再在排名靠前的文件中定位最相关的行范围
+"""
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Optional
+
+from utils.file_cache import get_file_cache
+from utils.workspace_snapshot import workspace_stat
+
+# 索引格式版本，分词规则变化时递增，旧索引会被自动弃用
+BM25_INDEX_VERSION = 1
+
+# 超过该大小的文件（通常是生成文件或压缩代码）不建立索引
+MAX_INDEXED_FILE_BYTES = 1024 * 1024
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"[A-Za-z0-9]+")
+# 驼峰拆分：HTTPServerError -> HTTP / Server / Error，retry2Times -> retry / 2 / Times
+_SUBWORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+# 查询中常见的自然语言虚词，不参与打分
+_STOPWORDS = frozenset(
+    "a an and are as at be by code do does for from how i in is it of on or the this "
+    "to what where which who why with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    分词：按非字母数字切分，再将 snake_case/camelCase 标识符拆分为子词
+
+    完整标识符（小写）和各个子词都会作为词项，
+    例如 getRetryPolicy -> getretrypolicy、get、retry、policy。
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        lowered = word.lower()
+        if len(lowered) > 1:
+            tokens.append(lowered)
+        parts = _SUBWORD.findall(word)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts if len(p) > 1)
+    return tokens
+
+
+def tokenize_query(query: str) -> list[str]:
+    """查询分词（去重并去掉虚词）"""
+    seen = []
+    for token in tokenize(query):
+        if token not in _STOPWORDS and token not in seen:
+            seen.append(token)
+    return seen
+
+
+class BM25Index:
+    """
+    BM25 倒排索引
+
+    - 以文件为文档：每个文件记录 (mtime_ns, size) 和词频，文件变化时增量更新
+    - 查询时先按 BM25 对文件排序，再只读取排名靠前的文件定位最相关的行范围
+    - 索引持久化到 SQLite，与三元组索引、符号索引放在同一缓存目录
+    """
+
+    def __init__(self, root: str, cache_dir: str):
+        """
+        初始化索引
+
+        Args:
+            root: 工作区根目录
+            cache_dir: 索引文件存储目录
+        """
+        self.root = os.path.realpath(root)
+        digest = hashlib.sha1(self.root.encode("utf-8")).hexdigest()[:16]
+        self.db_path = os.path.join(cache_dir, f"bm25-v{BM25_INDEX_VERSION}-{digest}.sqlite3")
+
+        # 相对路径 -> (mtime_ns, size, 文档长度, 词项元组)
+        self._entries: dict[str, tuple[int, int, int, tuple]] = {}
+        # 词项 -> {相对路径: 词频}
+        self._postings: dict[str, dict[str, int]] = {}
+        self._total_length = 0
+        self._dirty: dict[str, Counter] = {}
+        self._removed: set[str] = set()
+        self._lock = threading.Lock()
+
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开索引数据库（不存在时创建）"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, terms TEXT)"
+        )
+        return conn
+
+    def _load(self):
+        """从磁盘加载索引并重建倒排表"""
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute("SELECT path, mtime_ns, size, terms FROM files").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # 索引损坏时从空索引开始重建
+            rows = []
+
+        for rel_path, mtime_ns, size, packed in rows:
+            counts = Counter()
+            if packed:
+                # 每项为 "词项 词频"，以换行分隔
+                for item in packed.split("\n"):
+                    term, _, tf = item.rpartition(" ")
+                    counts[term] = int(tf)
+            self._add_locked(rel_path, mtime_ns, size, counts)
+
+    def _add_locked(self, rel_path: str, mtime_ns: int, size: int, counts: Counter):
+        """加入一个文件（调用方需持有锁或处于初始化阶段）"""
+        self._remove_locked(rel_path)
+        length = sum(counts.values())
+        self._entries[rel_path] = (mtime_ns, size, length, tuple(counts))
+        self._total_length += length
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[rel_path] = tf
+
+    def _remove_locked(self, rel_path: str):
+        """移除一个文件（调用方需持有锁）"""
+        entry = self._entries.pop(rel_path, None)
+        if entry is None:
+            return
+        self._total_length -= entry[2]
+        for term in entry[3]:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(rel_path, None)
+                if not posting:
+                    del self._postings[term]
+
+    def refresh(self, files: list, prune: bool = False, prefix: str = "."):
+        """
+        按 mtime/size 增量更新索引
+
+        Args:
+            files: [(文件路径, 相对于工作区根目录的路径), ...]
+            prune: files 是否为 prefix 目录下完整的文件列表（是则删除该目录下其中没有的条目）
+            prefix: files 所在的目录（相对于工作区根目录）
+        """
+        file_cache = get_file_cache()
+        for file_path, rel_path in files:
+            try:
+                stat = workspace_stat(file_path)
+            except OSError:
+                continue
+            entry = self._entries.get(rel_path)
+            if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                continue
+
+            counts = Counter()
+            if stat.st_size <= MAX_INDEXED_FILE_BYTES:
+                try:
+                    counts = Counter(tokenize(
+                        file_cache.get_bytes(file_path).decode('utf-8', errors='replace')
+                    ))
+                except OSError:
+                    continue
+            with self._lock:
+                self._add_locked(rel_path, stat.st_mtime_ns, stat.st_size, counts)
+                self._dirty[rel_path] = counts
+                self._removed.discard(rel_path)
+
+        if prune:
+            seen = {rel_path for _, rel_path in files}
+            under = "" if prefix == "." else prefix.rstrip(os.sep) + os.sep
+            with self._lock:
+                for rel_path in list(self._entries):
+                    if rel_path.startswith(under) and rel_path not in seen:
+                        self._remove_locked(rel_path)
+                        self._dirty.pop(rel_path, None)
+                        self._removed.add(rel_path)
+
+    def rank(
+        self,
+        terms: list[str],
+        top_k: int,
+        path_filter=None,
+        path_prefix: str = "."
+    ) -> list[tuple[str, float]]:
+        """
+        按 BM25 对文件排序（IDF 和平均文档长度按整个工作区统计）
+
+        Args:
+            terms: 查询词项
+            top_k: 返回的文件数
+            path_filter: 可选的过滤函数，接收相对路径
+            path_prefix: 只返回该目录（相对于工作区根目录）下的文件
+
+        Returns:
+            [(相对路径, 得分), ...]，得分从高到低
+        """
+        with self._lock:
+            doc_count = len(self._entries)
+            if doc_count == 0:
+                return []
+            avg_length = self._total_length / doc_count or 1.0
+
+            scores: dict[str, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for rel_path, tf in posting.items():
+                    length = self._entries[rel_path][2]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    scores[rel_path] = scores.get(rel_path, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        under = "" if path_prefix == "." else path_prefix.rstrip(os.sep) + os.sep
+        ranked = sorted(
+            (item for item in scores.items() if item[0].startswith(under)),
+            key=lambda item: (-item[1], item[0])
+        )
+        if path_filter is not None:
+            ranked = [item for item in ranked if path_filter(item[0])]
+        return ranked[:top_k]
+
+    def idf(self, term: str) -> float:
+        """词项的 IDF"""
+        with self._lock:
+            doc_count = len(self._entries)
+            df = len(self._postings.get(term, ()))
+        return math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+    def save(self):
+        """将增量变化写回磁盘"""
+        with self._lock:
+            if not self._dirty and not self._removed:
+                return
+            rows = []
+            for rel_path, counts in self._dirty.items():
+                mtime_ns, size, _, _ = self._entries[rel_path]
+                packed = "\n".join(f"{term} {tf}" for term, tf in counts.items())
+                rows.append((rel_path, mtime_ns, size, packed))
+            removed = [(rel_path,) for rel_path in self._removed]
+            self._dirty.clear()
+            self._removed.clear()
+
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", rows)
+                    conn.executemany("DELETE FROM files WHERE path = ?", removed)
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError):
+            # 持久化失败不影响本次查询结果
+            pass
+
+
+def best_window(lines: list[str], weights: dict[str, float], window: int = 30) -> tuple[int, int, list]:
+    """
+    在文件中找出查询词项加权命中最多的连续行范围
+
+    Args:
+        lines: 文件的所有行
+        weights: 词项 -> 权重（通常为 IDF）
+        window: 行范围的最大长度
+
+    Returns:
+        (起始行, 结束行, 预览)：行号从 1 开始，预览为范围内得分最高的至多 3 行 [(行号, 内容), ...]
+    """
+    line_scores = []
+    for line in lines:
+        tokens = set(tokenize(line))
+        line_scores.append(sum(weights[t] for t in tokens if t in weights))
+
+    best_start, best_score, current = 0, -1.0, 0.0
+    for i, score in enumerate(line_scores):
+        current += score
+        if i >= window:
+            current -= line_scores[i - window]
+        start = max(0, i - window + 1)
+        if current > best_score:
+            best_start, best_score = start, current
+
+    # 收缩到范围内第一个和最后一个命中的行
+    hits = [i for i in range(best_start, min(best_start + window, len(lines))) if line_scores[i] > 0]
+    if not hits:
+        return 1, min(window, len(lines)), []
+    preview_lines = sorted(sorted(hits, key=lambda i: -line_scores[i])[:3])
+    preview = [(i + 1, lines[i].strip()[:200]) for i in preview_lines]
+    return hits[0] + 1, hits[-1] + 1, preview
+
+
+# 进程内的索引实例缓存：工作区根目录 -> 索引
+_indexes: dict[str, BM25Index] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index(root: str, cache_dir: str) -> Optional[BM25Index]:
+    """
+    获取工作区的 BM25 索引（同一进程内复用）
+
+    Args:
+        root: 工作区根目录
+        cache_dir: 索引文件存储目录
+
+    Returns:
+        索引实例，无法创建时返回 None
+    """
+    key = os.path.realpath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            try:
+                index = BM25Index(key, cache_dir)
+            except OSError:
+                return None
+            _indexes[key] = index
+        return index
@@ -2,8 +2,12 @@
 压缩逻辑模块
 实现 Claude Code 的 8 段式压缩策略
 """
+import asyncio
+import contextvars
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Sequence
+from typing import Optional, Sequence
 from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, SystemMessage
 
 from prompts.compression_prompts import (
@@ -11,7 +15,7 @@ from prompts.compression_prompts import (
     format_compression_result,
     get_compression_system_prompt
 )
-from utils.token_counter import get_latest_token_usage, estimate_tokens
+from utils.token_counter import RequestSizer, estimate_tokens
 
 
 def get_messages_to_keep(messages: Sequence[BaseMessage]) -> list[BaseMessage]:
@@ -147,32 +151,74 @@ async def compress_messages(
         }
 
 
+def _strip_usage(msg: BaseMessage) -> BaseMessage:
+    """
+    去掉保留的 AI 消息中的 usage 信息
+
+    压缩前的 usage 反映的是压缩前的请求大小，保留它会让请求估算以旧值为锚点而反复触发压缩。
+    """
+    if not isinstance(msg, AIMessage):
+        return msg
+    metadata = {k: v for k, v in (msg.response_metadata or {}).items() if k not in ("usage", "token_usage")}
+    return msg.model_copy(update={"usage_metadata": None, "response_metadata": metadata})
+
+
 def should_compress_now(
     messages: Sequence[BaseMessage],
     max_tokens: int,
-    threshold: float = 0.92
+    threshold: float = 0.92,
+    estimated_tokens: Optional[int] = None,
+    sizer: Optional[RequestSizer] = None
 ) -> bool:
     """
     判断是否应该立即压缩
 
+    按下一次请求的完整大小判断：消息（含工具调用参数）、系统提示词和工具定义。
+
     Args:
         messages: 消息列表
         max_tokens: 最大 token 数
         threshold: 压缩阈值
+        estimated_tokens: 已知的消息估算值（如 Token 账本的总数），没有 usage 信息时使用
+        sizer: 请求大小估算器，None 表示只估算消息
 
     Returns:
         是否应该压缩
     """
-    current_tokens = get_latest_token_usage(messages)
+    current_tokens = (sizer or RequestSizer()).estimate(messages, estimated_tokens)
     trigger_tokens = int(max_tokens * threshold)
 
     return current_tokens >= trigger_tokens
 
 
+# 最多为多少个会话保留后台摘要，超过时丢弃最久未活动会话的摘要（长期运行的服务中空闲会话不会一直占用内存）
+_MAX_SPECULATIVE_THREADS = 16
+
+
+@dataclass
+class _SpeculativeSummary:
+    """后台预先生成的摘要"""
+    prefix_ids: list  # 被摘要的消息 ID（按顺序）
+    task: asyncio.Task  # 生成摘要的任务，结果为 compress_messages() 的返回值
+
+
 class CompressionManager:
-    """压缩管理器"""
+    """
+    压缩管理器
+
+    设置了 speculative_threshold 时，使用量超过该水位后会在后台为较早的消息生成摘要，
+    Agent 继续工作；达到压缩阈值时直接换入预先生成的摘要，只需补充摘要之后的少量新消息。
+    """
 
-    def __init__(self, llm, max_tokens: int = 100000, threshold: float = 0.92):
+    def __init__(
+        self,
+        llm,
+        max_tokens: int = 100000,
+        threshold: float = 0.92,
+        sizer: Optional[RequestSizer] = None,
+        speculative_threshold: Optional[float] = None,
+        patch_max_ratio: float = 0.05
+    ):
         """
         初始化压缩管理器
 
@@ -180,39 +226,177 @@ class CompressionManager:
             llm: 语言模型
             max_tokens: 最大 token 数
             threshold: 压缩阈值
+            sizer: 请求大小估算器（包含 Agent 的工具定义和系统提示词）
+            speculative_threshold: 开始在后台预先生成摘要的水位，None 表示不预先生成
+            patch_max_ratio: 摘要之后新增的待压缩消息不超过 max_tokens 的该比例时原样保留，
+                否则把它们与预先生成的摘要一起再摘要一次
         """
         self.llm = llm
         self.max_tokens = max_tokens
         self.threshold = threshold
+        self.sizer = sizer or RequestSizer()
+        self.speculative_threshold = speculative_threshold
+        self.patch_max_ratio = patch_max_ratio
         self.compression_history = []
+        # 会话 ID -> 后台摘要（同一个图可以服务多个会话），按最近活动排序
+        self._speculative: "OrderedDict[Optional[str], _SpeculativeSummary]" = OrderedDict()
 
     async def compress_if_needed(
         self,
-        messages: Sequence[BaseMessage]
+        messages: Sequence[BaseMessage],
+        estimated_tokens: Optional[int] = None,
+        thread_id: Optional[str] = None
     ) -> tuple[bool, list[BaseMessage], dict]:
         """
-        如果需要则压缩消息
+        如果需要则压缩消息；超过预生成水位时在后台开始生成摘要
 
         Args:
             messages: 消息列表
+            estimated_tokens: 已知的估算值（如 Token 账本的总数），没有 usage 信息时使用
+            thread_id: 会话 ID，用于区分不同会话的后台摘要
 
         Returns:
             (是否进行了压缩, 新的消息列表, 统计信息)
         """
         # 检查是否需要压缩
-        if not should_compress_now(messages, self.max_tokens, self.threshold):
+        if not should_compress_now(messages, self.max_tokens, self.threshold, estimated_tokens, self.sizer):
+            if self.speculative_threshold is not None and should_compress_now(
+                messages, self.max_tokens, self.speculative_threshold, estimated_tokens, self.sizer
+            ):
+                self._start_speculation(messages, thread_id)
             return False, list(messages), {}
 
-        print("🔄 Context compression triggered (usage > 92%)")
+        print(f"🔄 Context compression triggered (usage > {self.threshold:.0%})")
+        return await self.compress(messages, thread_id)
+
+    def _start_speculation(self, messages: Sequence[BaseMessage], thread_id: Optional[str]):
+        """在后台为当前较早的消息生成摘要（已有可用的后台摘要时不重复生成）"""
+        speculation = self._speculative.get(thread_id)
+        if speculation is not None:
+            if self._matches(speculation, messages):
+                self._speculative.move_to_end(thread_id)
+                return
+            self._discard(thread_id)
+
+        compress_msgs, _ = get_messages_to_compress(messages)
+        if not compress_msgs or any(msg.id is None for msg in compress_msgs):
+            return
+
+        # 在空的上下文中运行，摘要调用不会关联到当前图节点的回调和流式输出
+        task = asyncio.create_task(
+            compress_messages(self.llm, compress_msgs),
+            context=contextvars.Context()
+        )
+        self._speculative[thread_id] = _SpeculativeSummary(
+            prefix_ids=[msg.id for msg in compress_msgs],
+            task=task
+        )
+        while len(self._speculative) > _MAX_SPECULATIVE_THREADS:
+            self._discard(next(iter(self._speculative)))
+        print(f"⏳ Summarizing {len(compress_msgs)} earlier messages in the background")
+
+    @staticmethod
+    def _matches(speculation: _SpeculativeSummary, messages: Sequence[BaseMessage]) -> bool:
+        """后台摘要是否仍适用：被摘要的消息仍按原顺序位于历史的开头（可能已被压缩或删除）"""
+        if speculation.task.get_loop() is not asyncio.get_running_loop():
+            return False
+        ids = [msg.id for msg in messages if not isinstance(msg, SystemMessage)]
+        return ids[:len(speculation.prefix_ids)] == speculation.prefix_ids
+
+    def _discard(self, thread_id: Optional[str]):
+        """丢弃后台摘要（取消未完成的任务）"""
+        speculation = self._speculative.pop(thread_id, None)
+        if speculation is not None and not speculation.task.done():
+            speculation.task.cancel()
+
+    async def _take_speculation(
+        self,
+        compress_msgs: list[BaseMessage],
+        messages: Sequence[BaseMessage],
+        thread_id: Optional[str]
+    ) -> Optional[tuple[str, dict, list[BaseMessage]]]:
+        """
+        取出可用的后台摘要，并补充摘要之后新增的待压缩消息
+
+        Returns:
+            (摘要, 统计信息, 原样保留在摘要之后的消息)；没有可用的后台摘要时返回 None
+        """
+        speculation = self._speculative.get(thread_id)
+        if speculation is None:
+            return None
+        prefix_length = len(speculation.prefix_ids)
+        compress_ids = [msg.id for msg in compress_msgs[:prefix_length]]
+        if not self._matches(speculation, messages) or compress_ids != speculation.prefix_ids:
+            self._discard(thread_id)
+            return None
+        del self._speculative[thread_id]
+
+        # 任务尚未完成时等待剩余部分，仍比重新开始生成快
+        if speculation.task.cancelled():
+            return None
+        summary, stats = await speculation.task
+        if "error" in stats:
+            return None
+
+        new_msgs = compress_msgs[prefix_length:]
+        patched_msgs = []
+        if new_msgs:
+            if estimate_tokens(new_msgs) <= self.max_tokens * self.patch_max_ratio:
+                # 新增的消息不多，原样保留在摘要之后
+                patched_msgs = new_msgs
+            else:
+                # 新增的消息较多，与预先生成的摘要一起再摘要一次（仍远小于完整的历史）
+                summary, stats = await compress_messages(
+                    self.llm, [AIMessage(content=summary)] + new_msgs
+                )
+                if "error" in stats:
+                    return None
+
+        original_tokens = estimate_tokens(compress_msgs)
+        compressed_tokens = estimate_tokens([AIMessage(content=summary)] + patched_msgs)
+        return summary, {
+            **stats,
+            "original_tokens": original_tokens,
+            "compressed_tokens": compressed_tokens,
+            "saved_tokens": original_tokens - compressed_tokens,
+            "compression_ratio": (
+                (original_tokens - compressed_tokens) / original_tokens * 100
+                if original_tokens > 0 else 0
+            ),
+            "speculative": True
+        }, patched_msgs
+
+    async def compress(
+        self,
+        messages: Sequence[BaseMessage],
+        thread_id: Optional[str] = None
+    ) -> tuple[bool, list[BaseMessage], dict]:
+        """
+        立即压缩消息（不检查阈值，如 Agent 发现请求即将超出上下文时）
+
+        有可用的后台摘要时直接使用，否则同步生成摘要。
 
+        Args:
+            messages: 消息列表
+            thread_id: 会话 ID
+
+        Returns:
+            (是否进行了压缩, 新的消息列表, 统计信息)；没有可压缩的消息时不压缩
+        """
         # 分离消息
         compress_msgs, keep_msgs = get_messages_to_compress(messages)
 
         if not compress_msgs:
             return False, list(messages), {}
 
-        # 执行压缩
-        summary, stats = await compress_messages(self.llm, compress_msgs)
+        # 执行压缩：优先使用后台预先生成的摘要
+        result = await self._take_speculation(compress_msgs, messages, thread_id)
+        if result is not None:
+            print("⚡ Using the summary prepared in the background")
+            summary, stats, patched_msgs = result
+        else:
+            summary, stats = await compress_messages(self.llm, compress_msgs)
+            patched_msgs = []
 
         # 构建新的消息列表
         new_messages = []
@@ -222,18 +406,19 @@ class CompressionManager:
             if isinstance(msg, SystemMessage):
                 new_messages.append(msg)
 
-        # 添加压缩摘要
+        # 添加压缩摘要，以及摘要之后新增、原样保留的消息
         new_messages.append(AIMessage(content=summary))
+        new_messages.extend(_strip_usage(msg) for msg in patched_msgs)
 
         # 添加保留的消息
         for msg in keep_msgs:
             if msg not in new_messages:
-                new_messages.append(msg)
+                new_messages.append(_strip_usage(msg))
 
         # 记录压缩历史
         self.compression_history.append({
             **stats,
-            "removed_messages_count": len(compress_msgs)
+            "removed_messages_count": len(compress_msgs) - len(patched_msgs)
         })
 
         print(f"✅ Compression completed: {stats.get('compression_ratio', 0):.1f}% saved")
@@ -0,0 +1,143 @@
+"""
+文件内容缓存模块
+进程内共享的 LRU 文件内容缓存，供所有文件工具（包括多个会话和 SubAgent）复用
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from utils.workspace_snapshot import workspace_stat, refresh_workspace_path
+
+
+class FileContentCache:
+    """
+    文件内容 LRU 缓存
+
+    - 以 (realpath, mtime_ns, size) 为键，文件变化后自动失效
+    - 按缓存内容的总字节数限制大小，超过单文件上限的文件不缓存
+    - 写入类工具修改文件后应调用 invalidate
+    - 默认用工作区快照中的 stat 校验；读取后要写回的调用（编辑、补丁）传入 verify=True，
+      用真实的 os.stat 校验，避免快照尚未感知的外部修改被基于旧内容的编辑覆盖
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_file_bytes: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 缓存内容的最大总字节数
+            max_file_bytes: 可缓存的单个文件最大字节数，默认为 max_bytes 的 1/8
+        """
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes if max_file_bytes is not None else max_bytes // 8
+
+        # realpath -> (mtime_ns, size, data)
+        self._entries: "OrderedDict[str, tuple[int, int, bytes]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_bytes(self, file_path, verify: bool = False) -> bytes:
+        """
+        获取文件内容（字节）
+
+        Args:
+            file_path: 文件路径
+            verify: 是否用真实的 os.stat 校验缓存（快照中的 stat 可能滞后于外部修改）
+
+        Returns:
+            文件内容
+
+        Raises:
+            OSError: 文件无法读取
+        """
+        real_path = os.path.realpath(file_path)
+        stat = os.stat(real_path) if verify else workspace_stat(real_path)
+
+        with self._lock:
+            entry = self._entries.get(real_path)
+            if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                self._entries.move_to_end(real_path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        with open(real_path, 'rb') as f:
+            # 以实际读取时的 stat 作为键，避免 stat 与读取之间文件被修改
+            stat = os.fstat(f.fileno())
+            data = f.read()
+
+        if len(data) <= self.max_file_bytes:
+            self._put(real_path, stat.st_mtime_ns, stat.st_size, data)
+        return data
+
+    def get_text(self, file_path, verify: bool = False) -> str:
+        """获取文件内容（按 UTF-8 解码，换行统一为 \\n；verify 含义同 get_bytes）"""
+        data = self.get_bytes(file_path, verify)
+        return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+    def _put(self, real_path: str, mtime_ns: int, size: int, data: bytes):
+        """写入缓存并按总字节数淘汰最久未使用的条目"""
+        with self._lock:
+            old = self._entries.pop(real_path, None)
+            if old is not None:
+                self._total_bytes -= len(old[2])
+            self._entries[real_path] = (mtime_ns, size, data)
+            self._total_bytes += len(data)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        """淘汰最久未使用的条目直到符合总字节数上限（调用方需持有锁）"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._total_bytes -= len(evicted)
+            self.evictions += 1
+
+    def resize(self, max_bytes: int, max_file_bytes: Optional[int] = None):
+        """调整缓存大小上限（已缓存的内容按新上限淘汰）"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.max_file_bytes = max_file_bytes if max_file_bytes is not None else max_bytes // 8
+            self._evict_locked()
+
+    def invalidate(self, file_path):
+        """使文件的缓存失效（写入/编辑后调用），同时同步更新工作区快照"""
+        real_path = os.path.realpath(file_path)
+        with self._lock:
+            old = self._entries.pop(real_path, None)
+            if old is not None:
+                self._total_bytes -= len(old[2])
+        refresh_workspace_path(real_path)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": f"{(self.hits / total * 100) if total else 0:.1f}%"
+            }
+
+
+# 进程内共享的缓存实例
+_file_cache = FileContentCache()
+
+
+def get_file_cache() -> FileContentCache:
+    """获取进程内共享的文件内容缓存"""
+    return _file_cache
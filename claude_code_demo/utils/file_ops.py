@@ -0,0 +1,99 @@
+"""
+文件写入模块
+提供原子写入（临时文件 + os.replace）和变更差异生成
+"""
+import difflib
+import os
+
+
+def _create_temp_file(directory: str, name: str):
+    """
+    在目标目录中创建临时文件
+
+    以 0o666 创建，由内核按当前 umask 得到与普通 open() 新建文件相同的权限
+
+    Returns:
+        (文件描述符, 临时文件路径)
+    """
+    while True:
+        tmp_path = os.path.join(directory, f".{name}.{os.urandom(4).hex()}.tmp")
+        try:
+            return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+def _copy_ownership(tmp_path: str, stat: os.stat_result):
+    """尽量把原文件的属主、属组和权限复制到临时文件（无权修改属主时保留属组）"""
+    try:
+        os.chown(tmp_path, stat.st_uid, stat.st_gid)
+    except OSError:
+        try:
+            os.chown(tmp_path, -1, stat.st_gid)
+        except OSError:
+            pass
+    # chown 可能清除 setuid/setgid 位，权限放在最后设置
+    os.chmod(tmp_path, stat.st_mode & 0o7777)
+
+
+def atomic_write_text(file_path, content: str):
+    """
+    原子地写入文本文件
+
+    先写入同目录下的临时文件并 fsync，再通过 os.replace 替换目标文件，
+    读者只会看到旧内容或新内容，不会看到写了一半的文件。
+    符号链接会被解析，写入的是它指向的文件；已存在文件的权限、属主和属组会被保留。
+
+    Args:
+        file_path: 文件路径
+        content: 要写入的内容
+    """
+    path = os.path.realpath(file_path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        stat = None
+
+    directory, name = os.path.split(path)
+    fd, tmp_path = _create_temp_file(directory, name)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if stat is not None:
+            _copy_ownership(tmp_path, stat)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def unified_diff(file_path, old_content: str, new_content: str, max_lines: int = 200) -> str:
+    """
+    生成变更的统一差异（只包含变化的片段）
+
+    Args:
+        file_path: 文件路径（用于差异头）
+        old_content: 修改前的内容
+        new_content: 修改后的内容
+        max_lines: 最多返回的差异行数
+
+    Returns:
+        差异文本
+    """
+    diff_lines = list(difflib.unified_diff(
+        old_content.splitlines(),
+        new_content.splitlines(),
+        fromfile=str(file_path),
+        tofile=str(file_path),
+        n=2,
+        lineterm=""
+    ))
+    if len(diff_lines) > max_lines:
+        omitted = len(diff_lines) - max_lines
+        diff_lines = diff_lines[:max_lines] + [f"... ({omitted} more diff lines omitted)"]
+    return "\n".join(diff_lines)
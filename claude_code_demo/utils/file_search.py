@@ -0,0 +1,307 @@
+"""
+文件搜索模块
+为 search_in_files 提供并行、流式的文件扫描
+"""
+import codecs
+import mmap
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from utils.file_cache import get_file_cache
+from utils.file_walker import BINARY_SNIFF_SIZE, looks_binary
+from utils.workspace_snapshot import workspace_stat
+
+
+# 小于该大小的文件直接读取，更大的文件使用 mmap 避免整文件分配
+MMAP_THRESHOLD = 64 * 1024
+
+# 统计行号时每次复制的最大字节数
+_COUNT_CHUNK_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=256)
+def compile_matcher(pattern: str, regex: bool = False, ignore_case: bool = False) -> re.Pattern:
+    """
+    编译搜索模式（带缓存）
+
+    ASCII 模式编译为 bytes 正则，直接在文件字节上匹配；
+    含非 ASCII 字符的正则或忽略大小写模式需要 Unicode 语义，编译为 str 正则。
+
+    Args:
+        pattern: 搜索模式
+        regex: 是否按正则表达式解析
+        ignore_case: 是否忽略大小写
+
+    Returns:
+        编译后的正则
+
+    Raises:
+        re.error: 正则表达式无效
+    """
+    flags = re.MULTILINE
+    if ignore_case:
+        flags |= re.IGNORECASE
+
+    if not regex:
+        if not ignore_case or pattern.isascii():
+            return re.compile(re.escape(pattern.encode('utf-8')), flags)
+        return re.compile(re.escape(pattern), flags)
+
+    if pattern.isascii():
+        return re.compile(pattern.encode('utf-8'), flags)
+    return re.compile(pattern, flags)
+
+
+def _count_newlines(buffer, start: int, end: int, newline) -> int:
+    """分块统计区间内的换行数，避免一次性复制大段内容"""
+    count = 0
+    while start < end:
+        stop = min(end, start + _COUNT_CHUNK_SIZE)
+        count += buffer[start:stop].count(newline)
+        start = stop
+    return count
+
+
+def _normalize_newlines(buffer):
+    """与文本模式读取一致，把 \\r\\n 和单独的 \\r 统一为 \\n（不含 \\r 时原样返回，不复制）"""
+    if isinstance(buffer, str):
+        if '\r' not in buffer:
+            return buffer
+        return buffer.replace('\r\n', '\n').replace('\r', '\n')
+    if buffer.find(b'\r') == -1:
+        return buffer
+    return bytes(buffer[:]).replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+
+def _is_valid_utf8(buffer) -> bool:
+    """分块校验整个缓冲区是否为合法的 UTF-8（与按 UTF-8 严格解码整个文件的结果一致）"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    view = memoryview(buffer)
+    try:
+        for start in range(0, len(view), _COUNT_CHUNK_SIZE):
+            decoder.decode(view[start:start + _COUNT_CHUNK_SIZE])
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    finally:
+        view.release()
+    return True
+
+
+def _find_matching_lines(buffer, matcher: re.Pattern) -> list[str]:
+    """在缓冲区中查找匹配行，只解码匹配的行"""
+    newline = '\n' if isinstance(buffer, str) else b'\n'
+    size = len(buffer)
+
+    matches = []
+    line_no = 1
+    counted_to = 0
+    pos = 0
+    while pos <= size:
+        m = matcher.search(buffer, pos)
+        if m is None:
+            break
+
+        line_start = buffer.rfind(newline, 0, m.start()) + 1
+        line_end = buffer.find(newline, m.start())
+        if line_end == -1:
+            line_end = size
+
+        # 跨行的匹配不算，必须在单行内匹配
+        if matcher.search(buffer, line_start, line_end) is not None:
+            line_no += _count_newlines(buffer, counted_to, line_start, newline)
+            counted_to = line_start
+            line = buffer[line_start:line_end]
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            matches.append(f"  Line {line_no}: {line.strip()}")
+
+        pos = line_end + 1
+
+    return matches
+
+
+def scan_file(
+    file_path: Path,
+    matcher: re.Pattern,
+    on_read: Optional[Callable[[os.stat_result, Optional[str]], None]] = None
+) -> Optional[list[str]]:
+    """
+    扫描单个文件，返回格式化后的匹配行
+
+    小文件通过共享内容缓存读取；大文件通过 mmap 按字节匹配，
+    只有匹配的行会被解码。文件头看起来是二进制的文件直接跳过。
+    与按 UTF-8 文本模式读取的结果一致：\\r\\n 和单独的 \\r 都视为换行，
+    不是合法 UTF-8 的文件跳过。
+
+    Args:
+        file_path: 文件路径
+        matcher: compile_matcher 编译的正则
+        on_read: 读取文件后调用 on_read(stat, 文本)，文本为解码并统一换行后的内容，
+            二进制或非法 UTF-8 文件为 None（用于在同一次读取中更新搜索索引）
+
+    Returns:
+        匹配行列表，文件无法读取或没有匹配时返回 None
+    """
+    try:
+        stat = workspace_stat(file_path)
+        if stat.st_size < MMAP_THRESHOLD:
+            # 小文件通过共享内容缓存读取，重复搜索时无需再次读盘
+            buffer = get_file_cache().get_bytes(file_path)
+            if looks_binary(buffer[:BINARY_SNIFF_SIZE]):
+                if on_read is not None:
+                    on_read(stat, None)
+                return None
+            return _scan_buffer(buffer, matcher, on_read, stat)
+
+        with open(file_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            # 先只读取文件头判断是否为二进制文件
+            if looks_binary(f.read(BINARY_SNIFF_SIZE)):
+                if on_read is not None:
+                    on_read(stat, None)
+                return None
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _scan_buffer(mm, matcher, on_read, stat)
+    except Exception:
+        return None
+
+
+def _scan_buffer(
+    buffer,
+    matcher: re.Pattern,
+    on_read: Optional[Callable] = None,
+    stat: Optional[os.stat_result] = None
+) -> Optional[list[str]]:
+    """
+    在文件内容（bytes 或 mmap）中查找匹配行
+
+    Raises:
+        UnicodeDecodeError: 内容不是合法的 UTF-8（Unicode 语义的模式）
+    """
+    text = None
+    if on_read is not None or isinstance(matcher.pattern, str):
+        try:
+            text = _normalize_newlines(bytes(buffer[:]).decode('utf-8'))
+        except UnicodeDecodeError:
+            text = None
+        if on_read is not None:
+            on_read(stat, text)
+        if text is None:
+            return None
+
+    if isinstance(matcher.pattern, str):
+        # Unicode 语义的模式只能在解码后的文本上匹配
+        return _find_matching_lines(text, matcher) or None
+
+    buffer = _normalize_newlines(buffer)
+    matches = _find_matching_lines(buffer, matcher)
+    # 只在有匹配时校验整个文件（已解码过的内容无需再校验），没有匹配的文件无需解码
+    if not matches or (text is None and not _is_valid_utf8(buffer)):
+        return None
+    return matches
+
+
+# 进程内共享的扫描线程池（限制并发，避免每次搜索都创建线程）
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _scan_workers(max_workers: Optional[int]) -> int:
+    """扫描线程数，None 表示按 CPU 核数决定"""
+    if max_workers is None:
+        return min(32, (os.cpu_count() or 1) + 4)
+    return max_workers
+
+
+def get_scan_executor(max_workers: Optional[int] = None) -> ThreadPoolExecutor:
+    """
+    获取共享的扫描线程池
+
+    线程数变化时替换为新的线程池；旧线程池在替换后关闭，已提交的任务继续执行完毕。
+
+    Args:
+        max_workers: 最大线程数，None 表示按 CPU 核数决定
+
+    Returns:
+        线程池
+    """
+    global _executor, _executor_workers
+    max_workers = _scan_workers(max_workers)
+
+    old_executor = None
+    with _executor_lock:
+        if _executor is None or _executor_workers != max_workers:
+            old_executor = _executor
+            _executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="file-search"
+            )
+            _executor_workers = max_workers
+        executor = _executor
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+    return executor
+
+
+def iter_file_matches(
+    file_paths: Iterable[Path],
+    match_file: Callable[[Path], Optional[list[str]]],
+    max_workers: Optional[int] = None
+) -> Iterator[tuple[Path, list[str]]]:
+    """
+    并行扫描文件，按输入顺序流式返回匹配结果
+
+    只维持一个有限的提交窗口，调用方停止迭代时，
+    尚未开始的扫描任务会被取消。
+
+    Args:
+        file_paths: 待扫描文件（按输出顺序）
+        match_file: 单文件匹配函数，返回匹配行或 None
+        max_workers: 最大线程数
+
+    Yields:
+        (文件路径, 匹配行列表)
+    """
+    executor = get_scan_executor(max_workers)
+    window = _scan_workers(max_workers) * 4
+    pending = deque()
+
+    def submit(file_path: Path):
+        nonlocal executor
+        while True:
+            try:
+                return executor.submit(match_file, file_path)
+            except RuntimeError:
+                # 另一个线程按新的线程数替换并关闭了线程池时改用当前的线程池；线程池未被替换（如解释器退出）时照常报错
+                current = get_scan_executor(max_workers)
+                if current is executor:
+                    raise
+                executor = current
+
+    try:
+        for file_path in file_paths:
+            pending.append((file_path, submit(file_path)))
+            if len(pending) >= window:
+                done_path, future = pending.popleft()
+                matches = future.result()
+                if matches:
+                    yield done_path, matches
+
+        while pending:
+            done_path, future = pending.popleft()
+            matches = future.result()
+            if matches:
+                yield done_path, matches
+    finally:
+        # 提前结束（达到上限或出错）时取消剩余任务
+        for _, future in pending:
+            future.cancel()
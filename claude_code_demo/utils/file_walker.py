@@ -0,0 +1,445 @@
+"""
+目录遍历模块
+为文件工具提供统一的、支持 .gitignore 和二进制过滤的目录遍历
+"""
+import codecs
+import fnmatch
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, Optional
+
+from utils.workspace_snapshot import get_workspace_snapshot
+
+
+# 默认忽略的目录（按名称匹配，支持通配符）：只包含版本控制、缓存和依赖目录，
+# build/dist 等构建产物交给 .gitignore 处理，避免隐藏名称相同的源码目录
+DEFAULT_IGNORE_PATTERNS = [
+    ".git", ".hg", ".svn",
+    "__pycache__", ".mypy_cache", ".pytest_cache", ".ruff_cache",
+    "node_modules", ".venv",
+]
+
+# 常见二进制文件扩展名，无需打开文件即可跳过
+BINARY_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp",
+    ".pdf", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".jar",
+    ".so", ".dll", ".dylib", ".exe", ".o", ".a", ".class",
+    ".pyc", ".pyo", ".whl", ".db", ".sqlite", ".sqlite3",
+    ".mp3", ".mp4", ".wav", ".mov", ".avi", ".ttf", ".otf", ".woff", ".woff2",
+}
+
+# 二进制检测时读取的文件头字节数
+BINARY_SNIFF_SIZE = 8 * 1024
+
+
+def looks_binary(head: bytes) -> bool:
+    """
+    根据文件头判断是否为二进制文件
+
+    包含 NUL 字节或不是合法 UTF-8（允许末尾截断的多字节字符）即视为二进制。
+    """
+    if b'\0' in head:
+        return True
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def is_binary_file(file_path) -> bool:
+    """只读取文件头判断文件是否为二进制文件"""
+    if os.path.splitext(str(file_path))[1].lower() in BINARY_EXTENSIONS:
+        return True
+    try:
+        with open(file_path, 'rb') as f:
+            return looks_binary(f.read(BINARY_SNIFF_SIZE))
+    except OSError:
+        return True
+
+
+# 目录列表缓存：绝对路径 -> (目录 mtime_ns, 按名称排序的 DirEntry 列表)
+# 目录中增删、重命名条目都会更新目录的 mtime，因此只需一次 stat 即可校验
+_DIR_CACHE_MAX_ENTRIES = 200_000
+# 文件系统时间戳精度有限，刚修改过的目录可能在同一时间戳内再次变化，不缓存
+_DIR_CACHE_RACY_NS = 2 * 10**9
+_dir_cache: "OrderedDict[str, tuple[int, list]]" = OrderedDict()
+_dir_cache_size = 0
+_dir_cache_lock = threading.Lock()
+
+
+def _list_dir_cached(dir_path) -> list:
+    """
+    列出目录条目（按名称排序），目录未变化时复用上次的结果
+
+    Raises:
+        OSError: 目录无法读取
+    """
+    global _dir_cache_size
+    key = os.path.abspath(dir_path)
+    mtime_ns = os.stat(key).st_mtime_ns
+
+    with _dir_cache_lock:
+        cached = _dir_cache.get(key)
+        if cached is not None and cached[0] == mtime_ns:
+            _dir_cache.move_to_end(key)
+            return cached[1]
+
+    with os.scandir(key) as it:
+        entries = sorted(it, key=lambda e: e.name)
+
+    if time.time_ns() - mtime_ns > _DIR_CACHE_RACY_NS:
+        with _dir_cache_lock:
+            old = _dir_cache.pop(key, None)
+            if old is not None:
+                _dir_cache_size -= len(old[1])
+            _dir_cache[key] = (mtime_ns, entries)
+            _dir_cache_size += len(entries)
+            while _dir_cache_size > _DIR_CACHE_MAX_ENTRIES and _dir_cache:
+                _, (_, evicted) = _dir_cache.popitem(last=False)
+                _dir_cache_size -= len(evicted)
+    return entries
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """将 gitignore 通配符转换为正则（支持 **、*、?、[]）"""
+    i, n = 0, len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif c == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif c == "?":
+            parts.append("[^/]")
+            i += 1
+        elif c == "[":
+            j = pattern.find("]", i + 1)
+            if j == -1:
+                parts.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1:j]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                parts.append(f"[{body}]")
+                i = j + 1
+        elif c == "\\" and i + 1 < n:
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return "".join(parts)
+
+
+class IgnoreRule:
+    """单条 .gitignore 规则"""
+
+    def __init__(self, pattern: str, base: str = ""):
+        """
+        初始化规则
+
+        Args:
+            pattern: .gitignore 中的一行（已去除注释和空行）
+            base: .gitignore 所在目录相对于遍历锚点的路径（以 / 结尾或为空）
+        """
+        self.base = base
+        self.negated = pattern.startswith("!")
+        if self.negated:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+
+        # 包含 / 的规则相对于 .gitignore 所在目录，否则匹配任意层级
+        if "/" in pattern:
+            pattern = pattern.lstrip("/")
+        else:
+            pattern = "**/" + pattern
+        self.regex = re.compile(_glob_to_regex(pattern) + r"\Z")
+
+    def match(self, rel_path: str, is_dir: bool) -> bool:
+        """判断相对于锚点的路径是否匹配"""
+        if self.dir_only and not is_dir:
+            return False
+        if not rel_path.startswith(self.base):
+            return False
+        return self.regex.match(rel_path[len(self.base):]) is not None
+
+
+def parse_gitignore(file_path: str, base: str = "") -> list[IgnoreRule]:
+    """
+    解析 .gitignore 文件
+
+    Args:
+        file_path: .gitignore 路径
+        base: 所在目录相对于遍历锚点的路径
+
+    Returns:
+        规则列表，文件不存在时返回空列表
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        rules.append(IgnoreRule(line, base))
+    return rules
+
+
+def _find_repo_root(start: str) -> Optional[str]:
+    """向上查找包含 .git 的目录"""
+    current = start
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+class FileWalker:
+    """
+    文件遍历器
+
+    - 在进入目录前按忽略列表和 .gitignore 剪枝
+    - .gitignore 规则从仓库根目录逐层继承，后出现的规则优先（支持 ! 取反）
+    - 按扩展名快速跳过常见二进制文件
+    """
+
+    def __init__(
+        self,
+        root,
+        ignore_patterns: Optional[list] = None,
+        respect_gitignore: bool = True
+    ):
+        """
+        初始化遍历器
+
+        Args:
+            root: 遍历起始目录
+            ignore_patterns: 按名称忽略的模式，None 表示使用默认列表
+            respect_gitignore: 是否遵守 .gitignore
+        """
+        self.root = Path(root)
+        self.ignore_patterns = (
+            DEFAULT_IGNORE_PATTERNS if ignore_patterns is None else list(ignore_patterns)
+        )
+        self.respect_gitignore = respect_gitignore
+        self._name_regex = (
+            re.compile("|".join(fnmatch.translate(p) for p in self.ignore_patterns))
+            if self.ignore_patterns else None
+        )
+
+        # 锚点：仓库根目录（没有仓库时为起始目录），所有规则路径都相对于锚点
+        real_root = os.path.realpath(self.root)
+        self._anchor = real_root
+        self._root_rel = ""
+        self._root_rules: list[IgnoreRule] = []
+
+        if respect_gitignore:
+            repo_root = _find_repo_root(real_root)
+            if repo_root is not None:
+                self._anchor = repo_root
+                rel = os.path.relpath(real_root, repo_root)
+                self._root_rel = "" if rel == "." else rel.replace(os.sep, "/") + "/"
+
+            # 加载起始目录之上各级目录的 .gitignore（起始目录自身在遍历时加载）
+            if self._root_rel:
+                parts = self._root_rel.rstrip("/").split("/")
+                for depth in range(len(parts)):
+                    base = "/".join(parts[:depth])
+                    base = base + "/" if base else ""
+                    self._root_rules.extend(parse_gitignore(
+                        os.path.join(self._anchor, base, ".gitignore"), base
+                    ))
+
+    def is_ignored(self, name: str, rel_path: str, is_dir: bool, rules: list) -> bool:
+        """
+        判断条目是否被忽略
+
+        Args:
+            name: 条目名称
+            rel_path: 相对于锚点的路径
+            is_dir: 是否为目录
+            rules: 当前目录生效的 .gitignore 规则
+
+        Returns:
+            是否忽略
+        """
+        if self._name_regex is not None and self._name_regex.match(name):
+            return True
+        ignored = False
+        for rule in rules:
+            if rule.negated == ignored and rule.match(rel_path, is_dir):
+                ignored = not rule.negated
+        return ignored
+
+    def _rules_for(self, dir_path, rel_dir: str, inherited: list) -> list:
+        """合并当前目录的 .gitignore 规则"""
+        if not self.respect_gitignore:
+            return inherited
+        local = parse_gitignore(os.path.join(dir_path, ".gitignore"), rel_dir)
+        return inherited + local if local else inherited
+
+    def _scan(self, dir_path: Path, rel_dir: str, rules: list) -> tuple[list, int]:
+        """列出目录中未被忽略的条目（按名称排序），同时返回被忽略的条目数"""
+        # 启用工作区快照时直接使用内存中的目录树，否则使用按目录 mtime 校验的列表缓存
+        snapshot = get_workspace_snapshot()
+        entries = snapshot.list_dir(dir_path) if snapshot is not None else None
+        if entries is None:
+            try:
+                entries = _list_dir_cached(dir_path)
+            except OSError:
+                return [], 0
+
+        kept = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if not self.is_ignored(entry.name, rel_dir + entry.name, is_dir, rules):
+                kept.append((entry, is_dir))
+        return kept, len(entries) - len(kept)
+
+    def list_dir(self) -> tuple[list, int]:
+        """
+        列出起始目录中未被忽略的条目
+
+        Returns:
+            ([(DirEntry, is_dir), ...], 被忽略的条目数)
+        """
+        rules = self._rules_for(self.root, self._root_rel, self._root_rules)
+        return self._scan(self.root, self._root_rel, rules)
+
+    def iter_files(self, name_pattern: str = "*", skip_binary: bool = True) -> Iterator[Path]:
+        """
+        递归遍历未被忽略的文件
+
+        先输出目录中的文件，再依次进入子目录；不跟随符号链接目录。
+
+        Args:
+            name_pattern: 文件名通配符（如 *.py）
+            skip_binary: 是否按扩展名跳过常见二进制文件
+
+        Yields:
+            文件路径
+        """
+        stack = [(self.root, self._root_rel, self._root_rules)]
+        while stack:
+            dir_path, rel_dir, inherited = stack.pop()
+            rules = self._rules_for(dir_path, rel_dir, inherited)
+
+            subdirs = []
+            entries, _ = self._scan(dir_path, rel_dir, rules)
+            for entry, is_dir in entries:
+                if is_dir:
+                    if not entry.is_symlink():
+                        subdirs.append((dir_path / entry.name, rel_dir + entry.name + "/", rules))
+                    continue
+                if not fnmatch.fnmatchcase(entry.name, name_pattern):
+                    continue
+                if skip_binary and os.path.splitext(entry.name)[1].lower() in BINARY_EXTENSIONS:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                yield dir_path / entry.name
+
+            # 逆序压栈，保证按名称顺序深度优先遍历
+            stack.extend(reversed(subdirs))
+
+    def iter_tree(
+        self,
+        max_depth: Optional[int] = None,
+        name_pattern: Optional[str] = None
+    ) -> Iterator[tuple[int, str, bool]]:
+        """
+        按树形顺序（先序、按名称排序）遍历未被忽略的条目
+
+        直接复用 os.scandir 返回的 DirEntry 类型信息，不对每个条目额外 stat；
+        不跟随符号链接目录。
+
+        Args:
+            max_depth: 最大深度（1 表示只列出起始目录），None 表示不限
+            name_pattern: 文件名通配符；指定时只输出匹配的文件及其所在目录
+
+        Yields:
+            (深度（从 0 开始）, 名称, 是否为目录)
+        """
+        rules = self._rules_for(self.root, self._root_rel, self._root_rules)
+        yield from self._walk_tree(
+            os.fspath(self.root), self._root_rel, rules, 0, max_depth, name_pattern, []
+        )
+
+    def _walk_tree(self, dir_path: str, rel_dir: str, rules: list, depth: int,
+                   max_depth: Optional[int], name_pattern: Optional[str], pending: list):
+        """iter_tree 的递归实现；pending 为尚未输出的祖先目录（只在过滤文件名时使用）"""
+        entries, _ = self._scan(dir_path, rel_dir, rules)
+        for entry, is_dir in entries:
+            if not is_dir:
+                if name_pattern is not None:
+                    if not fnmatch.fnmatchcase(entry.name, name_pattern):
+                        continue
+                    # 第一次遇到匹配的文件时补充输出其祖先目录
+                    yield from pending
+                    pending.clear()
+                yield depth, entry.name, False
+                continue
+
+            node = (depth, entry.name, True)
+            if name_pattern is None:
+                yield node
+            if (max_depth is not None and depth + 1 >= max_depth) or entry.is_symlink():
+                continue
+
+            child_rel = rel_dir + entry.name + "/"
+            child_rules = self._rules_for(entry.path, child_rel, rules)
+            if name_pattern is not None:
+                pending.append(node)
+            yield from self._walk_tree(
+                entry.path, child_rel, child_rules, depth + 1, max_depth, name_pattern, pending
+            )
+            if pending and pending[-1] is node:
+                pending.pop()
+
+
+def compile_path_glob(pattern: str) -> re.Pattern:
+    """
+    编译路径通配符（支持 **、*、?、[]），用于匹配相对路径
+
+    * 和 ? 不跨越目录，**/ 匹配零个或多个目录，例如 src/**/*.py。
+    """
+    return re.compile(_glob_to_regex(pattern.lstrip("/")) + r"\Z")
+
+
+def glob_base_dir(pattern: str) -> str:
+    """返回通配符中不含通配字符的前导目录（如 src/**/*.py -> src），用于缩小遍历范围"""
+    parts = pattern.lstrip("/").split("/")[:-1]
+    base = []
+    for part in parts:
+        if any(c in part for c in "*?[\\"):
+            break
+        base.append(part)
+    return "/".join(base)
+
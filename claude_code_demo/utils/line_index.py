@@ -0,0 +1,137 @@
+"""
+行偏移索引模块
+为 read_file 提供按行范围读取：首次扫描后跳转到任意行只需一次 seek
+"""
+import io
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+from utils.workspace_snapshot import workspace_stat
+
+_NEWLINE_RE = re.compile(rb'\r\n|\r|\n')
+_SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+class LineIndex:
+    """
+    文件的行偏移索引
+
+    offsets[i] 为第 i 行（从 0 开始）的起始字节位置，
+    最后一个元素为文件大小，因此总行数为 len(offsets) - 1。
+    """
+
+    def __init__(self, file_path: str, mtime_ns: int, size: int, offsets: array):
+        self.file_path = file_path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.offsets = offsets
+
+    @property
+    def total_lines(self) -> int:
+        """总行数"""
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def _scan_offsets(f) -> array:
+        """分块扫描二进制流，记录每行的起始位置（\\r\\n、\\r、\\n 都视为换行，与文本模式一致）"""
+        offsets = array('q', [0])
+        base = 0
+        carry = b''
+        while True:
+            chunk = f.read(_SCAN_CHUNK_SIZE)
+            buffer = carry + chunk
+            if not buffer:
+                break
+            # 末尾的 \r 可能与下一块开头的 \n 组成 \r\n，留到下一块处理
+            if chunk and buffer.endswith(b'\r'):
+                buffer, carry = buffer[:-1], b'\r'
+            else:
+                carry = b''
+            offsets.extend(base + m.end() for m in _NEWLINE_RE.finditer(buffer))
+            base += len(buffer)
+            if not chunk:
+                break
+        if base > offsets[-1]:
+            # 最后一行没有换行符
+            offsets.append(base)
+        return offsets
+
+    @classmethod
+    def build(cls, file_path: str, data: Optional[bytes] = None) -> "LineIndex":
+        """
+        扫描文件建立索引
+
+        Args:
+            file_path: 文件路径
+            data: 已读取的文件内容（如来自内容缓存），提供时不再读取文件
+        """
+        if data is not None:
+            stat = os.stat(file_path)
+            return cls(file_path, stat.st_mtime_ns, len(data), cls._scan_offsets(io.BytesIO(data)))
+
+        with open(file_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            offsets = cls._scan_offsets(f)
+        return cls(file_path, stat.st_mtime_ns, stat.st_size, offsets)
+
+    def read_lines(self, start: int, count: int, data: Optional[bytes] = None) -> str:
+        """
+        读取行范围
+
+        Args:
+            start: 起始行（从 0 开始）
+            count: 行数
+            data: 已读取的文件内容，提供时直接切片，否则 seek 读取
+
+        Returns:
+            解码后的文本（\\r\\n 和 \\r 统一为 \\n）
+        """
+        end = min(start + count, self.total_lines)
+        if start >= end:
+            return ""
+        if data is not None:
+            chunk = data[self.offsets[start]:self.offsets[end]]
+        else:
+            with open(self.file_path, 'rb') as f:
+                f.seek(self.offsets[start])
+                chunk = f.read(self.offsets[end] - self.offsets[start])
+        return chunk.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+# 进程内的行索引缓存：realpath -> LineIndex（按 mtime/size 校验）
+_MAX_CACHED_INDEXES = 64
+_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_line_index(file_path, data: Optional[bytes] = None) -> LineIndex:
+    """
+    获取文件的行偏移索引（文件未变化时复用缓存）
+
+    Args:
+        file_path: 文件路径
+        data: 已读取的文件内容，需要重建索引时使用
+
+    Returns:
+        行偏移索引
+    """
+    real_path = os.path.realpath(file_path)
+    stat = workspace_stat(real_path)
+
+    with _indexes_lock:
+        index = _indexes.get(real_path)
+        if index is not None and index.mtime_ns == stat.st_mtime_ns and index.size == stat.st_size:
+            _indexes.move_to_end(real_path)
+            return index
+
+    index = LineIndex.build(real_path, data)
+    with _indexes_lock:
+        _indexes[real_path] = index
+        _indexes.move_to_end(real_path)
+        while len(_indexes) > _MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
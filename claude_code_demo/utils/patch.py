@@ -0,0 +1,347 @@
+"""
+补丁模块
+解析多文件统一差异（unified diff），先校验全部 hunk，再原子地应用并支持回滚
+"""
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from utils.file_cache import get_file_cache
+from utils.file_ops import atomic_write_text
+
+
+class PatchError(Exception):
+    """补丁解析或应用失败"""
+
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+@dataclass
+class Hunk:
+    """单个 hunk"""
+    old_start: int
+    old_lines: list = field(default_factory=list)
+    new_lines: list = field(default_factory=list)
+    added: int = 0
+    removed: int = 0
+    old_no_eol: bool = False  # 旧内容末尾没有换行
+    new_no_eol: bool = False  # 新内容末尾没有换行
+
+
+@dataclass
+class FilePatch:
+    """单个文件的补丁"""
+    old_path: Optional[str]  # None 表示新建文件
+    new_path: Optional[str]  # None 表示删除文件
+    hunks: list = field(default_factory=list)
+
+    @property
+    def path(self) -> str:
+        return self.new_path or self.old_path
+
+    @property
+    def added(self) -> int:
+        return sum(h.added for h in self.hunks)
+
+    @property
+    def removed(self) -> int:
+        return sum(h.removed for h in self.hunks)
+
+
+def _strip_prefix(header_path: str) -> Optional[str]:
+    """解析 ---/+++ 行中的路径（去掉时间戳和 a/、b/ 前缀）"""
+    path = header_path.split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+def parse_patch(patch: str) -> list[FilePatch]:
+    """
+    解析多文件统一差异
+
+    Args:
+        patch: 补丁文本
+
+    Returns:
+        文件补丁列表
+
+    Raises:
+        PatchError: 补丁格式错误
+    """
+    lines = patch.splitlines()
+    file_patches = []
+    current: Optional[FilePatch] = None
+    i = 0
+
+    while i < len(lines):
+        line = lines[i]
+
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = FilePatch(
+                old_path=_strip_prefix(line[4:]),
+                new_path=_strip_prefix(lines[i + 1][4:])
+            )
+            if current.path is None:
+                raise PatchError(f"Invalid file header at line {i + 1}")
+            file_patches.append(current)
+            i += 2
+            continue
+
+        match = _HUNK_HEADER.match(line)
+        if match:
+            if current is None:
+                raise PatchError(f"Hunk without file header at line {i + 1}")
+            old_count = int(match.group(2)) if match.group(2) is not None else 1
+            new_count = int(match.group(4)) if match.group(4) is not None else 1
+            hunk = Hunk(old_start=int(match.group(1)))
+            i += 1
+
+            # 按 hunk 头中的行数读取内容
+            while i < len(lines) and (len(hunk.old_lines) < old_count or len(hunk.new_lines) < new_count):
+                body = lines[i]
+                tag, text = body[:1], body[1:]
+                if tag == " " or body == "":
+                    hunk.old_lines.append(text)
+                    hunk.new_lines.append(text)
+                elif tag == "-":
+                    hunk.old_lines.append(text)
+                    hunk.removed += 1
+                elif tag == "+":
+                    hunk.new_lines.append(text)
+                    hunk.added += 1
+                elif tag == "\\":
+                    pass
+                else:
+                    raise PatchError(f"Unexpected line in hunk at line {i + 1}: {body[:40]!r}")
+                i += 1
+
+                # "\ No newline at end of file" 紧跟在对应的行之后
+                if i < len(lines) and lines[i].startswith("\\"):
+                    if tag in (" ", "-"):
+                        hunk.old_no_eol = True
+                    if tag in (" ", "+"):
+                        hunk.new_no_eol = True
+                    i += 1
+
+            if len(hunk.old_lines) != old_count or len(hunk.new_lines) != new_count:
+                raise PatchError(f"Hunk for {current.path} is truncated")
+            current.hunks.append(hunk)
+            continue
+
+        # 忽略 diff --git、index 等元信息行
+        i += 1
+
+    if not file_patches:
+        raise PatchError("No file changes found in patch")
+    return file_patches
+
+
+def _split_lines(content: str) -> tuple[list, bool]:
+    """拆分为行列表（不含换行符）和是否以换行结尾"""
+    if not content:
+        return [], False
+    lines = content.split("\n")
+    ends_with_newline = content.endswith("\n")
+    if ends_with_newline:
+        lines.pop()
+    return lines, ends_with_newline
+
+
+def _find_hunk(lines: list, hunk: Hunk, expected: int) -> Optional[int]:
+    """从期望位置向两侧查找 hunk 旧内容的位置"""
+    size = len(hunk.old_lines)
+    if size == 0:
+        return min(max(expected, 0), len(lines))
+
+    for delta in range(0, len(lines) + 1):
+        for pos in (expected + delta, expected - delta):
+            if 0 <= pos <= len(lines) - size and lines[pos:pos + size] == hunk.old_lines:
+                return pos
+            if delta == 0:
+                break
+    return None
+
+
+def apply_file_patch(content: str, file_patch: FilePatch) -> str:
+    """
+    在内存中对单个文件应用补丁
+
+    Args:
+        content: 原文件内容
+        file_patch: 文件补丁
+
+    Returns:
+        新内容
+
+    Raises:
+        PatchError: 某个 hunk 无法匹配
+    """
+    lines, ends_with_newline = _split_lines(content)
+    result = []
+    cursor = 0
+    drift = 0
+
+    for n, hunk in enumerate(file_patch.hunks, 1):
+        # old_start 为 0 或空 hunk 时表示插入到该行之后
+        expected = hunk.old_start - 1 if hunk.old_lines else hunk.old_start
+        pos = _find_hunk(lines, hunk, expected + drift)
+        if pos is None or pos < cursor:
+            raise PatchError(f"Hunk {n} does not apply to {file_patch.path}")
+
+        result.extend(lines[cursor:pos])
+        result.extend(hunk.new_lines)
+        cursor = pos + len(hunk.old_lines)
+        drift = pos - expected
+
+        if cursor == len(lines):
+            if hunk.new_no_eol:
+                ends_with_newline = False
+            elif hunk.old_no_eol or not lines:
+                ends_with_newline = True
+
+    result.extend(lines[cursor:])
+    if not result:
+        return ""
+    return "\n".join(result) + ("\n" if ends_with_newline else "")
+
+
+@dataclass
+class PlannedChange:
+    """校验通过、待写入的文件变更"""
+    path: Path
+    file_patch: FilePatch
+    new_content: Optional[str]  # None 表示删除
+    rename_from: Optional[Path] = None
+
+
+def plan_patch(patch: str, directory: str = ".") -> list[PlannedChange]:
+    """
+    解析并校验补丁，计算所有文件的新内容（不写入磁盘）
+
+    Args:
+        patch: 补丁文本
+        directory: 补丁路径的基准目录
+
+    Returns:
+        待写入的变更列表
+
+    Raises:
+        PatchError: 任意文件校验失败
+    """
+    base = Path(directory)
+    file_cache = get_file_cache()
+    planned = []
+    seen = set()
+
+    for file_patch in parse_patch(patch):
+        target = base / file_patch.path
+        if target in seen:
+            raise PatchError(f"File {file_patch.path} appears more than once in patch")
+        seen.add(target)
+
+        if file_patch.old_path is None:
+            if target.exists():
+                raise PatchError(f"Cannot create {file_patch.path}: file already exists")
+            content = ""
+        else:
+            source = base / file_patch.old_path
+            if not source.is_file():
+                raise PatchError(f"File {file_patch.old_path} does not exist")
+            # 补丁结果会写回文件：用真实 stat 校验缓存，不使用可能滞后的快照
+            content = file_cache.get_text(source, verify=True)
+
+        new_content = apply_file_patch(content, file_patch)
+
+        rename_from = None
+        if file_patch.old_path is not None and file_patch.new_path is not None \
+                and file_patch.old_path != file_patch.new_path:
+            rename_from = base / file_patch.old_path
+            if target.exists():
+                raise PatchError(f"Cannot rename to {file_patch.new_path}: file already exists")
+
+        if file_patch.new_path is None:
+            if new_content:
+                raise PatchError(f"Cannot delete {file_patch.old_path}: patch does not remove all content")
+            new_content = None
+        planned.append(PlannedChange(target, file_patch, new_content, rename_from))
+
+    return planned
+
+
+def commit_patch(planned: list[PlannedChange]):
+    """
+    将校验过的变更写入磁盘；任何一步失败时恢复所有已修改的文件
+
+    Args:
+        planned: plan_patch 返回的变更列表
+
+    Raises:
+        PatchError: 写入失败（已回滚）
+    """
+    file_cache = get_file_cache()
+    # 备份：路径 -> 原始字节（None 表示原本不存在）
+    backups: dict[Path, Optional[bytes]] = {}
+
+    def backup(path: Path):
+        if path not in backups:
+            backups[path] = path.read_bytes() if path.exists() else None
+
+    try:
+        for change in planned:
+            backup(change.path)
+            if change.rename_from is not None:
+                backup(change.rename_from)
+
+            if change.new_content is None:
+                os.remove(change.path)
+            else:
+                change.path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write_text(change.path, change.new_content)
+                if change.rename_from is not None:
+                    os.remove(change.rename_from)
+    except Exception as e:
+        rollback_errors = []
+        for path, data in backups.items():
+            try:
+                if data is None:
+                    if path.exists():
+                        os.remove(path)
+                else:
+                    tmp_path = path.with_name(f".{path.name}.rollback")
+                    tmp_path.write_bytes(data)
+                    os.replace(tmp_path, path)
+            except Exception as restore_error:
+                rollback_errors.append(f"{path}: {restore_error}")
+        message = f"Failed to apply patch, changes rolled back: {e}"
+        if rollback_errors:
+            message += "; rollback failed for " + ", ".join(rollback_errors)
+        raise PatchError(message) from e
+    finally:
+        for path in backups:
+            file_cache.invalidate(path)
+
+
+def summarize_patch(patch: str) -> str:
+    """生成补丁的简要说明（用于人工确认）"""
+    try:
+        file_patches = parse_patch(patch)
+    except PatchError as e:
+        return f"invalid patch: {e}"
+
+    parts = []
+    for fp in file_patches:
+        if fp.old_path is None:
+            parts.append(f"create {fp.path} (+{fp.added})")
+        elif fp.new_path is None:
+            parts.append(f"delete {fp.old_path}")
+        elif fp.old_path != fp.new_path:
+            parts.append(f"rename {fp.old_path} -> {fp.new_path} (+{fp.added} -{fp.removed})")
+        else:
+            parts.append(f"modify {fp.path} (+{fp.added} -{fp.removed})")
+    return f"{len(file_patches)} file(s): " + ", ".join(parts)
@@ -0,0 +1,65 @@
+"""
+读取记录模块
+按会话线程记录 read_file 已返回内容的哈希，用于省略重复读取
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def content_digest(content: str) -> str:
+    """计算返回内容的哈希"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class ReadTracker:
+    """
+    读取记录器
+
+    每个线程（thread_id）记录 (文件, offset, limit) -> 内容哈希，
+    线程数和每个线程的记录数都有上限，超出时淘汰最久未使用的记录。
+    """
+
+    def __init__(self, max_threads: int = 256, max_entries_per_thread: int = 512):
+        """
+        初始化读取记录器
+
+        Args:
+            max_threads: 最多记录的线程数
+            max_entries_per_thread: 每个线程最多记录的读取数
+        """
+        self.max_threads = max_threads
+        self.max_entries_per_thread = max_entries_per_thread
+        self._threads: "OrderedDict[str, OrderedDict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, thread_id: str, read_key: tuple, digest: str) -> bool:
+        """判断该线程是否已经返回过相同的内容"""
+        with self._lock:
+            entries = self._threads.get(thread_id)
+            return entries is not None and entries.get(read_key) == digest
+
+    def record(self, thread_id: str, read_key: tuple, digest: str):
+        """记录一次完整读取"""
+        with self._lock:
+            entries = self._threads.get(thread_id)
+            if entries is None:
+                entries = OrderedDict()
+                self._threads[thread_id] = entries
+            self._threads.move_to_end(thread_id)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+
+            entries[read_key] = digest
+            entries.move_to_end(read_key)
+            while len(entries) > self.max_entries_per_thread:
+                entries.popitem(last=False)
+
+
+# 进程内共享的读取记录器
+_read_tracker = ReadTracker()
+
+
+def get_read_tracker() -> ReadTracker:
+    """获取进程内共享的读取记录器"""
+    return _read_tracker
@@ -0,0 +1,251 @@
+"""
+仓库地图模块
+生成工作区的紧凑概览（文件树 + 顶层符号），按重要性排序并限制在 token 预算内，
+供系统提示词使用；文件变化后增量更新
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+from utils.file_walker import FileWalker
+from utils.symbol_index import get_symbol_index
+from utils.tokenizer import count_tokens
+from utils.workspace_snapshot import get_workspace_snapshot
+
+# 通常是入口或说明文件，排名时额外加分
+_ENTRY_FILES = {
+    "README.md", "README.rst", "README", "main.py", "__main__.py", "app.py",
+    "setup.py", "pyproject.toml", "package.json", "Makefile", "Dockerfile",
+}
+
+
+def _estimate_tokens(text: str) -> int:
+    """估算文本的 Token 数（与 estimate_tokens 使用相同的分词器）"""
+    return count_tokens(text)
+
+
+def _module_name(rel_path: str) -> Optional[str]:
+    """相对路径对应的模块名（utils/file_walker.py -> utils.file_walker）"""
+    if not rel_path.endswith(".py"):
+        return None
+    parts = rel_path[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts) if parts else None
+
+
+def _resolve_import(importer: str, qualname: str, modules: dict) -> Optional[str]:
+    """
+    将导入解析为工作区内的文件
+
+    Args:
+        importer: 导入所在文件的相对路径
+        qualname: 被导入的完整名称（相对导入以 . 开头）
+        modules: 模块名 -> 相对路径
+
+    Returns:
+        被导入文件的相对路径，不在工作区内时返回 None
+    """
+    name = qualname
+    if name.startswith("."):
+        level = len(name) - len(name.lstrip("."))
+        package = importer.split("/")[:-1]
+        if level - 1 > len(package):
+            return None
+        base = package[:len(package) - (level - 1)]
+        rest = name[level:]
+        name = ".".join(base + ([rest] if rest else []))
+
+    # 取最长的匹配模块（from a.b import C 的 C 可能是模块也可能是符号）
+    parts = name.split(".")
+    for end in range(len(parts), 0, -1):
+        rel_path = modules.get(".".join(parts[:end]))
+        if rel_path is not None:
+            return rel_path
+    return None
+
+
+class RepoMap:
+    """
+    仓库地图
+
+    - 文件按被工作区内其他文件导入的次数排序，入口文件和浅层文件优先
+    - 每个 Python 文件列出公开的顶层类和函数（来自符号索引）
+    - 在 token 预算内尽量多地包含文件，超出时省略排名靠后的文件
+    - 渲染结果会被缓存：启用工作区快照时在快照变化后重建，
+      否则最多每隔 refresh_interval 秒检查一次变化（符号索引只重新解析变化的文件）
+    """
+
+    def __init__(
+        self,
+        root,
+        cache_dir: str,
+        token_budget: int = 1024,
+        refresh_interval: float = 5.0,
+        ignore_patterns: Optional[list] = None,
+        respect_gitignore: bool = True,
+        max_workers: Optional[int] = None
+    ):
+        """
+        初始化仓库地图
+
+        Args:
+            root: 工作区根目录
+            cache_dir: 符号索引的存储目录
+            token_budget: 地图的 token 预算
+            refresh_interval: 未启用工作区快照时检查变化的最小间隔（秒）
+            ignore_patterns: 按名称忽略的文件/目录，None 表示使用默认列表
+            respect_gitignore: 是否遵守 .gitignore
+            max_workers: 符号索引的解析进程数
+        """
+        self.root = os.path.realpath(root)
+        self.cache_dir = cache_dir
+        self.token_budget = token_budget
+        self.refresh_interval = refresh_interval
+        self.ignore_patterns = ignore_patterns
+        self.respect_gitignore = respect_gitignore
+        self.max_workers = max_workers
+
+        self._text: Optional[str] = None
+        self._built_at = 0.0
+        self._snapshot_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _snapshot_version_now(self) -> Optional[int]:
+        """覆盖工作区的快照的版本号，没有快照时返回 None"""
+        snapshot = get_workspace_snapshot()
+        if snapshot is None:
+            return None
+        if self.root != snapshot.root and not self.root.startswith(snapshot.root + os.sep):
+            return None
+        return snapshot.version
+
+    def render(self) -> str:
+        """
+        获取仓库地图（未变化时直接返回缓存）
+
+        Returns:
+            地图文本，工作区为空时返回空字符串
+        """
+        with self._lock:
+            version = self._snapshot_version_now()
+            if self._text is not None:
+                if version is not None and version == self._snapshot_version:
+                    return self._text
+                if version is None and time.monotonic() - self._built_at < self.refresh_interval:
+                    return self._text
+
+            self._text = self._build()
+            self._built_at = time.monotonic()
+            self._snapshot_version = version
+            return self._text
+
+    def _build(self) -> str:
+        """遍历工作区并生成地图"""
+        walker = FileWalker(
+            self.root,
+            ignore_patterns=self.ignore_patterns,
+            respect_gitignore=self.respect_gitignore
+        )
+        skip = len(self.root) + 1
+        rel_paths = [str(p)[skip:].replace(os.sep, "/") for p in walker.iter_files()]
+        if not rel_paths:
+            return ""
+
+        # 顶层符号和导入关系来自符号索引
+        py_files = [(os.path.join(self.root, p), p) for p in rel_paths if p.endswith(".py")]
+        symbols_by_file: dict[str, list] = {}
+        in_degree: dict[str, int] = {}
+        index = get_symbol_index(self.root, self.cache_dir)
+        if index is not None and py_files:
+            index.refresh(py_files, self.max_workers, prune=True)
+            index.save()
+            modules = {}
+            for rel_path in rel_paths:
+                module = _module_name(rel_path)
+                if module:
+                    modules[module] = rel_path
+
+            importers: dict[str, set] = {}
+            for rel_path, symbols in index.file_symbols():
+                for symbol in symbols:
+                    if symbol.kind == "import":
+                        target = _resolve_import(rel_path, symbol.qualname, modules)
+                        if target is not None and target != rel_path:
+                            importers.setdefault(target, set()).add(rel_path)
+                    elif (symbol.kind in ("class", "function")
+                          and "." not in symbol.qualname
+                          and not symbol.name.startswith("_")):
+                        symbols_by_file.setdefault(rel_path, []).append(symbol.name)
+            in_degree = {rel_path: len(files) for rel_path, files in importers.items()}
+
+        def score(rel_path: str) -> float:
+            value = 2.0 * in_degree.get(rel_path, 0)
+            if rel_path in symbols_by_file:
+                value += 1.0
+            if os.path.basename(rel_path) in _ENTRY_FILES:
+                value += 3.0
+            return value + 1.0 / (1 + rel_path.count("/"))
+
+        # 按排名在预算内选择文件，预算不足时只保留文件名
+        header = f"Repository map of {self.root} ({len(rel_paths)} files):"
+        budget = self.token_budget - _estimate_tokens(header)
+        included: dict[str, list] = {}
+        for rel_path in sorted(rel_paths, key=lambda p: (-score(p), p)):
+            names = symbols_by_file.get(rel_path, [])
+            # 每行大致为 缩进 + 文件名 + 符号列表
+            cost = _estimate_tokens(rel_path + ": " + ", ".join(names)) + 1
+            if cost > budget and names:
+                names = []
+                cost = _estimate_tokens(rel_path) + 1
+            if cost > budget:
+                break
+            included[rel_path] = names
+            budget -= cost
+
+        lines = [header]
+        printed_dirs = set()
+        for rel_path in sorted(included):
+            parts = rel_path.split("/")
+            for depth in range(len(parts) - 1):
+                dir_path = "/".join(parts[:depth + 1])
+                if dir_path not in printed_dirs:
+                    printed_dirs.add(dir_path)
+                    lines.append("  " * depth + parts[depth] + "/")
+            line = "  " * (len(parts) - 1) + parts[-1]
+            if included[rel_path]:
+                line += ": " + ", ".join(included[rel_path])
+            lines.append(line)
+
+        omitted = len(rel_paths) - len(included)
+        if omitted:
+            lines.append(f"(+{omitted} more files not shown)")
+        return "\n".join(lines)
+
+
+# 进程内的仓库地图缓存：(工作区根目录, token 预算) -> 地图
+_repo_maps: dict[tuple, RepoMap] = {}
+_repo_maps_lock = threading.Lock()
+
+
+def get_repo_map(root, cache_dir: str, token_budget: int = 1024, **kwargs) -> RepoMap:
+    """
+    获取工作区的仓库地图（同一进程内复用）
+
+    Args:
+        root: 工作区根目录
+        cache_dir: 符号索引的存储目录
+        token_budget: 地图的 token 预算
+        **kwargs: 传给 RepoMap 的其他参数
+
+    Returns:
+        仓库地图
+    """
+    key = (os.path.realpath(root), token_budget)
+    with _repo_maps_lock:
+        repo_map = _repo_maps.get(key)
+        if repo_map is None:
+            repo_map = RepoMap(root, cache_dir, token_budget, **kwargs)
+            _repo_maps[key] = repo_map
+        return repo_map
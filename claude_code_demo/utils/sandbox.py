@@ -0,0 +1,376 @@
+"""
+沙箱执行模块
+将选定的工具放到预热的工作进程中执行，每个任务都受 CPU 时间和内存 rlimit 约束，
+参数和结果通过管道传递。CPU 密集的工具不再占用主进程的 GIL，失控的工具也只会拖垮自己的工作进程
+"""
+import asyncio
+import contextvars
+import functools
+import importlib
+import math
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from langchain_core.tools import BaseTool
+
+try:
+    import resource
+except ImportError:  # Windows 没有 rlimit，只提供进程隔离
+    resource = None
+
+
+class SandboxError(Exception):
+    """沙箱任务失败（超出资源限制、工作进程崩溃或结果无法传回）"""
+    pass
+
+
+class _CpuLimitExceeded(BaseException):
+    """工作进程内收到 SIGXCPU 时抛出（继承 BaseException，避免被工具内的 except Exception 吞掉）"""
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise _CpuLimitExceeded()
+
+
+def _address_space_bytes() -> int:
+    """当前进程的虚拟地址空间大小"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _apply_limits(cpu_seconds: Optional[float], memory_bytes: Optional[int]) -> list:
+    """
+    为当前任务设置 rlimit
+
+    CPU 时间按进程累计计算，因此软限制为已用时间加上本任务的配额；
+    内存限制同理，为当前地址空间加上本任务允许新增的字节数。
+
+    Returns:
+        被修改的限制及其原值 [(限制, (软限制, 硬限制)), ...]，供 _restore_limits 使用
+    """
+    previous = []
+    if resource is None:
+        return previous
+    if cpu_seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            previous.append((resource.RLIMIT_CPU, resource.getrlimit(resource.RLIMIT_CPU)))
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    if memory_bytes:
+        try:
+            soft = _address_space_bytes() + memory_bytes
+        except OSError:
+            return previous
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            previous.append((resource.RLIMIT_AS, resource.getrlimit(resource.RLIMIT_AS)))
+            resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+    return previous
+
+
+def _restore_limits(previous: list):
+    """任务结束后恢复原来的限制"""
+    for limit, value in previous:
+        resource.setrlimit(limit, value)
+
+
+def _resolve(module: str, name: str):
+    """按模块名和名称找到要执行的函数（@tool 创建的工具取其原始函数）"""
+    target = getattr(importlib.import_module(module), name)
+    if isinstance(target, BaseTool):
+        target = target.func
+    return target
+
+
+def _worker_main(conn, initializers: list):
+    """
+    工作进程主循环
+
+    Args:
+        conn: 与主进程通信的管道
+        initializers: [(模块名, 函数名, 参数元组), ...]，启动时依次调用（如配置文件工具）
+    """
+    # Ctrl+C 由主进程处理，工作进程随主进程退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    for module, name, args in initializers:
+        getattr(importlib.import_module(module), name)(*args)
+
+    while True:
+        try:
+            module, name, args, kwargs, cpu_seconds, memory_bytes = conn.recv()
+        except (EOFError, OSError):
+            break
+        previous = []
+        try:
+            previous = _apply_limits(cpu_seconds, memory_bytes)
+            reply = ("ok", _resolve(module, name)(*args, **kwargs))
+        except _CpuLimitExceeded:
+            reply = ("error", f"exceeded the CPU time limit of {cpu_seconds:g}s")
+        except MemoryError:
+            limit = f" of {memory_bytes // (1024 * 1024)} MB" if memory_bytes else ""
+            reply = ("error", f"exceeded the memory limit{limit}")
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+        finally:
+            _restore_limits(previous)
+
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # 结果无法序列化时只返回错误信息
+            conn.send(("error", f"result could not be sent back: {type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """一个工作进程及其管道"""
+
+    def __init__(self, context, initializers: list):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, initializers),
+            name="sandbox-worker",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        """强制结束工作进程"""
+        if self.process.is_alive():
+            self.process.kill()
+
+    def close(self):
+        """关闭管道并结束工作进程"""
+        self.conn.close()
+        self.kill()
+        self.process.join(timeout=1)
+
+
+class _Call:
+    """正在执行的任务，用于在协程被取消时结束对应的工作进程"""
+
+    def __init__(self):
+        self.worker: Optional[_Worker] = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.worker is not None:
+                self.worker.kill()
+
+
+class SandboxPool:
+    """
+    沙箱进程池
+
+    - 创建时即启动所有工作进程（spawn），工具模块在工作进程中只导入一次
+    - 每个任务执行前设置 CPU 时间和内存软限制，结束后解除
+    - 超出限制、崩溃或被取消（如工具超时）的工作进程会被结束并替换，不影响其他任务
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        cpu_seconds: Optional[float] = 30.0,
+        memory_mb: Optional[int] = 1024,
+        initializers: Optional[list] = None
+    ):
+        """
+        初始化进程池
+
+        Args:
+            max_workers: 工作进程数，None 表示按 CPU 核数决定
+            cpu_seconds: 每个任务的 CPU 时间上限（秒），None 表示不限制
+            memory_mb: 每个任务允许新增的内存（MB），None 表示不限制
+            initializers: 工作进程启动时调用的函数 [(模块名, 函数名, 参数元组), ...]
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_mb * 1024 * 1024 if memory_mb else None
+        self._initializers = list(initializers or [])
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = [_Worker(self._context, self._initializers) for _ in range(self.max_workers)]
+        self._lock = threading.Lock()
+        self._closed = False
+        # 每个线程同时只占用一个工作进程，线程数即并发上限
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="sandbox"
+        )
+
+    def _checkout(self) -> _Worker:
+        """取出一个空闲的工作进程"""
+        with self._lock:
+            if self._closed:
+                raise SandboxError("sandbox pool is shut down")
+            worker = self._idle.pop() if self._idle else None
+        if worker is None or not worker.process.is_alive():
+            if worker is not None:
+                worker.close()
+            worker = _Worker(self._context, self._initializers)
+        return worker
+
+    def _checkin(self, worker: _Worker, healthy: bool):
+        """归还工作进程，不可用时替换为新的进程"""
+        if not healthy:
+            worker.close()
+            worker = _Worker(self._context, self._initializers)
+        with self._lock:
+            if not self._closed:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def _call(self, call: _Call, task: tuple):
+        """在当前线程中把任务交给一个工作进程并等待结果"""
+        worker = self._checkout()
+        with call.lock:
+            if call.cancelled:
+                self._checkin(worker, True)
+                raise SandboxError("sandboxed call was cancelled")
+            call.worker = worker
+
+        healthy = False
+        try:
+            worker.conn.send(task)
+            status, value = worker.conn.recv()
+            healthy = True
+        except (EOFError, OSError):
+            worker.process.join(timeout=1)
+            if call.cancelled:
+                raise SandboxError("sandboxed call was cancelled")
+            exitcode = worker.process.exitcode
+            if hasattr(signal, "SIGXCPU") and exitcode == -signal.SIGXCPU:
+                raise SandboxError(f"exceeded the CPU time limit of {self.cpu_seconds:g}s")
+            raise SandboxError(f"sandbox worker exited unexpectedly (exit code {exitcode})")
+        finally:
+            with call.lock:
+                call.worker = None
+            self._checkin(worker, healthy)
+
+        if status == "error":
+            raise SandboxError(value)
+        return value
+
+    async def run(self, func, *args, **kwargs):
+        """
+        在工作进程中执行模块级函数
+
+        Args:
+            func: 模块级函数或 @tool 创建的工具的原始函数（按模块名和名称在工作进程中重新导入）
+            *args: 位置参数（需可序列化）
+            **kwargs: 关键字参数（需可序列化）
+
+        Returns:
+            函数返回值
+
+        Raises:
+            SandboxError: 超出资源限制、工作进程崩溃或结果无法传回
+        """
+        task = (func.__module__, func.__name__, args, kwargs, self.cpu_seconds, self.memory_bytes)
+        call = _Call()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._call, call, task)
+        except asyncio.CancelledError:
+            # 协程被取消（如工具超时）时结束工作进程，真正中止正在执行的任务
+            call.cancel()
+            raise
+
+    def shutdown(self):
+        """结束所有工作进程"""
+        with self._lock:
+            self._closed = True
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.close()
+        self._executor.shutdown(wait=False)
+
+
+# 进程内共享的沙箱进程池，未启用时为 None
+_sandbox_pool: Optional[SandboxPool] = None
+_sandbox_lock = threading.Lock()
+
+# 被改为沙箱执行的工具的原始异步实现：工具名称 -> coroutine
+_original_coroutines: dict = {}
+
+
+def configure_sandbox(config, initializers: Optional[list] = None):
+    """
+    根据配置创建或关闭沙箱进程池
+
+    Args:
+        config: SandboxConfig
+        initializers: 工作进程启动时调用的函数 [(模块名, 函数名, 参数元组), ...]
+    """
+    global _sandbox_pool
+    with _sandbox_lock:
+        old_pool, _sandbox_pool = _sandbox_pool, None
+        if config.enabled:
+            _sandbox_pool = SandboxPool(
+                max_workers=config.max_workers,
+                cpu_seconds=config.cpu_seconds,
+                memory_mb=config.memory_mb,
+                initializers=initializers
+            )
+    if old_pool is not None:
+        old_pool.shutdown()
+
+
+def get_sandbox_pool() -> Optional[SandboxPool]:
+    """获取沙箱进程池，未启用时返回 None"""
+    return _sandbox_pool
+
+
+def _sandboxed_coroutine(func, fallback):
+    """生成在沙箱中执行 func 的异步实现；沙箱未启用时使用 fallback"""
+
+    @functools.wraps(func)
+    async def coroutine(*args, **kwargs):
+        pool = get_sandbox_pool()
+        if pool is None:
+            if fallback is not None:
+                return await fallback(*args, **kwargs)
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(context.run, func, *args, **kwargs)
+            )
+        # RunnableConfig 中的回调等运行时对象无法跨进程传递
+        kwargs.pop("config", None)
+        return await pool.run(func, *args, **kwargs)
+
+    return coroutine
+
+
+def apply_sandbox(tools: list, tool_names: list):
+    """
+    让指定的工具在沙箱中执行，其余工具恢复原来的执行方式
+
+    只改变异步调用（ainvoke）；同步调用（invoke）仍在当前进程中执行。
+
+    Args:
+        tools: 工具列表
+        tool_names: 需要沙箱执行的工具名称
+    """
+    selected = set(tool_names or ())
+    for tool in tools:
+        if not isinstance(tool, BaseTool) or getattr(tool, "func", None) is None:
+            continue
+        if tool.name in selected:
+            if tool.name not in _original_coroutines:
+                _original_coroutines[tool.name] = tool.coroutine
+                tool.coroutine = _sandboxed_coroutine(tool.func, tool.coroutine)
+        elif tool.name in _original_coroutines:
+            tool.coroutine = _original_coroutines.pop(tool.name)
@@ -0,0 +1,220 @@
+"""
+搜索索引模块
+为 search_in_files 提供按工作区持久化的三元组（trigram）索引
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from utils.workspace_snapshot import workspace_stat
+
+# 索引格式版本，条目的生成规则变化时递增，旧索引会被自动弃用
+INDEX_VERSION = 3
+
+
+def extract_trigrams(text: str) -> set[str]:
+    """提取文本中所有长度为 3 的子串"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    三元组索引
+
+    每个工作区一个索引，键为相对于工作区根目录的路径，搜索子目录时共用同一个索引。
+    每个文件记录 (mtime_ns, size) 和其内容的三元组集合：
+    - 文件未变化时直接使用索引，不再打开文件
+    - 文件变化（mtime/size 不同）时由扫描该文件的调用方用已读取的内容更新条目
+    - 二进制文件和非法 UTF-8 文件记为 None，永远不是候选文件
+
+    索引只用于过滤候选文件，最终匹配仍由调用方完成，
+    因此搜索结果与不使用索引时完全一致。
+    """
+
+    def __init__(self, root: str, cache_dir: str):
+        """
+        初始化索引
+
+        Args:
+            root: 工作区根目录
+            cache_dir: 索引文件存储目录
+        """
+        self.root = os.path.realpath(root)
+        digest = hashlib.sha1(self.root.encode("utf-8")).hexdigest()[:16]
+        self.db_path = os.path.join(cache_dir, f"trigram-v{INDEX_VERSION}-{digest}.sqlite3")
+
+        # 相对路径 -> (mtime_ns, size, trigrams 或 None)
+        self._entries: dict[str, tuple[int, int, Optional[frozenset]]] = {}
+        self._dirty: set[str] = set()
+        self._removed: set[str] = set()
+        self._lock = threading.Lock()
+
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开索引数据库（不存在时创建）"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, trigrams TEXT)"
+        )
+        return conn
+
+    def _load(self):
+        """从磁盘加载索引"""
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT path, mtime_ns, size, trigrams FROM files"
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # 索引损坏时从空索引开始重建
+            rows = []
+
+        for rel_path, mtime_ns, size, packed in rows:
+            trigrams = None
+            if packed is not None:
+                # 每个三元组固定 3 个字符，按长度切分即可还原
+                trigrams = frozenset(packed[i:i + 3] for i in range(0, len(packed), 3))
+            self._entries[rel_path] = (mtime_ns, size, trigrams)
+
+    def lookup(self, file_path: Path, rel_path: str, pattern: str) -> Optional[bool]:
+        """
+        按索引判断文件是否可能包含 pattern
+
+        Args:
+            file_path: 文件路径
+            rel_path: 相对于工作区根目录的路径（索引键）
+            pattern: 搜索模式
+
+        Returns:
+            False 表示文件一定不包含 pattern；True 表示可能包含；
+            None 表示条目不存在或已过期，需要扫描文件并通过 update 更新条目
+        """
+        try:
+            stat = workspace_stat(file_path)
+        except OSError:
+            return False
+
+        entry = self._entries.get(rel_path)
+        if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+            return None
+
+        trigrams = entry[2]
+        if trigrams is None:
+            return False
+        return extract_trigrams(pattern) <= trigrams
+
+    def update(self, rel_path: str, stat: os.stat_result, text: Optional[str]):
+        """
+        用扫描时读取的内容更新条目（不再单独读取文件）
+
+        Args:
+            rel_path: 相对于工作区根目录的路径
+            stat: 读取内容时的文件状态
+            text: 解码并统一换行后的内容；二进制或非法 UTF-8 文件为 None，永远不是候选文件
+        """
+        trigrams = frozenset(extract_trigrams(text)) if text is not None else None
+        with self._lock:
+            self._entries[rel_path] = (stat.st_mtime_ns, stat.st_size, trigrams)
+            self._dirty.add(rel_path)
+            self._removed.discard(rel_path)
+
+    def prune(self, seen_paths: set[str], prefix: str = "."):
+        """
+        删除本次完整遍历中未出现的文件条目
+
+        Args:
+            seen_paths: 本次遍历到的文件（相对于工作区根目录）
+            prefix: 本次遍历的目录（相对于工作区根目录），只清理该目录下的条目
+        """
+        under = "" if prefix == "." else prefix.rstrip(os.sep) + os.sep
+        with self._lock:
+            for rel_path in list(self._entries):
+                if rel_path.startswith(under) and rel_path not in seen_paths:
+                    del self._entries[rel_path]
+                    self._dirty.discard(rel_path)
+                    self._removed.add(rel_path)
+
+    def save(self):
+        """将增量变化写回磁盘"""
+        with self._lock:
+            if not self._dirty and not self._removed:
+                return
+            rows = []
+            for rel_path in self._dirty:
+                mtime_ns, size, trigrams = self._entries[rel_path]
+                packed = "".join(sorted(trigrams)) if trigrams is not None else None
+                rows.append((rel_path, mtime_ns, size, packed))
+            removed = [(rel_path,) for rel_path in self._removed]
+            self._dirty.clear()
+            self._removed.clear()
+
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", rows
+                    )
+                    conn.executemany("DELETE FROM files WHERE path = ?", removed)
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError):
+            # 持久化失败不影响本次搜索结果
+            pass
+
+
+# 进程内的索引实例缓存：工作区根目录 -> 索引
+_indexes: dict[str, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_trigram_index(root: str, cache_dir: str) -> Optional[TrigramIndex]:
+    """
+    获取工作区的三元组索引（同一进程内复用）
+
+    Args:
+        root: 工作区根目录
+        cache_dir: 索引文件存储目录
+
+    Returns:
+        索引实例，无法创建时返回 None
+    """
+    key = os.path.realpath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            try:
+                index = TrigramIndex(key, cache_dir)
+            except OSError:
+                return None
+            _indexes[key] = index
+        return index
+
+
+def index_scope(directory: str, workspace_root: str) -> tuple[str, str]:
+    """
+    确定搜索目录使用的索引
+
+    工作区内的目录共用工作区的索引，工作区外的目录单独建立索引。
+
+    Args:
+        directory: 搜索目录
+        workspace_root: 工作区根目录
+
+    Returns:
+        (索引根目录, 搜索目录相对于索引根目录的路径)
+    """
+    directory = os.path.realpath(directory)
+    root = os.path.realpath(workspace_root)
+    if directory == root or directory.startswith(root.rstrip(os.sep) + os.sep):
+        return root, os.path.relpath(directory, root)
+    return directory, "."
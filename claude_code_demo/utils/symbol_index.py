@@ -0,0 +1,352 @@
+"""
+符号索引模块
+基于 AST 提取 Python 文件中的类、函数、方法和导入及其行范围，
+按工作区持久化到 SQLite，并按 mtime/size 增量更新
+"""
+import ast
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+from utils.workspace_snapshot import workspace_stat
+
+# 索引格式版本，符号的提取规则变化时递增，旧索引会被自动弃用
+SYMBOL_INDEX_VERSION = 1
+
+# 需要解析的文件数不少于该值时才使用进程池，否则进程启动开销大于收益
+PROCESS_POOL_THRESHOLD = 32
+
+
+class Symbol(NamedTuple):
+    """符号"""
+    name: str  # 名称，如 build_graph
+    qualname: str  # 限定名，如 ClaudeCodeGraph.build_graph；导入为被导入的完整名称
+    kind: str  # class / function / method / import
+    start_line: int  # 起始行（包含装饰器，从 1 开始）
+    end_line: int  # 结束行（包含）
+
+
+def extract_symbols(source: str) -> list[Symbol]:
+    """
+    提取源码中的符号
+
+    Args:
+        source: Python 源码
+
+    Returns:
+        符号列表（按出现顺序）
+
+    Raises:
+        SyntaxError: 源码无法解析
+    """
+    tree = ast.parse(source)
+    symbols = []
+
+    def visit(node, prefix: str, in_class: bool):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([d.lineno for d in child.decorator_list] + [child.lineno])
+                qualname = prefix + child.name
+                if isinstance(child, ast.ClassDef):
+                    kind = "class"
+                else:
+                    kind = "method" if in_class else "function"
+                symbols.append(Symbol(child.name, qualname, kind, start, child.end_lineno))
+                visit(child, qualname + ".", isinstance(child, ast.ClassDef))
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                module = ""
+                if isinstance(child, ast.ImportFrom):
+                    module = "." * child.level + (child.module or "")
+                for alias in child.names:
+                    full_name = f"{module}.{alias.name}" if module else alias.name
+                    bound_name = alias.asname or alias.name.split(".")[0]
+                    symbols.append(Symbol(bound_name, full_name, "import", child.lineno, child.end_lineno))
+            else:
+                # if/try 等语句块中的定义仍属于当前作用域
+                visit(child, prefix, in_class)
+
+    visit(tree, "", False)
+    return symbols
+
+
+def _parse_file(file_path: str) -> tuple[int, int, Optional[list]]:
+    """
+    解析单个文件（在工作进程中执行）
+
+    Returns:
+        (mtime_ns, size, 符号列表；无法读取或解析时为 None)
+    """
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+    try:
+        symbols = [tuple(s) for s in extract_symbols(data.decode('utf-8'))]
+    except (SyntaxError, ValueError, UnicodeDecodeError, RecursionError):
+        symbols = None
+    return stat.st_mtime_ns, stat.st_size, symbols
+
+
+# 进程内共享的解析进程池（使用 spawn，避免在多线程进程中 fork）
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool(max_workers: Optional[int]) -> ProcessPoolExecutor:
+    """获取解析进程池"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def _dir_prefix(directory: str) -> str:
+    """目录下条目的相对路径前缀（"." 表示工作区根目录，匹配所有条目）"""
+    return "" if directory in ("", ".") else directory.rstrip(os.sep) + os.sep
+
+
+class SymbolIndex:
+    """
+    符号索引
+
+    每个文件记录 (mtime_ns, size) 和其中的符号：
+    - 文件未变化时直接使用索引，不再解析
+    - 变化的文件较多时在进程池中并行解析（AST 解析受 GIL 限制，线程无法并行）
+    - 无法解析的文件记为 None（不包含任何符号）
+    """
+
+    def __init__(self, root: str, cache_dir: str):
+        """
+        初始化索引
+
+        Args:
+            root: 工作区根目录
+            cache_dir: 索引文件存储目录
+        """
+        self.root = os.path.realpath(root)
+        digest = hashlib.sha1(self.root.encode("utf-8")).hexdigest()[:16]
+        self.db_path = os.path.join(cache_dir, f"symbols-v{SYMBOL_INDEX_VERSION}-{digest}.sqlite3")
+
+        # 相对路径 -> (mtime_ns, size, 符号元组 或 None)
+        self._entries: dict[str, tuple[int, int, Optional[tuple]]] = {}
+        self._dirty: set[str] = set()
+        self._removed: set[str] = set()
+        self._lock = threading.Lock()
+
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开索引数据库（不存在时创建）"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, parsed INTEGER)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS symbols ("
+            "path TEXT, name TEXT, qualname TEXT, kind TEXT, start_line INTEGER, end_line INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path)")
+        return conn
+
+    def _load(self):
+        """从磁盘加载索引"""
+        try:
+            conn = self._connect()
+            try:
+                files = conn.execute("SELECT path, mtime_ns, size, parsed FROM files").fetchall()
+                rows = conn.execute(
+                    "SELECT path, name, qualname, kind, start_line, end_line FROM symbols ORDER BY rowid"
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # 索引损坏时从空索引开始重建
+            files, rows = [], []
+
+        symbols_by_path: dict[str, list] = {}
+        for path, *symbol in rows:
+            symbols_by_path.setdefault(path, []).append(Symbol(*symbol))
+        for path, mtime_ns, size, parsed in files:
+            symbols = tuple(symbols_by_path.get(path, ())) if parsed else None
+            self._entries[path] = (mtime_ns, size, symbols)
+
+    def refresh(
+        self,
+        files: list,
+        max_workers: Optional[int] = None,
+        prune: bool = False,
+        prefix: str = "."
+    ):
+        """
+        按 mtime/size 增量更新索引
+
+        Args:
+            files: [(文件路径, 相对于工作区根目录的路径), ...]
+            max_workers: 解析进程数，None 表示按 CPU 核数决定
+            prune: files 是否为 prefix 目录下完整的文件列表（是则删除该目录下其中没有的条目）
+            prefix: files 所在的目录（相对于工作区根目录）
+        """
+        stale = []
+        for file_path, rel_path in files:
+            try:
+                stat = workspace_stat(file_path)
+            except OSError:
+                continue
+            entry = self._entries.get(rel_path)
+            if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+                stale.append((str(file_path), rel_path))
+
+        results = []
+        if len(stale) >= PROCESS_POOL_THRESHOLD:
+            try:
+                pool = _get_process_pool(max_workers)
+                paths = [file_path for file_path, _ in stale]
+                parsed = pool.map(_parse_file, paths, chunksize=max(1, len(paths) // 64))
+                results = list(zip(stale, parsed))
+            except Exception:
+                # 进程池不可用（如受限环境）时退回在当前进程解析
+                results = []
+        if not results:
+            for file_path, rel_path in stale:
+                try:
+                    results.append(((file_path, rel_path), _parse_file(file_path)))
+                except OSError:
+                    continue
+
+        with self._lock:
+            for (_, rel_path), (mtime_ns, size, symbols) in results:
+                symbols = tuple(Symbol(*s) for s in symbols) if symbols is not None else None
+                self._entries[rel_path] = (mtime_ns, size, symbols)
+                self._dirty.add(rel_path)
+                self._removed.discard(rel_path)
+
+            if prune:
+                seen = {rel_path for _, rel_path in files}
+                under = _dir_prefix(prefix)
+                for rel_path in list(self._entries):
+                    if rel_path.startswith(under) and rel_path not in seen:
+                        del self._entries[rel_path]
+                        self._dirty.discard(rel_path)
+                        self._removed.add(rel_path)
+
+    def file_symbols(self) -> list[tuple[str, tuple]]:
+        """返回所有包含符号的文件 [(相对路径, 符号元组), ...]"""
+        with self._lock:
+            return [(rel_path, entry[2]) for rel_path, entry in self._entries.items() if entry[2]]
+
+    def find(
+        self,
+        name: str,
+        kind: Optional[str] = None,
+        path_prefix: str = "."
+    ) -> list[tuple[str, Symbol]]:
+        """
+        查找符号
+
+        name 不含 "." 时按名称匹配；含 "." 时按限定名匹配（完全相同或以 ".name" 结尾）。
+        没有精确匹配时退回不区分大小写的子串匹配。
+
+        Args:
+            name: 符号名称或限定名
+            kind: 只返回该类型的符号，可选
+            path_prefix: 只在该目录（相对于工作区根目录）下查找
+
+        Returns:
+            [(相对路径, 符号), ...]，定义排在导入之前
+        """
+        under = _dir_prefix(path_prefix)
+        entries = [
+            (rel_path, symbols) for rel_path, symbols in self.file_symbols()
+            if rel_path.startswith(under)
+        ]
+
+        def select(predicate):
+            return [
+                (rel_path, symbol)
+                for rel_path, symbols in entries
+                for symbol in symbols
+                if (kind is None or symbol.kind == kind) and predicate(symbol)
+            ]
+
+        if "." in name:
+            matches = select(lambda s: s.qualname == name or s.qualname.endswith("." + name))
+        else:
+            matches = select(lambda s: s.name == name)
+        if not matches:
+            lowered = name.lower()
+            matches = select(lambda s: lowered in s.qualname.lower())
+
+        matches.sort(key=lambda m: (m[1].kind == "import", m[0], m[1].start_line))
+        return matches
+
+    def save(self):
+        """将增量变化写回磁盘"""
+        with self._lock:
+            if not self._dirty and not self._removed:
+                return
+            changed = {rel_path: self._entries[rel_path] for rel_path in self._dirty}
+            removed = list(self._removed)
+            self._dirty.clear()
+            self._removed.clear()
+
+        file_rows = [
+            (rel_path, mtime_ns, size, symbols is not None)
+            for rel_path, (mtime_ns, size, symbols) in changed.items()
+        ]
+        symbol_rows = [
+            (rel_path, *symbol)
+            for rel_path, (_, _, symbols) in changed.items()
+            for symbol in symbols or ()
+        ]
+        stale_paths = [(rel_path,) for rel_path in list(changed) + removed]
+
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("DELETE FROM symbols WHERE path = ?", stale_paths)
+                    conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+                    conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", file_rows)
+                    conn.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)", symbol_rows)
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError):
+            # 持久化失败不影响本次查询结果
+            pass
+
+
+# 进程内的索引实例缓存：工作区根目录 -> 索引
+_indexes: dict[str, SymbolIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_symbol_index(root: str, cache_dir: str) -> Optional[SymbolIndex]:
+    """
+    获取工作区的符号索引（同一进程内复用）
+
+    Args:
+        root: 工作区根目录
+        cache_dir: 索引文件存储目录
+
+    Returns:
+        索引实例，无法创建时返回 None
+    """
+    key = os.path.realpath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            try:
+                index = SymbolIndex(key, cache_dir)
+            except OSError:
+                return None
+            _indexes[key] = index
+        return index
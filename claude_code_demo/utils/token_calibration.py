@@ -0,0 +1,279 @@
+"""
+Token 估算校准模块
+记录每次 LLM 调用的请求字符统计、估算值和真实 usage，
+并提供校准命令报告估算误差、拟合各类字符的字符/token 比例：
+
+    python -m utils.token_calibration [--file PATH]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from utils.token_counter import estimate_message_tokens, message_text
+from utils.tokenizer import (
+    DEFAULT_SCRIPT_RATIOS,
+    estimate_from_counts,
+    get_tokenizer,
+    script_counts
+)
+
+# 拟合时的岭回归系数，避免样本较少时比例失真
+_RIDGE = 1e-6
+
+_samples_file: Optional[str] = None
+_samples_lock = threading.Lock()
+
+# 消息 ID -> (字符统计, 估算 Token 数)，避免每次调用都重新统计历史消息
+_message_stats: dict = {}
+_MESSAGE_STATS_MAX = 10000
+
+
+def configure_usage_recording(config):
+    """
+    根据配置开启或关闭记录
+
+    Args:
+        config: TokenConfig
+    """
+    global _samples_file
+    _samples_file = config.usage_samples_file if config.record_usage_samples else None
+
+
+def _message_stats_for(msg: BaseMessage) -> tuple[dict, int]:
+    """单条消息的字符统计和估算 Token 数（按消息 ID 缓存）"""
+    key = (msg.id, get_tokenizer().name) if msg.id else None
+    stats = _message_stats.get(key) if key else None
+    if stats is None:
+        stats = (script_counts(message_text(msg)), estimate_message_tokens(msg))
+        if key:
+            if len(_message_stats) >= _MESSAGE_STATS_MAX:
+                _message_stats.clear()
+            _message_stats[key] = stats
+    return stats
+
+
+def _input_tokens(response: AIMessage) -> Optional[int]:
+    """响应中记录的真实输入 Token 数"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.get("input_tokens"):
+        return usage["input_tokens"]
+    metadata = getattr(response, "response_metadata", None) or {}
+    token_usage = metadata.get("token_usage") or metadata.get("usage") or {}
+    return token_usage.get("prompt_tokens") or token_usage.get("input_tokens")
+
+
+def record_usage_sample(input_messages: Sequence[BaseMessage], response: AIMessage):
+    """
+    记录一次调用的样本（未开启记录或响应中没有 usage 时忽略）
+
+    Args:
+        input_messages: 发送给 LLM 的消息列表
+        response: LLM 的响应
+    """
+    path = _samples_file
+    actual = _input_tokens(response)
+    if path is None or not actual:
+        return
+
+    counts: dict = {}
+    estimate = 0
+    for msg in input_messages:
+        msg_counts, msg_tokens = _message_stats_for(msg)
+        estimate += msg_tokens
+        for script, chars in msg_counts.items():
+            counts[script] = counts.get(script, 0) + chars
+
+    sample = {
+        "timestamp": time.time(),
+        "model": (response.response_metadata or {}).get("model_name"),
+        "tokenizer": get_tokenizer().name,
+        "messages": len(input_messages),
+        "scripts": counts,
+        "estimate": estimate,
+        "input_tokens": actual,
+    }
+    try:
+        with _samples_lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+    except OSError:
+        # 记录失败不影响正常调用
+        pass
+
+
+def load_samples(path: str) -> list[dict]:
+    """读取记录的样本（跳过损坏的行）"""
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                sample = json.loads(line)
+            except ValueError:
+                continue
+            if sample.get("input_tokens"):
+                samples.append(sample)
+    return samples
+
+
+def _error_stats(pairs: list[tuple[float, float]]) -> dict:
+    """(估算值, 真实值) 列表的误差统计"""
+    errors = [estimate - actual for estimate, actual in pairs]
+    return {
+        "mae": sum(abs(e) for e in errors) / len(errors),
+        "mape": sum(abs(e) / actual for e, (_, actual) in zip(errors, pairs)) / len(errors) * 100,
+        "bias": sum(e / actual for e, (_, actual) in zip(errors, pairs)) / len(errors) * 100,
+    }
+
+
+def _solve(matrix: list[list[float]], vector: list[float]) -> list[float]:
+    """高斯消元求解线性方程组（矩阵为对称正定的正规方程）"""
+    n = len(vector)
+    a = [row[:] + [vector[i]] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        if abs(a[col][col]) < 1e-12:
+            continue
+        for row in range(n):
+            if row != col:
+                factor = a[row][col] / a[col][col]
+                for k in range(col, n + 1):
+                    a[row][k] -= factor * a[col][k]
+    return [a[i][n] / a[i][i] if abs(a[i][i]) >= 1e-12 else 0.0 for i in range(n)]
+
+
+def fit_script_ratios(samples: list[dict]) -> tuple[dict, float, float]:
+    """
+    按最小二乘拟合各类字符的字符/token 比例
+
+    模型：input_tokens ≈ Σ 字符数 / 比例 + 每条消息的开销 × 消息数 + 固定开销（工具定义等）
+
+    Args:
+        samples: 样本列表
+
+    Returns:
+        (各类字符的比例, 每条消息的开销, 固定开销)；样本中没有出现的类别不包含在比例中
+    """
+    scripts = sorted({script for sample in samples for script in sample["scripts"]})
+    rows = []
+    for sample in samples:
+        row = [float(sample["scripts"].get(script, 0)) for script in scripts]
+        rows.append(row + [float(sample["messages"]), 1.0])
+    targets = [float(sample["input_tokens"]) for sample in samples]
+
+    size = len(scripts) + 2
+    normal = [[sum(r[i] * r[j] for r in rows) for j in range(size)] for i in range(size)]
+    for i in range(size):
+        normal[i][i] += _RIDGE * (normal[i][i] or 1.0)
+    rhs = [sum(r[i] * t for r, t in zip(rows, targets)) for i in range(size)]
+    weights = _solve(normal, rhs)
+
+    ratios = {
+        script: round(1.0 / weight, 2)
+        for script, weight in zip(scripts, weights)
+        if weight > 1e-6
+    }
+    return ratios, weights[-2], weights[-1]
+
+
+def calibrate(samples: list[dict], ratios: Optional[dict] = None) -> dict:
+    """
+    计算估算误差并拟合比例
+
+    Args:
+        samples: 样本列表
+        ratios: 当前使用的字符/token 比例，None 表示默认比例
+
+    Returns:
+        校准报告
+    """
+    ratios = {**DEFAULT_SCRIPT_RATIOS, **(ratios or {})}
+    recorded = {}
+    for sample in samples:
+        recorded.setdefault(sample.get("tokenizer", "estimate"), []).append(
+            (sample["estimate"], sample["input_tokens"])
+        )
+    current = [
+        (estimate_from_counts(sample["scripts"], ratios), sample["input_tokens"])
+        for sample in samples
+    ]
+    fitted_ratios, per_message, fixed = fit_script_ratios(samples)
+    fitted = {**ratios, **fitted_ratios}
+    refit = [
+        (estimate_from_counts(sample["scripts"], fitted) + per_message * sample["messages"] + fixed,
+         sample["input_tokens"])
+        for sample in samples
+    ]
+    return {
+        "samples": len(samples),
+        "recorded": {name: _error_stats(pairs) for name, pairs in recorded.items()},
+        "current_ratios": _error_stats(current),
+        "fitted_ratios": fitted_ratios,
+        "fitted": _error_stats(refit),
+        "per_message_overhead": per_message,
+        "fixed_overhead": fixed,
+    }
+
+
+def format_report(report: dict, path: str) -> str:
+    """格式化校准报告"""
+    lines = [
+        f"Token estimator calibration ({report['samples']} samples from {path})",
+        "",
+        f"{'estimator':<32}{'MAE':>10}{'MAPE':>10}{'bias':>10}",
+    ]
+
+    def row(name, stats):
+        lines.append(f"{name:<32}{stats['mae']:>10.0f}{stats['mape']:>9.1f}%{stats['bias']:>+9.1f}%")
+
+    for name, stats in sorted(report["recorded"].items()):
+        row(f"recorded ({name})", stats)
+    row("script ratios (current)", report["current_ratios"])
+    row("script ratios (fitted)", report["fitted"])
+    lines += [
+        "",
+        "bias > 0 means the estimate is too high (compression fires early);",
+        "bias < 0 means it is too low (requests may overflow before compression).",
+        "",
+        "Fitted chars-per-token ratios: "
+        + ", ".join(f"{k}={v}" for k, v in sorted(report["fitted_ratios"].items())),
+        f"Per-message overhead: {report['per_message_overhead']:.1f} tokens, "
+        f"fixed overhead (system prompt / tool schemas not in messages): {report['fixed_overhead']:.0f} tokens",
+        "",
+        f"To use them: TokenConfig(script_ratios={report['fitted_ratios']!r})",
+    ]
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list] = None):
+    """校准命令入口"""
+    from config import TokenConfig
+
+    defaults = TokenConfig()
+    parser = argparse.ArgumentParser(
+        description="Report token estimator error against recorded usage_metadata"
+    )
+    parser.add_argument("--file", default=defaults.usage_samples_file, help="usage samples (JSONL)")
+    args = parser.parse_args(argv)
+
+    try:
+        samples = load_samples(args.file)
+    except OSError as e:
+        print(f"Cannot read usage samples: {e}")
+        return 1
+    if not samples:
+        print(f"No usage samples in {args.file}; run the agent with TokenConfig.record_usage_samples=True first")
+        return 1
+
+    print(format_report(calibrate(samples, defaults.script_ratios), args.file))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,11 +2,57 @@
 Token 计数工具
 实现 Claude Code 的 Token 监控机制
 """
-from typing import Sequence
-from langchain_core.messages import BaseMessage, AIMessage
+import json
+from typing import Optional, Sequence
+from langchain_core.messages import BaseMessage, AIMessage, SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
 
+from utils.tokenizer import count_tokens
 
-def get_latest_token_usage(messages: Sequence[BaseMessage]) -> int:
+# 每条消息在请求中的格式开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 每个请求的固定开销（回复起始标记等）
+REQUEST_OVERHEAD_TOKENS = 3
+
+
+def get_usage_tokens(msg: BaseMessage) -> Optional[int]:
+    """
+    读取 AI 消息中记录的 Token 使用量
+
+    Args:
+        msg: 消息
+
+    Returns:
+        总 Token 数（包括缓存），没有 usage 信息时返回 None
+    """
+    if not isinstance(msg, AIMessage):
+        return None
+
+    # 检查 response_metadata 中的 usage
+    if hasattr(msg, 'response_metadata') and msg.response_metadata:
+        usage = msg.response_metadata.get('usage')
+        if usage:
+            # 计算总 token（包括缓存）
+            return (
+                usage.get('total_tokens', 0) +
+                usage.get('cache_creation_tokens', 0) +
+                usage.get('cache_read_tokens', 0)
+            )
+
+    # 检查 usage_metadata
+    if hasattr(msg, 'usage_metadata') and msg.usage_metadata:
+        return (
+            msg.usage_metadata.get('total_tokens', 0) +
+            msg.usage_metadata.get('cache_creation_tokens', 0) +
+            msg.usage_metadata.get('cache_read_tokens', 0)
+        )
+    return None
+
+
+def get_latest_token_usage(
+    messages: Sequence[BaseMessage],
+    estimated_tokens: Optional[int] = None
+) -> int:
     """
     获取最新的 Token 使用量（倒序查找优化）
 
@@ -15,46 +61,44 @@ def get_latest_token_usage(messages: Sequence[BaseMessage]) -> int:
 
     Args:
         messages: 消息列表
+        estimated_tokens: 已知的估算值（如状态中 Token 账本的总数），
+            没有 usage 信息时直接使用，避免重新扫描所有消息
 
     Returns:
         总 Token 数
     """
     # 倒序扫描，找到最新的 usage 信息
     for i in range(len(messages) - 1, -1, -1):
-        msg = messages[i]
-
-        # 检查是否是 AI 消息且包含 usage 信息
-        if isinstance(msg, AIMessage):
-            # 检查 response_metadata 中的 usage
-            if hasattr(msg, 'response_metadata') and msg.response_metadata:
-                usage = msg.response_metadata.get('usage')
-                if usage:
-                    # 计算总 token（包括缓存）
-                    total = (
-                        usage.get('total_tokens', 0) +
-                        usage.get('cache_creation_tokens', 0) +
-                        usage.get('cache_read_tokens', 0)
-                    )
-                    return total
-
-            # 检查 usage_metadata
-            if hasattr(msg, 'usage_metadata') and msg.usage_metadata:
-                total = (
-                    msg.usage_metadata.get('total_tokens', 0) +
-                    msg.usage_metadata.get('cache_creation_tokens', 0) +
-                    msg.usage_metadata.get('cache_read_tokens', 0)
-                )
-                return total
+        total = get_usage_tokens(messages[i])
+        if total is not None:
+            return total
 
     # 如果没有找到 usage 信息，使用估算
+    if estimated_tokens is not None:
+        return estimated_tokens
     return estimate_tokens(messages)
 
 
+def message_text(msg: BaseMessage) -> str:
+    """消息的文本内容（多段内容按顺序拼接）"""
+    if isinstance(msg.content, str):
+        return msg.content
+    parts = []
+    if isinstance(msg.content, list):
+        for item in msg.content:
+            if isinstance(item, dict) and 'text' in item:
+                parts.append(item['text'])
+            elif isinstance(item, str):
+                parts.append(item)
+    return "".join(parts)
+
+
 def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
     """
     估算消息的 Token 数
 
-    简单估算：英文约 4 字符 = 1 token，中文约 1.5 字符 = 1 token
+    使用 utils.tokenizer 中配置的分词器：默认按字符类别分别估算
+    （英文约 4 字符 = 1 token，中文约 1 字 = 1 token），配置本地 BPE 词表时精确计数
 
     Args:
         messages: 消息列表
@@ -62,18 +106,143 @@ def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
     Returns:
         估算的 Token 数
     """
-    total_chars = 0
+    return sum(estimate_message_tokens(msg) for msg in messages)
+
+
+def estimate_message_tokens(msg: BaseMessage) -> int:
+    """
+    估算单条消息在请求中占用的 Token 数（与 estimate_tokens 使用相同的分词器）
+
+    除文本内容外还包括 AI 消息中工具调用的名称和参数（如 write_file 的整个文件内容）
+    以及每条消息的格式开销。
+
+    Args:
+        msg: 消息
+
+    Returns:
+        估算的 Token 数
+    """
+    tokens = count_tokens(message_text(msg)) + MESSAGE_OVERHEAD_TOKENS
+    if isinstance(msg, AIMessage):
+        for call in msg.tool_calls:
+            tokens += count_tokens(call["name"]) + count_tokens(
+                json.dumps(call["args"], ensure_ascii=False)
+            )
+        for call in msg.invalid_tool_calls:
+            tokens += count_tokens(call.get("name") or "") + count_tokens(call.get("args") or "")
+    return tokens
+
+
+def estimate_tool_tokens(tools: Sequence) -> int:
+    """
+    估算绑定到 LLM 的工具定义（JSON Schema）的 Token 数
+
+    Args:
+        tools: 工具列表
+
+    Returns:
+        估算的 Token 数
+    """
+    total = 0
+    for tool in tools or ():
+        try:
+            schema = convert_to_openai_tool(tool)
+        except Exception:
+            continue
+        total += count_tokens(json.dumps(schema, ensure_ascii=False))
+    return total
 
-    for msg in messages:
-        if isinstance(msg.content, str):
-            total_chars += len(msg.content)
-        elif isinstance(msg.content, list):
-            for item in msg.content:
-                if isinstance(item, dict) and 'text' in item:
-                    total_chars += len(item['text'])
 
-    # 保守估算：平均 3 字符 = 1 token
-    return total_chars // 3
+def get_usage_anchor(messages: Sequence[BaseMessage]) -> tuple[int, Optional[int]]:
+    """
+    查找最近一条带 usage 信息的 AI 消息
+
+    Args:
+        messages: 消息列表
+
+    Returns:
+        (下标, 总 Token 数)；没有时返回 (-1, None)
+    """
+    for i in range(len(messages) - 1, -1, -1):
+        total = get_usage_tokens(messages[i])
+        if total is not None:
+            return i, total
+    return -1, None
+
+
+def estimate_request_tokens(
+    messages: Sequence[BaseMessage],
+    system_prompt_tokens: int = 0,
+    tool_tokens: int = 0,
+    message_tokens: Optional[int] = None
+) -> int:
+    """
+    估算下一次请求的完整大小
+
+    以最近一次带 usage 的 AI 响应为锚点：其 total_tokens 已包含当时的完整请求
+    （系统提示词、工具定义、历史消息）和该次输出，只需再加上之后新增的消息；
+    没有 usage 时估算所有消息，加上系统提示词和工具定义。
+
+    Args:
+        messages: 消息列表
+        system_prompt_tokens: 系统提示词的 Token 数（消息中已有 SystemMessage 时不重复计算）
+        tool_tokens: 工具定义的 Token 数
+        message_tokens: 所有消息的 Token 数（如 Token 账本的总数），None 时逐条估算
+
+    Returns:
+        估算的 Token 数
+    """
+    index, anchor = get_usage_anchor(messages)
+    if anchor is not None:
+        return anchor + sum(estimate_message_tokens(msg) for msg in messages[index + 1:])
+
+    if message_tokens is None:
+        message_tokens = estimate_tokens(messages)
+    if any(isinstance(msg, SystemMessage) for msg in messages[:1]):
+        system_prompt_tokens = 0
+    return message_tokens + system_prompt_tokens + tool_tokens + REQUEST_OVERHEAD_TOKENS
+
+
+class RequestSizer:
+    """
+    请求大小估算器
+
+    缓存工具定义和系统提示词的 Token 数，供压缩判断和 Token 监控在不知道完整请求时使用
+    """
+
+    def __init__(self, tools: Optional[Sequence] = None, system_prompt: str = ""):
+        """
+        初始化估算器
+
+        Args:
+            tools: 绑定到 LLM 的工具列表
+            system_prompt: 系统提示词
+        """
+        self.tool_tokens = estimate_tool_tokens(tools)
+        self._system_prompt = None
+        self.system_prompt_tokens = 0
+        self.set_system_prompt(system_prompt)
+
+    def set_system_prompt(self, system_prompt: str):
+        """更新系统提示词（Agent 每次调用前设置，提示词未变化时不重新计数）"""
+        if system_prompt != self._system_prompt:
+            self._system_prompt = system_prompt
+            self.system_prompt_tokens = count_tokens(system_prompt or "")
+
+    def estimate(self, messages: Sequence[BaseMessage], message_tokens: Optional[int] = None) -> int:
+        """
+        估算请求大小
+
+        Args:
+            messages: 消息列表
+            message_tokens: 所有消息的 Token 数（如 Token 账本的总数），None 时逐条估算
+
+        Returns:
+            估算的 Token 数
+        """
+        return estimate_request_tokens(
+            messages, self.system_prompt_tokens, self.tool_tokens, message_tokens
+        )
 
 
 def needs_compression(
@@ -139,21 +308,28 @@ def calculate_compression_stats(
 class TokenMonitor:
     """Token 监控器"""
 
-    def __init__(self, max_tokens: int = 100000, threshold: float = 0.92):
+    def __init__(
+        self,
+        max_tokens: int = 100000,
+        threshold: float = 0.92,
+        sizer: Optional[RequestSizer] = None
+    ):
         """
         初始化 Token 监控器
 
         Args:
             max_tokens: 最大 Token 数
             threshold: 压缩阈值
+            sizer: 请求大小估算器（包含工具定义和系统提示词），None 表示只估算消息
         """
         self.max_tokens = max_tokens
         self.threshold = threshold
         self.reserved_output = 4096
+        self.sizer = sizer or RequestSizer()
 
     def get_current_usage(self, messages: Sequence[BaseMessage]) -> dict:
-        """获取当前使用情况"""
-        current = get_latest_token_usage(messages)
+        """获取当前使用情况（按下一次请求的估算大小）"""
+        current = self.sizer.estimate(messages)
         available = self.max_tokens - self.reserved_output
         percentage = (current / available) * 100
 
@@ -172,7 +348,7 @@ class TokenMonitor:
 
     def should_compress(self, messages: Sequence[BaseMessage]) -> bool:
         """判断是否应该压缩"""
-        current = get_latest_token_usage(messages)
+        current = self.sizer.estimate(messages)
         return needs_compression(
             current,
             self.max_tokens,
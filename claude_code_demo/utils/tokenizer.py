@@ -0,0 +1,255 @@
+"""
+分词器模块
+为 Token 估算提供可插拔的分词后端：
+- ScriptRatioTokenizer: 默认的快速估算，按字符类别（拉丁字母、数字、CJK、标点等）分别使用字符/token 比例
+- BPETokenizer: 读取本地 BPE 词表文件精确计数（运行时不下载任何文件），同一字符串的计数会被缓存
+"""
+import base64
+import math
+import re
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # 未安装时使用纯 Python 的 BPE 合并
+    tiktoken = None
+
+
+# 各类字符平均每个 token 对应的字符数（可通过校准命令根据真实 usage 重新拟合）
+DEFAULT_SCRIPT_RATIOS = {
+    "latin": 4.0,  # 英文单词
+    "digit": 3.0,  # 数字
+    "cjk": 1.0,  # 中日韩文字，约 1 字 1 token
+    "space": 8.0,  # 空白（单个空格通常并入下一个词）
+    "punct": 1.5,  # ASCII 标点和符号
+    "other": 1.5,  # 其他文字（西里尔字母、emoji 等）
+}
+
+# CJK 字符范围：假名、CJK 统一表意文字（含扩展 A）、谚文、兼容表意文字、全角字符和中文标点
+_CJK = r"\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef"
+_PUNCT = r"!-/:-@\[-`{-~"
+
+# 一次扫描把文本切分为同类字符的连续片段
+_SCRIPT_RUNS = re.compile(
+    r"(?P<latin>[A-Za-z]+)"
+    r"|(?P<digit>[0-9]+)"
+    rf"|(?P<cjk>[{_CJK}]+)"
+    r"|(?P<space>\s+)"
+    rf"|(?P<punct>[{_PUNCT}]+)"
+    rf"|(?P<other>[^A-Za-z0-9\s{_PUNCT}{_CJK}]+)"
+)
+
+# cl100k 风格的预切分规则（tiktoken 可用时使用原始规则，否则使用 re 可表达的近似规则）
+CL100K_PATTERN = (
+    r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+)
+_FALLBACK_PATTERN = re.compile(
+    r"""'(?:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+""",
+    re.IGNORECASE
+)
+
+
+def script_counts(text: str) -> dict:
+    """
+    统计文本中各类字符的字符数
+
+    正则按同类字符的连续片段匹配，一次扫描完成分类，逐字符的工作都在 C 层完成。
+
+    Args:
+        text: 文本
+
+    Returns:
+        {类别: 字符数, ...}
+    """
+    counts = {}
+    for match in _SCRIPT_RUNS.finditer(text):
+        script = match.lastgroup
+        counts[script] = counts.get(script, 0) + match.end() - match.start()
+    return counts
+
+
+def estimate_from_counts(counts: dict, ratios: Optional[dict] = None) -> int:
+    """
+    根据字符统计估算 Token 数
+
+    Args:
+        counts: script_counts() 的结果
+        ratios: 各类字符每 token 的字符数，None 表示使用默认比例
+
+    Returns:
+        估算的 Token 数
+    """
+    ratios = ratios or DEFAULT_SCRIPT_RATIOS
+    total = sum(
+        chars / ratios.get(script, DEFAULT_SCRIPT_RATIOS[script])
+        for script, chars in counts.items()
+    )
+    return math.ceil(total)
+
+
+class Tokenizer(ABC):
+    """分词器接口"""
+
+    name = "base"
+
+    @abstractmethod
+    def count_tokens(self, text: str) -> int:
+        """
+        计算文本的 Token 数
+
+        Args:
+            text: 文本
+
+        Returns:
+            Token 数
+        """
+
+
+class ScriptRatioTokenizer(Tokenizer):
+    """按字符类别估算的快速分词器（不需要词表）"""
+
+    name = "estimate"
+
+    def __init__(self, ratios: Optional[dict] = None):
+        """
+        初始化估算器
+
+        Args:
+            ratios: 各类字符每 token 的字符数，未指定的类别使用默认比例
+        """
+        self.ratios = {**DEFAULT_SCRIPT_RATIOS, **(ratios or {})}
+
+    def count_tokens(self, text: str) -> int:
+        if not text:
+            return 0
+        return estimate_from_counts(script_counts(text), self.ratios)
+
+
+def load_bpe_ranks(path: str) -> dict:
+    """
+    读取 tiktoken 格式的本地 BPE 词表（每行为 "base64 编码的 token 序号"）
+
+    Args:
+        path: 词表文件路径
+
+    Returns:
+        {token 字节串: 序号}
+    """
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+class BPETokenizer(Tokenizer):
+    """
+    基于本地 BPE 词表的分词器
+
+    - 安装了 tiktoken 时用其构建编码器，否则使用纯 Python 的按序号合并
+    - 同一字符串（如消息内容）的计数会被缓存
+    """
+
+    name = "bpe"
+
+    def __init__(self, path: str, cache_size: int = 4096):
+        """
+        初始化分词器
+
+        Args:
+            path: tiktoken 格式的词表文件（如 cl100k_base.tiktoken）
+            cache_size: 按字符串缓存计数的条目数
+        """
+        self.path = path
+        self._ranks = load_bpe_ranks(path)
+        self._encoding = None
+        if tiktoken is not None:
+            self._encoding = tiktoken.Encoding(
+                name=f"local:{path}",
+                pat_str=CL100K_PATTERN,
+                mergeable_ranks=self._ranks,
+                special_tokens={}
+            )
+        self._cached_count = lru_cache(maxsize=cache_size)(self._count_tokens)
+        self._piece_count = lru_cache(maxsize=cache_size * 4)(self._bpe_piece_count)
+
+    def count_tokens(self, text: str) -> int:
+        return self._cached_count(text)
+
+    def _count_tokens(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode_ordinary(text))
+        return sum(
+            self._piece_count(piece.encode("utf-8"))
+            for piece in _FALLBACK_PATTERN.findall(text)
+        )
+
+    def _bpe_piece_count(self, piece: bytes) -> int:
+        """对预切分后的片段按序号反复合并相邻字节对，返回最终的 token 数"""
+        if piece in self._ranks:
+            return 1
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best_rank, best_index = None, -1
+            for i in range(len(parts) - 1):
+                rank = self._ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_index = rank, i
+            if best_rank is None:
+                break
+            parts[best_index:best_index + 2] = [parts[best_index] + parts[best_index + 1]]
+        return len(parts)
+
+
+# 进程内共享的分词器
+_tokenizer: Tokenizer = ScriptRatioTokenizer()
+_tokenizer_lock = threading.Lock()
+
+
+def configure_tokenizer(config):
+    """
+    根据配置设置分词器
+
+    BPE 词表无法读取时退回估算器，并打印提示。
+
+    Args:
+        config: TokenConfig
+    """
+    global _tokenizer
+    tokenizer = ScriptRatioTokenizer(config.script_ratios)
+    if config.tokenizer == "bpe":
+        if not config.bpe_file:
+            print("⚠️ TokenConfig.tokenizer is 'bpe' but bpe_file is not set; using the estimator")
+        else:
+            try:
+                tokenizer = BPETokenizer(config.bpe_file)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Failed to load BPE vocabulary {config.bpe_file}: {e}; using the estimator")
+    with _tokenizer_lock:
+        _tokenizer = tokenizer
+
+
+def get_tokenizer() -> Tokenizer:
+    """获取当前分词器"""
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """
+    用当前分词器计算文本的 Token 数
+
+    Args:
+        text: 文本
+
+    Returns:
+        Token 数
+    """
+    return _tokenizer.count_tokens(text)
@@ -0,0 +1,480 @@
+"""
+工作区快照模块
+在内存中维护工作区的路径、大小和修改时间，由 Linux inotify 事件增量更新（不可用时定期轮询），
+文件缓存、索引和目录遍历可以直接查询快照而不必逐个 stat
+"""
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import os
+import re
+import select
+import struct
+import threading
+from typing import NamedTuple, Optional
+
+
+class SnapshotStat(NamedTuple):
+    """快照中的条目信息（字段名与 os.stat_result 一致，跟随符号链接）"""
+    st_mtime_ns: int
+    st_size: int
+    is_dir: bool
+    is_file: bool
+    is_symlink: bool
+
+
+class SnapshotEntry:
+    """目录中的条目，接口与 os.DirEntry 的常用部分一致"""
+
+    __slots__ = ("name", "path", "_stat")
+
+    def __init__(self, name: str, path: str, stat: SnapshotStat):
+        self.name = name
+        self.path = path
+        self._stat = stat
+
+    def is_dir(self) -> bool:
+        return self._stat.is_dir
+
+    def is_file(self) -> bool:
+        return self._stat.is_file
+
+    def is_symlink(self) -> bool:
+        return self._stat.is_symlink
+
+    def stat(self) -> SnapshotStat:
+        return self._stat
+
+
+def _stat_path(path: str) -> Optional[SnapshotStat]:
+    """stat 单个路径（跟随符号链接，失效的链接按 lstat 记录），不存在时返回 None"""
+    try:
+        is_symlink = os.path.islink(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            if not is_symlink:
+                return None
+            st = os.lstat(path)
+            return SnapshotStat(st.st_mtime_ns, st.st_size, False, False, True)
+    except OSError:
+        return None
+    is_dir = (st.st_mode & 0o170000) == 0o040000
+    is_file = (st.st_mode & 0o170000) == 0o100000
+    return SnapshotStat(st.st_mtime_ns, st.st_size, is_dir, is_file, is_symlink)
+
+
+# inotify 常量（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """通过 ctypes 调用 libc 的最小 inotify 封装"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read_events(self, timeout: float) -> list:
+        """等待并读取事件，返回 [(wd, mask, name), ...]"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b"\0"))
+            offset += name_len
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WorkspaceSnapshot:
+    """
+    工作区快照
+
+    - 启动时完整扫描一次，之后由 inotify 事件增量更新；inotify 不可用
+      （非 Linux、达到 watch 数上限等）时改为每隔 poll_interval 秒重新扫描
+    - 按名称忽略的目录（如 .git、node_modules）只记录自身，不进入扫描
+    - 外部修改在事件处理后（inotify）或下一次轮询后可见；本进程的写入通过
+      refresh 同步更新
+    - 不跟随符号链接目录
+    """
+
+    def __init__(self, root, ignore_patterns: Optional[list] = None, poll_interval: float = 2.0):
+        """
+        初始化快照（不会开始监听，需调用 start）
+
+        Args:
+            root: 工作区根目录
+            ignore_patterns: 不进入扫描的目录名模式
+            poll_interval: 轮询模式下的扫描间隔（秒）
+        """
+        self.root = os.path.realpath(root)
+        self.poll_interval = poll_interval
+        self._ignore_regex = (
+            re.compile("|".join(fnmatch.translate(p) for p in ignore_patterns))
+            if ignore_patterns else None
+        )
+
+        # 路径 -> 条目信息；已扫描目录 -> 子条目名称集合
+        self._entries: dict[str, SnapshotStat] = {}
+        self._children: dict[str, set] = {}
+        self._lock = threading.RLock()
+
+        self._inotify: Optional[_Inotify] = None
+        self._watches: dict[int, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+        self.mode = "stopped"  # inotify / polling / stopped
+        self.version = 0  # 每次检测到变化时递增
+
+    # ---- 查询 ----
+
+    def _key(self, file_path) -> Optional[str]:
+        """将路径转换为快照中的键，不在工作区内时返回 None"""
+        path = os.path.abspath(os.fspath(file_path))
+        if path == self.root or path.startswith(self.root + os.sep):
+            return path
+        return None
+
+    def stat(self, file_path) -> Optional[SnapshotStat]:
+        """
+        查询路径的大小和修改时间
+
+        Returns:
+            条目信息；不在快照中（工作区外、被忽略的目录内或尚未同步）时返回 None
+        """
+        key = self._key(file_path)
+        if key is None:
+            return None
+        return self._entries.get(key)
+
+    def list_dir(self, dir_path) -> Optional[list]:
+        """
+        列出目录中的条目（按名称排序）
+
+        Returns:
+            SnapshotEntry 列表；目录未被扫描时返回 None
+        """
+        key = self._key(dir_path)
+        if key is None:
+            return None
+        with self._lock:
+            names = self._children.get(key)
+            if names is None:
+                return None
+            entries = []
+            for name in sorted(names):
+                path = os.path.join(key, name)
+                stat = self._entries.get(path)
+                if stat is not None:
+                    entries.append(SnapshotEntry(name, path, stat))
+        return entries
+
+    # ---- 更新 ----
+
+    def _should_descend(self, name: str, stat: SnapshotStat) -> bool:
+        if not stat.is_dir or stat.is_symlink:
+            return False
+        return self._ignore_regex is None or not self._ignore_regex.match(name)
+
+    def _scan_tree(self, dir_path: str, entries: dict, children: dict, new_dirs: list):
+        """扫描目录树（不持锁），结果写入 entries/children"""
+        stack = [dir_path]
+        while stack:
+            current = stack.pop()
+            names = set()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        stat = _stat_path(entry.path)
+                        if stat is None:
+                            continue
+                        names.add(entry.name)
+                        entries[entry.path] = stat
+                        if self._should_descend(entry.name, stat):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+            children[current] = names
+            new_dirs.append(current)
+
+    def _remove_locked(self, path: str):
+        """删除条目及其子树（调用方需持有锁）"""
+        self._entries.pop(path, None)
+        for name in self._children.pop(path, ()):
+            self._remove_locked(os.path.join(path, name))
+
+    def rescan(self):
+        """完整重新扫描工作区"""
+        entries, children, new_dirs = {}, {}, []
+        root_stat = _stat_path(self.root)
+        if root_stat is not None:
+            entries[self.root] = root_stat
+            self._scan_tree(self.root, entries, children, new_dirs)
+
+        with self._lock:
+            if entries != self._entries or children != self._children:
+                self._entries = entries
+                self._children = children
+                self.version += 1
+        self._watch_dirs(new_dirs)
+
+    def refresh(self, file_path, rescan_dir: bool = False):
+        """
+        按文件系统的当前状态更新单个路径（写入类工具修改文件后调用）
+
+        Args:
+            file_path: 路径
+            rescan_dir: 路径是目录时是否重新扫描其子树
+        """
+        key = self._key(file_path)
+        if key is None or key == self.root:
+            return
+        parent, name = os.path.split(key)
+        with self._lock:
+            if parent not in self._children:
+                # 父目录不在快照中（被忽略或在被忽略的目录内）
+                return
+
+        stat = _stat_path(key)
+        subtree_entries, subtree_children, new_dirs = {}, {}, []
+        if stat is not None and self._should_descend(name, stat):
+            with self._lock:
+                known = key in self._children
+            if rescan_dir or not known:
+                self._scan_tree(key, subtree_entries, subtree_children, new_dirs)
+
+        with self._lock:
+            if parent not in self._children:
+                return
+            old = self._entries.get(key)
+            if stat is None:
+                if old is None:
+                    return
+                self._remove_locked(key)
+                self._children[parent].discard(name)
+            else:
+                if new_dirs or (old is not None and old.is_dir and not stat.is_dir):
+                    self._remove_locked(key)
+                elif old == stat:
+                    return
+                self._entries[key] = stat
+                self._entries.update(subtree_entries)
+                self._children.update(subtree_children)
+                self._children[parent].add(name)
+            self.version += 1
+        self._watch_dirs(new_dirs)
+
+    # ---- 监听 ----
+
+    def start(self):
+        """完整扫描并开始监听变化（优先 inotify，不可用时轮询）"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        try:
+            self._inotify = _Inotify()
+            self.mode = "inotify"
+        except (OSError, AttributeError):
+            self._inotify = None
+            self.mode = "polling"
+
+        self.rescan()
+
+        target = self._run_inotify if self._inotify is not None else self._run_polling
+        self._thread = threading.Thread(target=target, name="workspace-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监听"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._watches.clear()
+        self.mode = "stopped"
+
+    def _watch_dirs(self, dirs: list):
+        """为新扫描到的目录添加 inotify watch；达到上限时改为轮询"""
+        inotify = self._inotify
+        if inotify is None or not dirs:
+            return
+        try:
+            for dir_path in dirs:
+                try:
+                    wd = inotify.add_watch(dir_path)
+                except OSError as e:
+                    if e.errno in (errno.ENOSPC, errno.ENOMEM):
+                        raise
+                    continue  # 目录已被删除或无权限
+                with self._lock:
+                    self._watches[wd] = dir_path
+        except OSError:
+            # watch 数达到上限：监听线程会在下一次循环时切换到轮询
+            self.mode = "polling"
+
+    def _run_inotify(self):
+        """inotify 事件循环"""
+        while not self._stop_event.is_set():
+            if self.mode != "inotify":
+                self._inotify.close()
+                self._inotify = None
+                with self._lock:
+                    self._watches.clear()
+                self._run_polling()
+                return
+
+            try:
+                events = self._inotify.read_events(timeout=0.5)
+            except OSError:
+                self.mode = "polling"
+                continue
+
+            # 合并同一批事件中对同一路径的多次修改
+            changed = {}
+            overflow = False
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                with self._lock:
+                    dir_path = self._watches.get(wd)
+                    if mask & IN_IGNORED:
+                        self._watches.pop(wd, None)
+                if dir_path is None or not name:
+                    continue
+                path = os.path.join(dir_path, name)
+                rescan_dir = bool(mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO))
+                changed[path] = changed.get(path, False) or rescan_dir
+
+            if overflow:
+                self.rescan()
+                continue
+            for path, rescan_dir in changed.items():
+                self.refresh(path, rescan_dir)
+
+    def _run_polling(self):
+        """轮询循环"""
+        while not self._stop_event.wait(self.poll_interval):
+            self.rescan()
+
+
+# 进程内共享的工作区快照（未启用时为 None）
+_workspace_snapshot: Optional[WorkspaceSnapshot] = None
+_workspace_snapshot_lock = threading.Lock()
+
+
+def start_workspace_snapshot(
+    root,
+    ignore_patterns: Optional[list] = None,
+    poll_interval: float = 2.0
+) -> WorkspaceSnapshot:
+    """
+    启动进程内共享的工作区快照（根目录相同时复用已有快照）
+
+    Args:
+        root: 工作区根目录
+        ignore_patterns: 不进入扫描的目录名模式
+        poll_interval: 轮询模式下的扫描间隔（秒）
+
+    Returns:
+        工作区快照
+    """
+    global _workspace_snapshot
+    with _workspace_snapshot_lock:
+        current = _workspace_snapshot
+        if current is not None and current.root == os.path.realpath(root):
+            return current
+        snapshot = WorkspaceSnapshot(root, ignore_patterns, poll_interval)
+        snapshot.start()
+        _workspace_snapshot = snapshot
+    if current is not None:
+        current.stop()
+    return snapshot
+
+
+def stop_workspace_snapshot():
+    """停止并移除进程内共享的工作区快照"""
+    global _workspace_snapshot
+    with _workspace_snapshot_lock:
+        snapshot, _workspace_snapshot = _workspace_snapshot, None
+    if snapshot is not None:
+        snapshot.stop()
+
+
+def get_workspace_snapshot() -> Optional[WorkspaceSnapshot]:
+    """获取进程内共享的工作区快照，未启用时返回 None"""
+    return _workspace_snapshot
+
+
+def workspace_stat(file_path):
+    """
+    获取文件的 mtime/size：优先查询工作区快照，快照中没有时调用 os.stat
+
+    Returns:
+        SnapshotStat 或 os.stat_result（都有 st_mtime_ns、st_size 属性）
+
+    Raises:
+        OSError: 快照中没有且文件无法 stat
+    """
+    snapshot = _workspace_snapshot
+    if snapshot is not None:
+        stat = snapshot.stat(file_path)
+        if stat is not None:
+            return stat
+    return os.stat(file_path)
+
+
+def refresh_workspace_path(file_path):
+    """写入/删除文件后同步更新工作区快照（未启用快照时不做任何事）"""
+    snapshot = _workspace_snapshot
+    if snapshot is not None:
+        snapshot.refresh(file_path)
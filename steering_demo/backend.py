@@ -20,6 +20,9 @@ from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, AIMessage
 
+# calculate 的表达式在受限的工作进程中求值
+from calculator import get_calculator_pool
+
 # LLM - 根据你的环境选择
 
 from langchain_community.chat_models import ChatTongyi
@@ -46,7 +49,7 @@ def calculate(expression: str) -> str:
         for i in range(20):
             print(f"🧮 计算: {expression} {i}")
             time.sleep(0.5)
-        result = eval(expression)
+        result = get_calculator_pool().evaluate(expression)
         return f"{expression} = {result}"
     except Exception as e:
         return f"计算错误: {str(e)}"
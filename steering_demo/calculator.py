@@ -0,0 +1,214 @@
+"""
+计算器模块
+calculate 工具的表达式来自模型输入，在预先启动的工作进程中求值，每次求值都受 CPU 时间和内存 rlimit 约束。
+
+工作进程以 `python -I calculator.py` 启动，只导入本模块（没有导入时的副作用），
+不会像 multiprocessing 的 spawn 那样重新导入 backend.py 及其中的 LLM 和 FastAPI 初始化。
+"""
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import threading
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows 没有 rlimit，只提供进程隔离
+    resource = None
+
+
+# 表达式中可以使用的名称，不提供 __import__、open 等内置函数
+_ALLOWED_NAMES = {
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "pow": pow,
+    "sum": sum,
+    "math": math,
+}
+
+
+class CalculatorError(Exception):
+    """求值失败（表达式错误、超出资源限制或工作进程异常退出）"""
+    pass
+
+
+class _CpuLimitExceeded(BaseException):
+    """工作进程内收到 SIGXCPU 时抛出"""
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise _CpuLimitExceeded()
+
+
+def evaluate_expression(expression: str) -> str:
+    """
+    计算数学表达式
+
+    Args:
+        expression: 表达式（如 "2 ** 10 + math.sqrt(2)"）
+
+    Returns:
+        计算结果的字符串形式
+    """
+    return str(eval(expression, {"__builtins__": {}}, dict(_ALLOWED_NAMES)))
+
+
+def _address_space_bytes() -> int:
+    """当前进程的虚拟地址空间大小"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _apply_limits(cpu_seconds: float, memory_mb: int) -> list:
+    """
+    为当前求值设置 rlimit（CPU 时间按进程累计，软限制为已用时间加上本次的配额；内存同理）
+
+    Returns:
+        被修改的限制及其原值 [(限制, (软限制, 硬限制)), ...]
+    """
+    previous = []
+    if resource is None:
+        return previous
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        previous.append((resource.RLIMIT_CPU, resource.getrlimit(resource.RLIMIT_CPU)))
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        soft = _address_space_bytes() + memory_mb * 1024 * 1024
+    except OSError:
+        return previous
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        previous.append((resource.RLIMIT_AS, resource.getrlimit(resource.RLIMIT_AS)))
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+    return previous
+
+
+def _worker_main(cpu_seconds: float, memory_mb: int):
+    """工作进程主循环：每行读入一个 JSON 字符串表达式，输出一行 [状态, 结果]"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+
+    for line in sys.stdin:
+        previous = []
+        try:
+            previous = _apply_limits(cpu_seconds, memory_mb)
+            reply = ["ok", evaluate_expression(json.loads(line))]
+        except _CpuLimitExceeded:
+            reply = ["error", f"exceeded the CPU time limit of {cpu_seconds:g}s"]
+        except MemoryError:
+            reply = ["error", f"exceeded the memory limit of {memory_mb} MB"]
+        except Exception as e:
+            reply = ["error", f"{type(e).__name__}: {e}"]
+        finally:
+            for limit, value in previous:
+                resource.setrlimit(limit, value)
+        sys.stdout.write(json.dumps(reply) + "\n")
+        sys.stdout.flush()
+
+
+class CalculatorPool:
+    """
+    计算工作进程池
+
+    - 工作进程在第一次使用时启动，之后复用
+    - 超出限制或崩溃的工作进程会被结束并替换
+    """
+
+    def __init__(self, max_workers: int = 2, cpu_seconds: float = 5.0, memory_mb: int = 256):
+        """
+        初始化进程池
+
+        Args:
+            max_workers: 最多同时运行的工作进程数
+            cpu_seconds: 每次求值的 CPU 时间上限（秒）
+            memory_mb: 每次求值允许新增的内存（MB）
+        """
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._idle: list[subprocess.Popen] = []
+        self._lock = threading.Lock()
+
+    def _spawn(self) -> subprocess.Popen:
+        """启动一个工作进程（-I：不读取 PYTHON* 环境变量和用户 site-packages，不把脚本目录加入 sys.path）"""
+        return subprocess.Popen(
+            [sys.executable, "-I", os.path.abspath(__file__), str(self.cpu_seconds), str(self.memory_mb)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8"
+        )
+
+    def evaluate(self, expression: str) -> str:
+        """
+        在工作进程中计算表达式（阻塞当前线程直到返回）
+
+        Args:
+            expression: 表达式
+
+        Returns:
+            计算结果的字符串形式
+
+        Raises:
+            CalculatorError: 表达式错误、超出资源限制或工作进程异常退出
+        """
+        with self._slots:
+            with self._lock:
+                worker = self._idle.pop() if self._idle else None
+            if worker is None or worker.poll() is not None:
+                worker = self._spawn()
+
+            healthy = False
+            try:
+                worker.stdin.write(json.dumps(expression) + "\n")
+                worker.stdin.flush()
+                line = worker.stdout.readline()
+                if line:
+                    status, value = json.loads(line)
+                    healthy = True
+            except (OSError, ValueError):
+                line = None
+            finally:
+                if healthy:
+                    with self._lock:
+                        self._idle.append(worker)
+                else:
+                    worker.kill()
+                    worker.wait()
+
+        if not healthy:
+            if hasattr(signal, "SIGXCPU") and worker.returncode == -signal.SIGXCPU:
+                raise CalculatorError(f"exceeded the CPU time limit of {self.cpu_seconds:g}s")
+            raise CalculatorError(f"calculator worker exited unexpectedly (exit code {worker.returncode})")
+        if status == "error":
+            raise CalculatorError(value)
+        return value
+
+
+# 进程内共享的计算进程池，第一次使用时创建
+_pool: Optional[CalculatorPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_calculator_pool() -> CalculatorPool:
+    """获取（必要时创建）计算进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CalculatorPool()
+        return _pool
+
+
+if __name__ == "__main__":
+    _worker_main(float(sys.argv[1]), int(sys.argv[2]))